@@ -10,6 +10,11 @@ from datetime import datetime as dt
 import aiohttp
 import websockets
 
+from .callbacks import as_dispatcher
+from .frames import daily_frame, tpseries_frame
+from .metrics import ClientMetrics
+from .session import is_session_error
+
 logger = logging.getLogger(__name__)
 
 
@@ -103,7 +108,12 @@ class NorenApi:
         'websocket_endpoint': 'wss://wsendpoint/',
         # 'eoddata_endpoint' : 'http://eodhost/'
     }
-    def __init__(self, host, websocket):
+    # requests with side effects, never sent again after a session expiry
+    __no_replay_routes = ('authorize', 'logout', 'forgot_password', 'change_password', 'watchlist_add',
+                          'watchlist_delete', 'placeorder', 'modifyorder', 'cancelorder', 'exitorder',
+                          'product_conversion')
+
+    def __init__(self, host, websocket, rate_limiter=None, tracer=None, metrics=None, session=None):
         self.__password = None
         self.__accountid = None
         self.__username = None
@@ -117,10 +127,43 @@ class NorenApi:
         self.__service_config["websocket_endpoint"] = websocket
 
         self.__subscribers = {}
+        self.__feed_listeners = []
+        self.__order_listeners = []
         self.__market_status_messages = []
         self.__exchange_messages = []
 
-        self.__session = aiohttp.ClientSession()
+        # optional RateLimiter shared by every request sent from this instance
+        self.__rate_limiter = rate_limiter
+        # optional RiskManager checking orders before they are sent
+        self.__risk_manager = None
+        # optional OrderLatencyTracker timing orders from submission to fill
+        self.__order_tracker = None
+
+        # optional function returning the login arguments, enables the re-login on session expiry
+        self.__credentials_provider = None
+        # optional SessionStore sharing the renewed token with the other workers
+        self.__session_store = None
+        self.__relogin_lock = asyncio.Lock()
+        self.__session_ready = asyncio.Event()
+        self.__session_ready.set()
+        self.__session_stats = {'relogins': 0, 'failures': 0, 'replayed': 0, 'stall_last': 0.0,
+                                'stall_max': 0.0, 'stall_total': 0.0}
+
+        # optional RequestTracer, the session is only instrumented when one is given
+        self.__tracer = tracer
+        self.__route_names = {path: name for name, path in self.__service_config['routes'].items()}
+
+        # optional MetricsRegistry, nothing is recorded without one
+        self.__metrics = ClientMetrics(metrics) if metrics is not None else None
+        # counters and gauges are labelled with the account once it is known
+        self.__gauges = self.__register_gauges(metrics) if metrics is not None else None
+
+        # optional aiohttp session shared by several instances (one connection pool for many accounts),
+        # only the session created here is closed by this instance and instrumented by the tracer
+        self.__own_session = session is None
+        if session is None:
+            session = aiohttp.ClientSession(trace_configs=[tracer.trace_config] if tracer is not None else None)
+        self.__session = session
         self.__loop = asyncio.get_event_loop()
 
         # make susertoken accessible outside the class
@@ -128,6 +171,8 @@ class NorenApi:
 
     def __del__(self):
         # Close HTTP connection when this object is destroyed
+        if not self.__own_session or self.__session.closed:
+            return
         try:
             loop = asyncio.get_event_loop()
             if loop.is_running():
@@ -141,6 +186,14 @@ class NorenApi:
         if self.__websocket_connected:
             self.__websocket_connected = False
 
+    async def close(self):
+        '''
+        stops the websocket and closes the pooled HTTP connections, unless the session is shared
+        '''
+        self.close_websocket()
+        if self.__own_session:
+            await self.__session.close()
+
     async def start_websocket(
             self,
             subscribe_callback=None,
@@ -149,9 +202,13 @@ class NorenApi:
             socket_close_callback=None,
             socket_error_callback=None,
     ):
-        self.__order_update_callback = order_update_callback
-        self.__subscribe_callback = subscribe_callback
-        self.__on_open = socket_open_callback
+        '''
+        callbacks can be sync or async functions, or CallbackDispatcher instances choosing
+        how they are executed (inline, async, thread or process)
+        '''
+        self.__order_update_callback = as_dispatcher(order_update_callback)
+        self.__subscribe_callback = as_dispatcher(subscribe_callback)
+        self.__on_open = as_dispatcher(socket_open_callback)
 
         if self.__websocket_connected:
             return
@@ -163,30 +220,37 @@ class NorenApi:
         self.__ws = await websockets.connect(url, ping_interval=3)
         self.__websocket_connected = True
         logger.info("Websocket connected!")
+        if self.__metrics is not None:
+            self.__metrics.connects.inc()
 
         # Call on open callback
         await self.__on_open_callback()
 
         try:
             while self.__websocket_connected:
-                await asyncio.sleep(0.05)
                 message = await self.__ws.recv()
                 res = json.loads(message)
 
-                if self.__subscribe_callback is not None:
-                    if res["t"] in ["tk", "tf"]:
-                        await self.__subscribe_callback(res)
-                        continue
-                    if res["t"] in ["dk", "df"]:
+                if res["t"] in ["tk", "tf", "dk", "df"]:
+                    if self.__metrics is not None:
+                        self.__metrics.ticks.inc()
+                    self.__notify(self.__feed_listeners, res)
+
+                    if self.__subscribe_callback is not None:
                         await self.__subscribe_callback(res)
-                        continue
+                    continue
 
                 if res["t"] == "ck" and res["s"] != "OK":
                     logger.error(res)
                     continue
 
-                if (self.__order_update_callback is not None) and res["t"] == "om":
-                    await self.__order_update_callback(res)
+                if res["t"] == "om":
+                    if self.__metrics is not None:
+                        self.__metrics.order_updates.inc()
+                    self.__notify(self.__order_listeners, res)
+
+                    if self.__order_update_callback is not None:
+                        await self.__order_update_callback(res)
                     continue
 
                 if self.__on_open and res["t"] == "ck" and res["s"] == "OK":
@@ -198,6 +262,90 @@ class NorenApi:
             await self.__ws.close()
             self.__websocket_connected = False
 
+    @staticmethod
+    def __notify(listeners, message):
+        for listener in listeners:
+            try:
+                listener(message)
+            except Exception as e:
+                logger.exception(e)
+
+    def get_callback_stats(self):
+        '''
+        backlog and latency of the websocket callbacks
+        '''
+        callbacks = {'subscribe': self.__subscribe_callback, 'order_update': self.__order_update_callback,
+                     'open': self.__on_open}
+        return {name: callback.stats() for name, callback in callbacks.items() if callback is not None}
+
+    def add_feed_listener(self, listener):
+        '''
+        registers a function called with every tk/tf/dk/df message, before the subscribe callback.
+        listeners run on the websocket task and must not block.
+        '''
+        self.__feed_listeners.append(listener)
+
+    def remove_feed_listener(self, listener):
+        if listener in self.__feed_listeners:
+            self.__feed_listeners.remove(listener)
+
+    def add_order_listener(self, listener):
+        '''
+        registers a function called with every om message, before the order update callback.
+        listeners run on the websocket task and must not block.
+        '''
+        self.__order_listeners.append(listener)
+
+    def remove_order_listener(self, listener):
+        if listener in self.__order_listeners:
+            self.__order_listeners.remove(listener)
+
+    async def subscribe(self, instrument, feed_type=FeedType.TOUCHLINE):
+        values = {}
+
+        if feed_type == FeedType.TOUCHLINE:
+            values['t'] = 't'
+        elif feed_type == FeedType.SNAPQUOTE:
+            values['t'] = 'd'
+        else:
+            values['t'] = str(feed_type)
+
+        instruments = instrument if type(instrument) == list else [instrument]
+        values['k'] = '#'.join(instruments)
+
+        for key in instruments:
+            self.__subscribers[key] = values['t']
+
+        data = json.dumps(values)
+        reportmsg(data)
+        await self.__ws.send(data)
+
+    async def unsubscribe(self, instrument, feed_type=FeedType.TOUCHLINE):
+        values = {}
+
+        if feed_type == FeedType.TOUCHLINE:
+            values['t'] = 'u'
+        elif feed_type == FeedType.SNAPQUOTE:
+            values['t'] = 'ud'
+        else:
+            values['t'] = 'u' + str(feed_type)
+
+        instruments = instrument if type(instrument) == list else [instrument]
+        values['k'] = '#'.join(instruments)
+
+        for key in instruments:
+            self.__subscribers.pop(key, None)
+
+        data = json.dumps(values)
+        reportmsg(data)
+        await self.__ws.send(data)
+
+    def get_subscriptions(self):
+        '''
+        returns a dict of the subscribed instruments and their feed type
+        '''
+        return dict(self.__subscribers)
+
     async def __on_open_callback(self):
         # prepare the data
         values = {
@@ -212,17 +360,164 @@ class NorenApi:
         await self.__ws.send(payload)
 
     async def send_payload(self, url, values, is_authorized=True, headers=None):
+        if not is_authorized:
+            return await self.__post(url, values, None, headers)
+
+        # requests wait while a re-login is in progress
+        await self.__session_ready.wait()
+        susertoken = self.susertoken
+        res = await self.__post(url, values, susertoken, headers)
+
+        if self.__credentials_provider is None or not is_session_error(res):
+            return res
+
+        if not await self.__relogin(susertoken):
+            return res
+
+        if self.__route_name(url) in NorenApi.__no_replay_routes:
+            return res
+
+        self.__session_stats['replayed'] += 1
+        return await self.__post(url, values, self.susertoken, headers)
+
+    def __route_name(self, url):
+        path = '/' + url.rsplit('/', 1)[-1]
+        return self.__route_names.get(path, path)
+
+    async def __post(self, url, values, susertoken, headers):
         payload = f'jData={json.dumps(values)}'
-        if is_authorized:
-            payload += f'&jKey={self.susertoken}'
+        if susertoken is not None:
+            payload += f'&jKey={susertoken}'
 
         reportmsg(payload)
 
+        if self.__rate_limiter is not None:
+            await self.__rate_limiter.acquire()
+
+        if self.__metrics is None:
+            return await self.__send(url, payload, headers)
+
+        start = time.perf_counter()
+        route = self.__route_name(url)
+        try:
+            res = await self.__send(url, payload, headers)
+        except Exception:
+            self.__metrics.request(route, time.perf_counter() - start, False)
+            raise
+
+        ok = not isinstance(res, dict) or res.get('stat') != 'Not_Ok'
+        self.__metrics.request(route, time.perf_counter() - start, ok)
+        return res
+
+    async def __send(self, url, payload, headers):
+        if self.__tracer is not None:
+            return await self.__traced_post(url, payload, headers)
+
         async with self.__session.post(url, data=payload, headers=headers) as response:
             response_text = await response.text()
             reportmsg(response_text)
             return json.loads(response_text)
 
+    async def __traced_post(self, url, payload, headers):
+        tracer = self.__tracer
+        trace = tracer.begin(self.__route_name(url))
+        try:
+            async with self.__session.post(url, data=payload, headers=headers, trace_request_ctx=trace) as response:
+                response_text = await response.text()
+                tracer.body_read(trace)
+                reportmsg(response_text)
+                res = json.loads(response_text)
+        except Exception:
+            tracer.error(trace)
+            raise
+
+        tracer.end(trace)
+        return res
+
+    def __register_gauges(self, registry):
+        # one set of gauges per registry, every instance sharing it reports under its own account
+        return (registry.gauge('session_relogins', 're-logins after a session expiry', ('account',)),
+                registry.gauge('session_stall_seconds', 'total time requests waited for a re-login', ('account',)),
+                registry.gauge('callback_backlog', 'websocket messages waiting for a callback',
+                               ('account', 'callback')))
+
+    def __bind_metrics(self, userid):
+        if self.__metrics is None:
+            return
+        self.__metrics.bind(userid)
+        relogins, stall, backlog = self.__gauges
+        relogins.labels(userid).set_function(lambda: self.__session_stats['relogins'])
+        stall.labels(userid).set_function(lambda: self.__session_stats['stall_total'])
+        for name in ('subscribe', 'order_update'):
+            backlog.labels(userid, name).set_function(
+                lambda name=name: self.get_callback_stats().get(name, {}).get('backlog'))
+
+    def get_request_stats(self, route=None):
+        '''
+        per route timing breakdown of the requests, None when no tracer is set
+        '''
+        return self.__tracer.stats(route) if self.__tracer is not None else None
+
+    def set_credentials_provider(self, provider, store=None):
+        '''
+        provider returns (or awaits to) the keyword arguments of login, with a fresh twoFA.
+        once set, a session expiry pauses the requests, logs in once and replays the
+        failed requests without side effects. with a SessionStore the token renewed by
+        another worker is reused and the new token is saved.
+        '''
+        self.__credentials_provider = provider
+        self.__session_store = store
+
+    def get_session_stats(self):
+        '''
+        re-login counters and the time requests were stalled, in seconds
+        '''
+        return dict(self.__session_stats)
+
+    async def __relogin(self, expired_token):
+        async with self.__relogin_lock:
+            # another request already renewed the session
+            if self.susertoken != expired_token:
+                return self.susertoken is not None
+
+            logger.warning('session expired, logging in again')
+            self.__session_ready.clear()
+            start = time.monotonic()
+            try:
+                if self.__session_store is not None:
+                    ret = await self.__session_store.renew(self.__username, expired_token, self.__login_again)
+                    if isinstance(ret, dict) and ret.get('restored'):
+                        self.set_session(self.__username, self.__password, ret['susertoken'])
+                else:
+                    ret = await self.__login_again()
+                ok = isinstance(ret, dict) and ret.get('stat') == 'Ok'
+                if not ok:
+                    logger.error(f're-login failed: {ret}')
+                    self.__session_stats['failures'] += 1
+                    return False
+
+                self.__session_stats['relogins'] += 1
+                if self.__websocket_connected:
+                    # authenticate the websocket with the new token
+                    await self.__on_open_callback()
+                return True
+            except Exception as e:
+                logger.exception(e)
+                self.__session_stats['failures'] += 1
+                return False
+            finally:
+                stall = time.monotonic() - start
+                self.__session_stats['stall_last'] = stall
+                self.__session_stats['stall_max'] = max(self.__session_stats['stall_max'], stall)
+                self.__session_stats['stall_total'] += stall
+                self.__session_ready.set()
+
+    async def __login_again(self):
+        credentials = self.__credentials_provider()
+        if asyncio.iscoroutine(credentials):
+            credentials = await credentials
+        return await self.login(**credentials)
+
     async def login(self, userid, password, twoFA, vendor_code, api_secret, imei):
         config = NorenApi.__service_config
 
@@ -245,9 +540,11 @@ class NorenApi:
             "appkey": app_key,
             "imei": imei,
         }
+        # the login request is already counted under the account
+        self.__bind_metrics(userid)
         res_dict = await self.send_payload(url, values, is_authorized=False)
 
-        if res_dict:
+        if res_dict and res_dict.get('stat') == 'Ok':
             self.__username = userid
             self.__accountid = userid
             self.__password = password
@@ -255,12 +552,25 @@ class NorenApi:
 
         return res_dict
 
+    def set_risk_manager(self, risk_manager):
+        '''
+        installs the pre-trade checks run by place_order and modify_order, None removes them
+        '''
+        self.__risk_manager = risk_manager
+
+    def set_order_tracker(self, tracker):
+        '''
+        installs the latency tracker notified by place_order, None removes it
+        '''
+        self.__order_tracker = tracker
+
     def set_session(self, userid, password, usertoken):
 
         self.__username = userid
         self.__accountid = userid
         self.__password = password
         self.susertoken = usertoken
+        self.__bind_metrics(userid)
 
         reportmsg(f'{userid} session set to : {self.susertoken}')
 
@@ -358,6 +668,18 @@ class NorenApi:
                           trail_price=0.0):
         config = NorenApi.__service_config
 
+        tracker = self.__order_tracker
+        if tracker is not None:
+            timeline = tracker.on_submit(exchange, product_type, price_type, tradingsymbol)
+
+        risk_manager = self.__risk_manager
+        if risk_manager is not None:
+            reason = risk_manager.check_order(buy_or_sell, product_type, exchange, tradingsymbol, quantity,
+                                              price_type, price, trigger_price)
+            if reason is not None:
+                reporterror(f'order rejected by risk checks: {reason}')
+                return {'stat': 'Not_Ok', 'emsg': f'Risk Check : {reason}'}
+
         # prepare the uri
         url = f"{config['host']}{config['routes']['placeorder']}"
         reportmsg(url)
@@ -382,13 +704,30 @@ class NorenApi:
             if trail_price != 0.0:
                 values["trailprc"] = str(trail_price)
 
-        return await self.send_payload(url, values)
+        res = await self.send_payload(url, values)
+
+        if tracker is not None:
+            tracker.on_ack(timeline, res)
+
+        if risk_manager is not None:
+            risk_manager.on_order_placed(res, buy_or_sell, product_type, exchange, tradingsymbol, quantity,
+                                         price_type, price, trigger_price)
+
+        return res
 
     async def modify_order(self, orderno, exchange, tradingsymbol, newquantity,
                            newprice_type, newprice=0.0, newtrigger_price=None, bookloss_price=0.0, bookprofit_price=0.0,
                            trail_price=0.0):
         config = NorenApi.__service_config
 
+        risk_manager = self.__risk_manager
+        if risk_manager is not None:
+            reason = risk_manager.check_modify(orderno, exchange, tradingsymbol, newquantity, newprice_type,
+                                               newprice, newtrigger_price)
+            if reason is not None:
+                reporterror(f'modification rejected by risk checks: {reason}')
+                return {'stat': 'Not_Ok', 'emsg': f'Risk Check : {reason}'}
+
         # prepare the uri
         url = f"{config['host']}{config['routes']['modifyorder']}"
         # print(url)
@@ -415,7 +754,13 @@ class NorenApi:
         if bookprofit_price != 0.0:
             values["bpprc"] = str(bookprofit_price)
 
-        return await self.send_payload(url, values)
+        res = await self.send_payload(url, values)
+
+        if risk_manager is not None:
+            risk_manager.on_order_placed(res, None, None, exchange, tradingsymbol, newquantity, newprice_type,
+                                         newprice, newtrigger_price, orderno=orderno)
+
+        return res
 
     async def cancel_order(self, orderno):
         config = NorenApi.__service_config
@@ -556,10 +901,11 @@ class NorenApi:
 
         return await self.send_payload(url, values)
 
-    async def get_time_price_series(self, exchange, token, starttime=None, endtime=None, interval=None):
+    async def get_time_price_series(self, exchange, token, starttime=None, endtime=None, interval=None, frame=False):
         """
         gets the chart data
         interval possible values 1, 3, 5 , 10, 15, 30, 60, 120, 240
+        frame=True returns a DataFrame indexed by time instead of the raw list
         """
         config = NorenApi.__service_config
 
@@ -586,9 +932,18 @@ class NorenApi:
         if interval is not None:
             values["intrv"] = str(interval)
 
-        return await self.send_payload(url, values)
+        res = await self.send_payload(url, values)
+
+        if frame and isinstance(res, list):
+            return tpseries_frame(res)
 
-    async def get_daily_price_series(self, exchange, tradingsymbol, startdate=None, enddate=None):
+        return res
+
+    async def get_daily_price_series(self, exchange, tradingsymbol, startdate=None, enddate=None, frame=False):
+        """
+        gets the daily chart data
+        frame=True returns a DataFrame indexed by date instead of the raw list
+        """
         config = NorenApi.__service_config
 
         # prepare the uri
@@ -608,7 +963,12 @@ class NorenApi:
                   "to": str(enddate)}
 
         headers = {"Content-Type": "application/json; charset=utf-8"}
-        return await self.send_payload(url, values, headers=headers)
+        res = await self.send_payload(url, values, headers=headers)
+
+        if frame and isinstance(res, list):
+            return daily_frame(res)
+
+        return res
 
     async def get_holdings(self, product_type=None):
         config = NorenApi.__service_config
@@ -661,8 +1021,9 @@ class NorenApi:
         url = f"{config['host']}{config['routes']['span_calculator']}"
         reportmsg(url)
 
-        senddata = {'actid': self.__accountid, 'pos': positions}
-        values = json.dumps(senddata, default=lambda o: o.encode())
+        # send_payload serializes the request, positions only need to be plain dicts
+        values = {'actid': self.__accountid,
+                  'pos': [p.encode() if isinstance(p, position) else p for p in positions]}
 
         return await self.send_payload(url, values)
 
@@ -0,0 +1,244 @@
+import asyncio
+import collections
+import logging
+import time
+
+from .frames import tpseries_arrays
+
+logger = logging.getLogger(__name__)
+
+# exchange timestamps are Indian Standard Time
+IST_OFFSET = 19800
+
+# TPSeries candles are aligned to the market open
+SESSION_START = 9 * 3600 + 15 * 60
+
+
+def bar_start(timestamp, interval, session_start=SESSION_START):
+    '''
+    returns the start of the bar of `interval` seconds containing timestamp,
+    bars being aligned to session_start (seconds after midnight IST)
+    '''
+    day_start = timestamp - (timestamp + IST_OFFSET) % 86400
+    anchor = day_start + session_start
+    return anchor + ((timestamp - anchor) // interval) * interval
+
+
+class Bar:
+    __slots__ = ('time', 'open', 'high', 'low', 'close', 'volume', 'base_volume')
+
+    def __init__(self, time, price, base_volume):
+        self.time = time
+        self.open = price
+        self.high = price
+        self.low = price
+        self.close = price
+        self.volume = 0
+        # cumulative day volume before this bar started
+        self.base_volume = base_volume
+
+    def __repr__(self):
+        return (f'Bar(time={self.time}, open={self.open}, high={self.high}, low={self.low}, '
+                f'close={self.close}, volume={self.volume})')
+
+
+class _Series:
+    __slots__ = ('interval', 'bars', 'current')
+
+    def __init__(self, interval, history):
+        self.interval = interval
+        # ring buffer of closed bars
+        self.bars = collections.deque(maxlen=history)
+        self.current = None
+
+
+class _TokenState:
+    __slots__ = ('price', 'volume', 'series')
+
+    def __init__(self):
+        self.price = None
+        self.volume = None
+        self.series = {}
+
+
+class BarBuilder:
+    '''
+    Builds OHLCV bars from the websocket tk/tf stream, aligned with the TPSeries
+    candles of the same interval.
+
+    Every tick updates the open bar of each interval in O(1). Bar volume is derived
+    from the cumulative day volume field `v`. Closed bars are kept in a ring buffer
+    per token and interval and reported to on_bar_close(key, interval, bar).
+    '''
+    def __init__(self, intervals=(1,), history=1000, on_bar_close=None, session_start=SESSION_START):
+        # intervals in minutes, as in the TPSeries intrv field
+        self.intervals = tuple(int(interval) for interval in intervals)
+        self.history = history
+        self.session_start = session_start
+        self.__on_bar_close = on_bar_close
+        self.__tokens = {}
+
+    def __state(self, key):
+        state = self.__tokens.get(key)
+        if state is None:
+            state = _TokenState()
+            for interval in self.intervals:
+                state.series[interval] = _Series(interval * 60, self.history)
+            self.__tokens[key] = state
+        return state
+
+    def attach(self, api):
+        api.add_feed_listener(self.on_tick)
+
+    def detach(self, api):
+        api.remove_feed_listener(self.on_tick)
+
+    def seed(self, key, interval, rows, now=None):
+        '''
+        loads the history of one token from a TPSeries response of the same interval.
+        a candle covering `now` is kept open and continued by the live ticks.
+        '''
+        columns = tpseries_arrays(rows)
+        state = self.__state(key)
+        series = state.series[int(interval)]
+        if now is None:
+            now = time.time()
+
+        series.bars.clear()
+        series.current = None
+
+        for i in range(len(columns['time'])):
+            bar = Bar(int(columns['time'][i]), float(columns['into'][i]), 0)
+            bar.high = float(columns['inth'][i])
+            bar.low = float(columns['intl'][i])
+            bar.close = float(columns['intc'][i])
+            # indices and some candles come without volumes (nan)
+            volume = columns['intv'][i]
+            bar.volume = int(volume) if volume == volume else 0
+            cumulative = columns['v'][i]
+            bar.base_volume = int(cumulative) - bar.volume if cumulative == cumulative else None
+            series.bars.append(bar)
+
+        if series.bars and series.bars[-1].time + series.interval > now:
+            series.current = series.bars.pop()
+
+        if len(columns['time']):
+            state.price = float(columns['intc'][-1])
+            cumulative = columns['v'][-1]
+            state.volume = int(cumulative) if cumulative == cumulative else None
+
+    async def seed_from_api(self, api, exchange, token, starttime=None):
+        '''
+        seeds every interval of one token with a TPSeries call each
+        '''
+        key = f'{exchange}|{token}'
+        for interval in self.intervals:
+            ret = await api.get_time_price_series(exchange=exchange, token=token, starttime=starttime,
+                                                  interval=interval)
+            if isinstance(ret, list):
+                self.seed(key, interval, ret)
+            else:
+                logger.error(f'TPSeries failed for {key} interval {interval}: {ret}')
+
+    def on_tick(self, message):
+        price = message.get('lp')
+        volume = message.get('v')
+        if price is None and volume is None:
+            # depth only update
+            return
+
+        key = f"{message['e']}|{message['tk']}"
+        state = self.__state(key)
+
+        if price is not None:
+            price = float(price)
+            state.price = price
+        elif state.price is None:
+            return
+        else:
+            price = state.price
+
+        last_volume = state.volume
+        if volume is not None:
+            volume = int(volume)
+            state.volume = volume
+        else:
+            volume = last_volume if last_volume is not None else 0
+
+        # the cumulative volume restarts every day
+        if last_volume is None or volume < last_volume:
+            last_volume = volume if last_volume is None else 0
+
+        timestamp = int(message['ft']) if 'ft' in message else int(time.time())
+
+        for series in state.series.values():
+            self.__update(key, series, timestamp, price, volume, last_volume)
+
+    def __update(self, key, series, timestamp, price, volume, last_volume):
+        start = bar_start(timestamp, series.interval, self.session_start)
+        bar = series.current
+
+        if bar is not None and start <= bar.time:
+            if price > bar.high:
+                bar.high = price
+            if price < bar.low:
+                bar.low = price
+            bar.close = price
+            if bar.base_volume is None:
+                # seeded without the day volume, the first live tick gives it
+                bar.base_volume = volume - bar.volume
+            bar.volume = volume - bar.base_volume
+            return
+
+        if bar is not None:
+            self.__close(key, series)
+
+        # late tick for a bar that was already closed by flush
+        if series.bars and start <= series.bars[-1].time:
+            return
+
+        bar = Bar(start, price, last_volume)
+        bar.volume = volume - last_volume
+        series.current = bar
+
+    def __close(self, key, series):
+        bar = series.current
+        series.current = None
+        series.bars.append(bar)
+
+        if self.__on_bar_close is not None:
+            try:
+                self.__on_bar_close(key, series.interval // 60, bar)
+            except Exception as e:
+                logger.exception(e)
+
+    def flush(self, now=None):
+        '''
+        closes the open bars whose interval has ended, for tokens that stopped ticking
+        '''
+        if now is None:
+            now = time.time()
+
+        for key, state in self.__tokens.items():
+            for series in state.series.values():
+                if series.current is not None and series.current.time + series.interval <= now:
+                    self.__close(key, series)
+
+    async def run(self, period=1.0):
+        '''
+        flushes the open bars every `period` seconds, run as a task next to the websocket
+        '''
+        while True:
+            await asyncio.sleep(period)
+            self.flush()
+
+    def current(self, key, interval):
+        state = self.__tokens.get(key)
+        return state.series[int(interval)].current if state is not None else None
+
+    def bars(self, key, interval):
+        '''
+        returns the closed bars of one token, oldest first
+        '''
+        state = self.__tokens.get(key)
+        return list(state.series[int(interval)].bars) if state is not None else []
@@ -0,0 +1,178 @@
+import asyncio
+import collections
+import concurrent.futures
+import inspect
+import logging
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+MODES = ('inline', 'async', 'thread', 'process')
+
+
+def message_key(message=None, *args):
+    '''
+    ordering key of a websocket message: 'EXCH|token' for the feed, 'EXCH|tsym' for order updates
+    '''
+    if not isinstance(message, dict):
+        return None
+    if 'tk' in message:
+        return f"{message.get('e')}|{message['tk']}"
+    if 'tsym' in message:
+        return f"{message.get('exch')}|{message['tsym']}"
+    return message.get('norenordno')
+
+
+def _call(callback, args):
+    # runs in the worker threads and processes
+    if inspect.iscoroutinefunction(callback):
+        return asyncio.run(callback(*args))
+    return callback(*args)
+
+
+class CallbackDispatcher:
+    '''
+    Runs a sync or async websocket callback in one of the executor modes:
+
+    inline   called (or awaited) on the websocket task, the previous behaviour
+    async    queued to `workers` consumer tasks, receiving continues meanwhile
+    thread   `workers` single thread executors
+    process  `workers` single process executors, the callback must be picklable
+
+    Messages are sharded by key ('EXCH|token' by default) onto single-worker queues, so
+    the messages of one instrument are handled in order and different instruments in
+    parallel. stats() reports the backlog and the latency from dispatch to completion.
+    '''
+    def __init__(self, callback, mode='inline', workers=4, key=message_key, history=1024):
+        if mode not in MODES:
+            raise ValueError(f'unknown callback mode {mode}, expected one of {MODES}')
+
+        self.callback = callback
+        self.mode = mode
+        self.workers = workers if mode != 'inline' else 1
+        self.key = key
+        self.__is_async = inspect.iscoroutinefunction(callback)
+        self.__shards = None
+
+        self.dispatched = 0
+        self.completed = 0
+        self.errors = 0
+        self.__latencies = collections.deque(maxlen=history)
+
+    @property
+    def backlog(self):
+        return self.dispatched - self.completed
+
+    def __shard(self, args):
+        if self.workers == 1:
+            return 0
+        key = self.key(*args)
+        if key is None:
+            return 0
+        return zlib.crc32(key.encode()) % self.workers
+
+    def __start(self):
+        if self.mode == 'async':
+            self.__shards = [asyncio.Queue() for _ in range(self.workers)]
+            self.__tasks = [asyncio.create_task(self.__consume(shard)) for shard in self.__shards]
+        elif self.mode == 'thread':
+            self.__shards = [concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='NorenCallback')
+                             for _ in range(self.workers)]
+        else:
+            self.__shards = [concurrent.futures.ProcessPoolExecutor(max_workers=1) for _ in range(self.workers)]
+
+    async def __call__(self, *args):
+        self.dispatched += 1
+        start = time.perf_counter()
+
+        if self.mode == 'inline':
+            try:
+                if self.__is_async:
+                    await self.callback(*args)
+                else:
+                    self.callback(*args)
+            except Exception as e:
+                self.errors += 1
+                logger.exception(e)
+            self.__done(start)
+            return
+
+        if self.__shards is None:
+            self.__start()
+
+        shard = self.__shards[self.__shard(args)]
+        if self.mode == 'async':
+            shard.put_nowait((start, args))
+            return
+
+        future = asyncio.wrap_future(shard.submit(_call, self.callback, args))
+        future.add_done_callback(lambda f: self.__completed(f, start))
+
+    async def __consume(self, queue):
+        while True:
+            start, args = await queue.get()
+            try:
+                if self.__is_async:
+                    await self.callback(*args)
+                else:
+                    self.callback(*args)
+            except Exception as e:
+                self.errors += 1
+                logger.exception(e)
+            finally:
+                queue.task_done()
+            self.__done(start)
+
+    def __completed(self, future, start):
+        if not future.cancelled() and future.exception() is not None:
+            self.errors += 1
+            logger.error(f'callback {self.callback} failed: {future.exception()!r}')
+        self.__done(start)
+
+    def __done(self, start):
+        self.completed += 1
+        self.__latencies.append(time.perf_counter() - start)
+
+    def stats(self):
+        '''
+        dispatched, completed, errors, backlog and latency percentiles in seconds
+        '''
+        latencies = sorted(self.__latencies)
+        count = len(latencies)
+
+        def percentile(p):
+            return latencies[min(count - 1, int(p * count))] if count else None
+
+        return {'mode': self.mode, 'dispatched': self.dispatched, 'completed': self.completed,
+                'errors': self.errors, 'backlog': self.backlog, 'p50': percentile(0.5),
+                'p99': percentile(0.99), 'max': latencies[-1] if count else None}
+
+    async def join(self):
+        '''
+        waits until every dispatched message has been handled
+        '''
+        while self.backlog > 0:
+            await asyncio.sleep(0.001)
+
+    async def close(self, wait=True):
+        if wait:
+            await self.join()
+
+        if self.__shards is not None:
+            if self.mode == 'async':
+                for task in self.__tasks:
+                    task.cancel()
+            else:
+                for executor in self.__shards:
+                    executor.shutdown(wait=False)
+        self.__shards = None
+
+
+def as_dispatcher(callback):
+    '''
+    wraps a plain sync or async callback into an inline dispatcher
+    '''
+    if callback is None or isinstance(callback, CallbackDispatcher):
+        return callback
+    return CallbackDispatcher(callback)
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from .ratelimit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+def create_session(limit=100, limit_per_host=0, keepalive_timeout=60):
+    '''
+    aiohttp session to share between the NorenApi instances of several accounts: NorenApi(..., session=session)
+    '''
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host, keepalive_timeout=keepalive_timeout)
+    return aiohttp.ClientSession(connector=connector)
+
+
+class FanOutResult:
+    '''
+    acknowledgement of every account for one mirrored order, latencies in seconds from the fan-out start
+    '''
+    def __init__(self, order):
+        self.order = order
+        self.started_at = time.time()
+        # account -> {'quantity', 'latency', 'response', 'norenordno', 'ok'}
+        self.accounts = {}
+        self.skipped = []
+
+    @property
+    def ok(self):
+        return [account for account, entry in self.accounts.items() if entry['ok']]
+
+    @property
+    def failed(self):
+        return [account for account, entry in self.accounts.items() if not entry['ok']]
+
+    @property
+    def first(self):
+        latencies = [entry['latency'] for entry in self.accounts.values()]
+        return min(latencies) if latencies else None
+
+    @property
+    def last(self):
+        latencies = [entry['latency'] for entry in self.accounts.values()]
+        return max(latencies) if latencies else None
+
+    @property
+    def spread(self):
+        '''
+        time between the first and the last acknowledgement
+        '''
+        return self.last - self.first if self.accounts else None
+
+    def orders(self):
+        return {account: entry['norenordno'] for account, entry in self.accounts.items() if entry['ok']}
+
+    def to_dict(self):
+        return {'order': self.order, 'started_at': self.started_at, 'accounts': self.accounts,
+                'skipped': self.skipped, 'first': self.first, 'last': self.last, 'spread': self.spread}
+
+
+class OrderFanOut:
+    '''
+    Mirrors one order onto several logged-in accounts (copy trading).
+
+    The quantity of each account is the order quantity times its multiplier in the
+    allocation map, rounded down to the lot size; accounts left with nothing are skipped.
+    All the accounts are submitted concurrently, each behind its own RateLimiter when a
+    rate is given, so one throttled account does not delay the others. Build the NorenApi
+    instances with a shared session (create_session()) to use one connection pool, and
+    call warm_up() beforehand so that the connections are open when the order comes.
+    Note that the host of NorenApi is a class setting: every account must use the same
+    broker endpoint.
+    '''
+    def __init__(self, accounts, allocation=None, rate=None, burst=None):
+        # account -> NorenApi
+        self.accounts = dict(accounts)
+        # account -> quantity multiplier, 1 for the accounts missing from the map
+        self.allocation = dict(allocation) if allocation is not None else {}
+        self.__limiters = {}
+        if rate is not None:
+            self.__limiters = {account: RateLimiter(rate, burst) for account in self.accounts}
+
+    def add_account(self, account, api, multiplier=1, rate=None, burst=None):
+        self.accounts[account] = api
+        self.allocation[account] = multiplier
+        if rate is not None:
+            self.__limiters[account] = RateLimiter(rate, burst)
+
+    def remove_account(self, account):
+        self.accounts.pop(account, None)
+        self.allocation.pop(account, None)
+        self.__limiters.pop(account, None)
+
+    def quantities(self, quantity, lot=1):
+        '''
+        quantity of every account, 0 for the ones skipped
+        '''
+        quantities = {}
+        for account in self.accounts:
+            quantities[account] = int(quantity * self.allocation.get(account, 1) // lot) * lot
+        return quantities
+
+    async def warm_up(self):
+        '''
+        one light request per account so the pooled connections are open before the first order
+        '''
+        await asyncio.gather(*[api.get_watch_list_names() for api in self.accounts.values()],
+                             return_exceptions=True)
+
+    async def place_order(self, buy_or_sell, product_type, exchange, tradingsymbol, quantity, discloseqty,
+                          price_type, price=0.0, trigger_price=None, retention='DAY', amo='NO', remarks=None,
+                          bookloss_price=0.0, bookprofit_price=0.0, trail_price=0.0, lot=1):
+        '''
+        places the order on every account, returns a FanOutResult
+        '''
+        order = dict(buy_or_sell=buy_or_sell, product_type=product_type, exchange=exchange,
+                     tradingsymbol=tradingsymbol, quantity=quantity, discloseqty=discloseqty, price_type=price_type,
+                     price=price, trigger_price=trigger_price, retention=retention, amo=amo, remarks=remarks,
+                     bookloss_price=bookloss_price, bookprofit_price=bookprofit_price, trail_price=trail_price)
+        result = FanOutResult(order)
+
+        submissions = []
+        for account, account_quantity in self.quantities(quantity, lot).items():
+            if account_quantity <= 0:
+                result.skipped.append(account)
+                continue
+            account_order = dict(order, quantity=account_quantity,
+                                 discloseqty=min(discloseqty, account_quantity) if discloseqty else discloseqty)
+            submissions.append(self.__submit(account, account_order))
+
+        start = time.perf_counter()
+        for account, account_quantity, response, acked in await asyncio.gather(*submissions):
+            ok = isinstance(response, dict) and response.get('stat') == 'Ok'
+            result.accounts[account] = {'quantity': account_quantity, 'latency': acked - start, 'response': response,
+                                        'norenordno': response.get('norenordno') if ok else None, 'ok': ok}
+            if not ok:
+                logger.error(f'{account}: order of {tradingsymbol} failed: {response}')
+
+        if result.accounts:
+            logger.info(f'{tradingsymbol} placed on {len(result.ok)}/{len(result.accounts)} accounts, '
+                        f'first ack {result.first * 1000:.1f}ms, spread {result.spread * 1000:.1f}ms')
+        return result
+
+    async def __submit(self, account, order):
+        limiter = self.__limiters.get(account)
+        try:
+            if limiter is not None:
+                await limiter.acquire()
+            response = await self.accounts[account].place_order(**order)
+        except Exception as e:
+            response = {'stat': 'Not_Ok', 'emsg': repr(e)}
+        return account, order['quantity'], response, time.perf_counter()
+
+    async def cancel_order(self, result):
+        '''
+        cancels the orders of a FanOutResult on every account, returns account -> response
+        '''
+        async def cancel(account, orderno):
+            limiter = self.__limiters.get(account)
+            try:
+                if limiter is not None:
+                    await limiter.acquire()
+                return account, await self.accounts[account].cancel_order(orderno)
+            except Exception as e:
+                return account, {'stat': 'Not_Ok', 'emsg': repr(e)}
+
+        orders = result.orders()
+        return dict(await asyncio.gather(*[cancel(account, orderno) for account, orderno in orders.items()]))
@@ -0,0 +1,72 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QuoteTable:
+    '''
+    Latest state of every subscribed instrument, built from the websocket feed.
+
+    tk messages carry every field and tf messages only the changed ones, both are merged
+    into one dict per 'EXCH|token'. The trading symbol of the tk acknowledgement is indexed
+    so that quotes can also be found by (exchange, tradingsymbol).
+    '''
+    def __init__(self):
+        self.__quotes = {}
+        self.__by_tsym = {}
+
+    def __len__(self):
+        return len(self.__quotes)
+
+    def __contains__(self, key):
+        return key in self.__quotes
+
+    def attach(self, api):
+        api.add_feed_listener(self.on_tick)
+
+    def detach(self, api):
+        api.remove_feed_listener(self.on_tick)
+
+    def on_tick(self, message):
+        key = f"{message['e']}|{message['tk']}"
+        quote = self.__quotes.get(key)
+
+        if quote is None:
+            self.__quotes[key] = dict(message)
+        else:
+            quote.update(message)
+
+        tsym = message.get('ts')
+        if tsym is not None:
+            self.__by_tsym[(message['e'], tsym)] = key
+
+    def get(self, key):
+        return self.__quotes.get(key)
+
+    def key(self, exchange, tradingsymbol):
+        return self.__by_tsym.get((exchange, tradingsymbol))
+
+    def lookup(self, exchange, tradingsymbol):
+        key = self.__by_tsym.get((exchange, tradingsymbol))
+        return self.__quotes.get(key) if key is not None else None
+
+    def ltp(self, key):
+        quote = self.__quotes.get(key)
+        if quote is None or 'lp' not in quote:
+            return None
+        return float(quote['lp'])
+
+    def snapshot(self, key):
+        '''
+        returns the full state of an instrument as a tk message
+        '''
+        quote = self.__quotes.get(key)
+        if quote is None:
+            return None
+
+        snapshot = dict(quote)
+        snapshot['t'] = 'dk' if quote.get('t') in ('dk', 'df') else 'tk'
+        return snapshot
+
+    def keys(self):
+        return list(self.__quotes)
@@ -0,0 +1,111 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+TPSERIES_FIELDS = ['into', 'inth', 'intl', 'intc', 'intvwap', 'intv', 'intoi', 'v', 'oi']
+DAILY_FIELDS = ['into', 'inth', 'intl', 'intc', 'intv']
+
+# exchange timestamps are Indian Standard Time
+IST_OFFSET = 19800
+
+
+def _float_column(rows, field):
+    # numpy parses the numeric strings in C, missing values become nan
+    values = [row.get(field) for row in rows]
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array([np.nan if value in (None, '') else value for value in values], dtype=np.float64)
+
+
+def parse_times(times):
+    '''
+    converts a sequence of 'dd-mm-YYYY HH:MM:SS' strings to seconds since 1970
+    without a per row strptime
+    '''
+    if len(times) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # view the fixed width strings as a (n, 19) matrix of digits
+    chars = np.array(times, dtype='U19').view(np.uint32).reshape(-1, 19).astype(np.int64) - ord('0')
+
+    def number(start, width):
+        value = chars[:, start]
+        for i in range(start + 1, start + width):
+            value = value * 10 + chars[:, i]
+        return value
+
+    day = number(0, 2)
+    month = number(3, 2)
+    year = number(6, 4)
+
+    # days since 1970 from the civil date (Howard Hinnant's days_from_civil)
+    year = year - (month <= 2)
+    era = np.floor_divide(year, 400)
+    yoe = year - era * 400
+    doy = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    days = era * 146097 + doe - 719468
+
+    seconds = days * 86400 + number(11, 2) * 3600 + number(14, 2) * 60 + number(17, 2)
+    return seconds - IST_OFFSET
+
+
+def tpseries_arrays(rows):
+    '''
+    converts a TPSeries response (list of dicts with string fields) into
+    a dict of numpy arrays sorted by time, 'time' being seconds since 1970
+    '''
+    if not isinstance(rows, list):
+        rows = []
+
+    if rows and 'ssboe' in rows[0]:
+        times = np.array([row['ssboe'] for row in rows], dtype=np.int64)
+    else:
+        times = parse_times([row['time'] for row in rows])
+
+    columns = {'time': times}
+    for field in TPSERIES_FIELDS:
+        columns[field] = _float_column(rows, field)
+
+    # the broker returns the latest candle first
+    order = np.argsort(times, kind='stable')
+    return {name: values[order] for name, values in columns.items()}
+
+
+def daily_arrays(rows):
+    '''
+    converts an EODChartData response (list of json strings) into
+    a dict of numpy arrays sorted by time, 'time' being seconds since 1970
+    '''
+    if not isinstance(rows, list):
+        rows = []
+
+    # one json parse for the whole response instead of one per row
+    if rows and isinstance(rows[0], str):
+        rows = json.loads('[' + ','.join(rows) + ']')
+
+    columns = {'time': np.array([row['ssboe'] for row in rows], dtype=np.int64)}
+    for field in DAILY_FIELDS:
+        columns[field] = _float_column(rows, field)
+
+    order = np.argsort(columns['time'], kind='stable')
+    return {name: values[order] for name, values in columns.items()}
+
+
+def to_frame(columns):
+    '''
+    builds a DataFrame indexed by the candle time (Asia/Kolkata) from the converted arrays
+    '''
+    frame = pd.DataFrame(columns)
+    frame['time'] = pd.to_datetime(frame['time'], unit='s', utc=True).dt.tz_convert('Asia/Kolkata')
+    return frame.set_index('time')
+
+
+def tpseries_frame(rows):
+    return to_frame(tpseries_arrays(rows))
+
+
+def daily_frame(rows):
+    return to_frame(daily_arrays(rows))
@@ -0,0 +1,264 @@
+import datetime
+import time
+
+import numpy as np
+
+# exchange timestamps are Indian Standard Time
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+# options expire at the close of the expiry day
+EXPIRY_TIME = datetime.time(15, 30)
+SECONDS_PER_YEAR = 365 * 86400
+
+SQRT_2PI = np.sqrt(2 * np.pi)
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / SQRT_2PI
+
+
+def norm_cdf(x):
+    '''
+    cumulative normal distribution, double precision (Hart 1968 / West 2005), vectorized
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    ax = np.abs(x)
+    e = np.exp(-0.5 * ax * ax)
+
+    num = 3.52624965998911e-02 * ax + 0.700383064443688
+    num = num * ax + 6.37396220353165
+    num = num * ax + 33.912866078383
+    num = num * ax + 112.079291497871
+    num = num * ax + 221.213596169931
+    num = num * ax + 220.206867912376
+
+    den = 8.83883476483184e-02 * ax + 1.75566716318264
+    den = den * ax + 16.064177579207
+    den = den * ax + 86.7807322029461
+    den = den * ax + 296.564248779674
+    den = den * ax + 637.333633378831
+    den = den * ax + 793.826512519948
+    den = den * ax + 440.413735824752
+
+    # continued fraction for the tails
+    frac = ax + 0.65
+    frac = ax + 4 / frac
+    frac = ax + 3 / frac
+    frac = ax + 2 / frac
+    frac = ax + 1 / frac
+
+    tail = np.where(ax < 7.07106781186547, e * num / den, e / frac / 2.506628274631)
+    tail = np.where(ax > 37, 0.0, tail)
+    return np.where(x > 0, 1 - tail, tail)
+
+
+def expiry_timestamp(expiredate):
+    '''
+    converts an expiry ('24-NOV-2022', datetime.date or seconds since 1970) to seconds since 1970
+    '''
+    if isinstance(expiredate, str):
+        expiredate = datetime.datetime.strptime(expiredate.strip(), '%d-%b-%Y').date()
+    if isinstance(expiredate, datetime.datetime):
+        return expiredate.timestamp()
+    if isinstance(expiredate, datetime.date):
+        return datetime.datetime.combine(expiredate, EXPIRY_TIME, tzinfo=IST).timestamp()
+    return expiredate
+
+
+def time_to_expiry(expiredate, now=None):
+    '''
+    years until expiry, expiredate can be a single expiry or an array of seconds since 1970
+    '''
+    if now is None:
+        now = time.time()
+
+    if isinstance(expiredate, (list, tuple)):
+        expiry = np.array([expiry_timestamp(item) for item in expiredate], dtype=np.float64)
+    else:
+        expiry = np.asarray(expiry_timestamp(expiredate), dtype=np.float64)
+
+    return np.maximum(expiry - now, 0.0) / SECONDS_PER_YEAR
+
+
+def _is_call(option_type):
+    option_type = np.asarray(option_type)
+    if option_type.dtype.kind in 'US':
+        return np.char.upper(option_type.astype('U2')) == 'CE'
+    return option_type.astype(bool)
+
+
+def option_price(spot, strike, years, rate, volatility, is_call, model='black_scholes'):
+    '''
+    option price, rate and volatility as fractions (0.07, 0.15), vectorized over every argument.
+    model 'black76' treats spot as the futures price.
+    '''
+    spot, strike, years, rate, volatility = np.broadcast_arrays(*[np.asarray(value, dtype=np.float64) for value in
+                                                                  (spot, strike, years, rate, volatility)])
+    is_call = np.broadcast_to(_is_call(is_call), spot.shape)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sqrt_t = np.sqrt(years)
+        vol_t = np.maximum(volatility * sqrt_t, 1e-12)
+        discount = np.exp(-rate * years)
+        forward = spot if model == 'black76' else spot / discount
+        d1 = (np.log(forward / strike) + 0.5 * vol_t * vol_t) / vol_t
+        d2 = d1 - vol_t
+
+        call = discount * (forward * norm_cdf(d1) - strike * norm_cdf(d2))
+        put = discount * (strike * norm_cdf(-d2) - forward * norm_cdf(-d1))
+
+    return np.where(is_call, call, put)
+
+
+def greeks(spot, strike, years, rate, volatility, is_call, model='black_scholes'):
+    '''
+    price, delta, gamma, theta (per day), vega (per 1% volatility) and rho (per 1% rate),
+    vectorized over every argument. rate and volatility are fractions (0.07, 0.15),
+    model 'black76' treats spot as the futures price.
+    '''
+    spot, strike, years, rate, volatility = np.broadcast_arrays(*[np.asarray(value, dtype=np.float64) for value in
+                                                                  (spot, strike, years, rate, volatility)])
+    is_call = np.broadcast_to(_is_call(is_call), spot.shape)
+    black76 = model == 'black76'
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sqrt_t = np.sqrt(years)
+        vol_t = np.maximum(volatility * sqrt_t, 1e-12)
+        discount = np.exp(-rate * years)
+        forward = spot if black76 else spot / discount
+        d1 = (np.log(forward / strike) + 0.5 * vol_t * vol_t) / vol_t
+        d2 = d1 - vol_t
+
+        nd1 = norm_cdf(d1)
+        pdf = norm_pdf(d1)
+        sign = np.where(is_call, 1.0, -1.0)
+        n_sd1 = norm_cdf(sign * d1)
+        n_sd2 = norm_cdf(sign * d2)
+
+        price = sign * discount * (forward * n_sd1 - strike * n_sd2)
+        decay = -forward * discount * pdf * volatility / (2 * np.maximum(sqrt_t, 1e-12))
+
+        if black76:
+            delta = sign * discount * n_sd1
+            gamma = discount * pdf / (spot * vol_t)
+            theta = decay + rate * price
+            rho = -years * price
+        else:
+            delta = np.where(is_call, nd1, nd1 - 1)
+            gamma = pdf / (spot * vol_t)
+            theta = decay - sign * rate * strike * discount * n_sd2
+            rho = sign * strike * years * discount * n_sd2
+
+        vega = forward * discount * pdf * sqrt_t
+
+    return {
+        'price': price,
+        'delta': delta,
+        'gamma': gamma,
+        'theta': theta / 365,
+        'vega': vega / 100,
+        'rho': rho / 100,
+    }
+
+
+def option_greek(expiredate, StrikePrice, SpotPrice, InterestRate, Volatility, OptionType=None, now=None,
+                 model='black_scholes'):
+    '''
+    local counterpart of NorenApi.option_greek, taking the same inputs (rate and volatility in percent)
+    and returning the GetOptionGreek fields (cal_*/put_*). like the broker both calls and puts are
+    returned whatever the OptionType. every input can be an array.
+    '''
+    years = time_to_expiry(expiredate, now)
+    rate = np.asarray(InterestRate, dtype=np.float64) / 100
+    volatility = np.asarray(Volatility, dtype=np.float64) / 100
+    strike = np.asarray(StrikePrice, dtype=np.float64)
+    spot = np.asarray(SpotPrice, dtype=np.float64)
+
+    res = {'stat': 'Ok'}
+    for prefix, is_call in (('cal', True), ('put', False)):
+        values = greeks(spot, strike, years, rate, volatility, is_call, model)
+        for name, value in values.items():
+            # the broker names vega 'vego'
+            res[f"{prefix}_{'vego' if name == 'vega' else name}"] = value
+
+    return res
+
+
+def implied_volatility(price, spot, strike, years, rate, is_call, initial=None, model='black_scholes',
+                       tol=1e-8, max_iter=60, min_vol=1e-4, max_vol=5.0, tick=0.05, min_vega=1e-8):
+    '''
+    implied volatility (fraction) of option prices, vectorized over a whole chain.
+
+    ITM options are solved through their OTM counterpart (put-call parity), whose price is
+    the time value alone. Every option is then solved at once with Newton steps kept inside
+    a [low, high] volatility bracket that shrinks at each iteration, falling back to
+    bisection when a step leaves the bracket, starting from `initial` (typically the previous
+    IV of each strike) where it is valid. Prices outside the no-arbitrage bounds, time values
+    below one `tick`, options without vega and expired options give nan.
+    '''
+    price, spot, strike, years, rate = np.broadcast_arrays(*[np.asarray(value, dtype=np.float64) for value in
+                                                             (price, spot, strike, years, rate)])
+    shape = price.shape
+    price, spot, strike, years, rate = [value.ravel() for value in (price, spot, strike, years, rate)]
+    is_call = np.broadcast_to(_is_call(is_call), shape).ravel()
+    black76 = model == 'black76'
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        discount = np.exp(-rate * years)
+        forward = spot if black76 else spot / discount
+
+        # solve the OTM option: C - P = discount * (F - K)
+        otm_call = strike >= forward
+        parity = discount * (forward - strike)
+        target = np.where(is_call == otm_call, price, np.where(is_call, price - parity, price + parity))
+        sign = np.where(otm_call, 1.0, -1.0)
+
+        upper = np.where(otm_call, discount * forward, discount * strike)
+        valid = (years > 0) & (strike > 0) & (spot > 0) & (target >= tick) & (target < upper)
+
+        # Brenner-Subrahmanyam guess where no previous IV is available
+        guess = np.sqrt(2 * np.pi / np.maximum(years, 1e-12)) * price / (discount * forward)
+        if initial is not None:
+            initial = np.broadcast_to(np.asarray(initial, dtype=np.float64), shape).ravel()
+            guess = np.where(np.isfinite(initial) & (initial > min_vol), initial, guess)
+        vol = np.clip(np.nan_to_num(guess, nan=0.3), 0.01, 2.0)
+
+        sqrt_t = np.sqrt(years)
+        low = np.full(len(price), min_vol)
+        high = np.full(len(price), max_vol)
+        vega = np.zeros(len(price))
+        active = valid.copy()
+        converged = np.zeros_like(valid)
+
+        for _ in range(max_iter):
+            if not active.any():
+                break
+
+            index = np.flatnonzero(active)
+            v = vol[index]
+            vol_t = np.maximum(v * sqrt_t[index], 1e-12)
+            d1 = (np.log(forward[index] / strike[index]) + 0.5 * vol_t * vol_t) / vol_t
+            d2 = d1 - vol_t
+            s = sign[index]
+            model_price = s * discount[index] * (forward[index] * norm_cdf(s * d1) - strike[index] * norm_cdf(s * d2))
+            vega[index] = forward[index] * discount[index] * norm_pdf(d1) * sqrt_t[index]
+
+            # the price grows with the volatility
+            diff = model_price - target[index]
+            high[index] = np.where(diff > 0, v, high[index])
+            low[index] = np.where(diff < 0, v, low[index])
+
+            done = (np.abs(diff) <= tol * target[index]) | (high[index] - low[index] <= tol * v)
+            converged[index[done]] = True
+
+            step = v - diff / np.where(vega[index] > 0, vega[index], np.nan)
+            inside = np.isfinite(step) & (step > low[index]) & (step < high[index])
+            vol[index] = np.where(done, v, np.where(inside, step, (low[index] + high[index]) / 2))
+            active[index[done]] = False
+
+    # no root inside [min_vol, max_vol] leaves the bracket collapsed on one of its ends
+    converged &= (vol > min_vol * (1 + tol)) & (vol < max_vol * (1 - tol)) & (vega >= min_vega)
+
+    result = np.full(len(price), np.nan)
+    result[converged] = vol[converged]
+    return result.reshape(shape)
@@ -0,0 +1,154 @@
+import asyncio
+import datetime
+import logging
+import os
+import time
+
+import numpy as np
+
+from .frames import tpseries_arrays
+
+logger = logging.getLogger(__name__)
+
+# exchange timestamps are Indian Standard Time
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+
+def concat_columns(chunks):
+    chunks = [chunk for chunk in chunks if chunk is not None]
+    if not chunks:
+        return tpseries_arrays([])
+
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def slice_columns(columns, starttime, endtime):
+    times = columns['time']
+    lo = np.searchsorted(times, starttime, side='left')
+    hi = np.searchsorted(times, endtime, side='right')
+    return {name: values[lo:hi] for name, values in columns.items()}
+
+
+class HistoricalData:
+    '''
+    Downloads TPSeries candles for many tokens and long ranges.
+
+    A range is split into one chunk per trading day, token x day pairs are fetched
+    concurrently and completed days are stored in an on-disk cache
+    (cache_dir/exchange/token/interval/YYYYMMDD.npz). Later calls only fetch the
+    days missing from the cache.
+    '''
+    def __init__(self, api, cache_dir, max_concurrency=8):
+        self.__api = api
+        self.__cache_dir = cache_dir
+        self.__semaphore = asyncio.Semaphore(max_concurrency)
+
+    def __cache_path(self, exchange, token, interval, day):
+        return os.path.join(self.__cache_dir, exchange, str(token), str(interval), day.strftime('%Y%m%d') + '.npz')
+
+    @staticmethod
+    def split_days(starttime, endtime):
+        '''
+        splits [starttime, endtime] into exchange (IST) calendar days
+        returns a list of (day, day_start, day_end) in seconds since 1970
+        '''
+        day = dt_fromtimestamp(starttime).date()
+        last = dt_fromtimestamp(endtime).date()
+
+        days = []
+        while day <= last:
+            day_start = int(datetime.datetime.combine(day, datetime.time.min, tzinfo=IST).timestamp())
+            days.append((day, day_start, day_start + 86399))
+            day += datetime.timedelta(days=1)
+
+        return days
+
+    def load_day(self, exchange, token, interval, day):
+        path = self.__cache_path(exchange, token, interval, day)
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    def store_day(self, exchange, token, interval, day, columns):
+        path = self.__cache_path(exchange, token, interval, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write to a temporary file first so that readers never see a partial day
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **columns)
+        os.replace(tmp_path, path)
+
+    async def __fetch(self, exchange, token, starttime, endtime, interval):
+        async with self.__semaphore:
+            ret = await self.__api.get_time_price_series(exchange=exchange, token=token, starttime=starttime,
+                                                         endtime=endtime, interval=interval)
+
+        if isinstance(ret, list):
+            return tpseries_arrays(ret)
+
+        # holidays and weekends come back as Not_Ok / no data
+        if isinstance(ret, dict) and 'no data' in str(ret.get('emsg', '')).lower():
+            return tpseries_arrays([])
+
+        logger.error(f'TPSeries failed for {exchange}|{token} {starttime}-{endtime}: {ret}')
+        return None
+
+    async def __get_day(self, exchange, token, interval, day, day_start, day_end, today):
+        if day < today:
+            cached = self.load_day(exchange, token, interval, day)
+            if cached is not None:
+                return cached
+
+        columns = await self.__fetch(exchange, token, day_start, day_end, interval)
+
+        # only completed days are cached, today keeps changing
+        if columns is not None and day < today:
+            self.store_day(exchange, token, interval, day, columns)
+
+        return columns
+
+    async def get(self, exchange, token, starttime, endtime=None, interval=1):
+        '''
+        returns the candles of one token between starttime and endtime (seconds since 1970)
+        as a dict of numpy arrays sorted by time
+        '''
+        ret = await self.download([(exchange, token)], starttime, endtime, interval)
+        return ret[f'{exchange}|{token}']
+
+    async def download(self, instruments, starttime, endtime=None, interval=1):
+        '''
+        instruments is a list of (exchange, token) pairs or 'EXCH|token' strings
+        returns a dict keyed by 'EXCH|token' with the candles of each instrument
+        '''
+        if endtime is None:
+            endtime = time.time()
+
+        starttime = int(starttime)
+        endtime = int(endtime)
+        today = dt_fromtimestamp(time.time()).date()
+        days = self.split_days(starttime, endtime)
+
+        keys = []
+        tasks = []
+        for instrument in instruments:
+            if isinstance(instrument, str):
+                exchange, token = instrument.split('|')
+            else:
+                exchange, token = instrument
+
+            keys.append(f'{exchange}|{token}')
+            tasks.append(asyncio.gather(*[
+                self.__get_day(exchange, token, interval, day, day_start, day_end, today)
+                for day, day_start, day_end in days
+            ]))
+
+        results = await asyncio.gather(*tasks)
+
+        return {key: slice_columns(concat_columns(chunks), starttime, endtime) for key, chunks in zip(keys, results)}
+
+
+def dt_fromtimestamp(seconds):
+    return datetime.datetime.fromtimestamp(seconds, tz=IST)
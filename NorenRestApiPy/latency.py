@@ -0,0 +1,188 @@
+import collections
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('ack', 'first_update', 'fill')
+# order states after which no update is expected
+FINAL_STATUS = ('COMPLETE', 'CANCELED', 'REJECTED')
+
+
+class OrderTimeline:
+    '''
+    stage timestamps of one order, perf_counter seconds
+    '''
+    __slots__ = ('norenordno', 'exchange', 'product_type', 'price_type', 'tradingsymbol', 'submitted_at',
+                 'submit', 'ack', 'first_update', 'fill', 'events')
+
+    def __init__(self, exchange, product_type, price_type, tradingsymbol):
+        self.norenordno = None
+        self.exchange = exchange
+        self.product_type = product_type
+        self.price_type = price_type
+        self.tradingsymbol = tradingsymbol
+        self.submitted_at = time.time()
+        self.submit = time.perf_counter()
+        self.ack = None
+        self.first_update = None
+        self.fill = None
+        # (seconds since submit, event, detail)
+        self.events = [(0.0, 'submit', None)]
+
+    def event(self, timestamp, name, detail=None):
+        self.events.append((timestamp - self.submit, name, detail))
+
+    def latency(self, stage):
+        timestamp = getattr(self, stage)
+        return timestamp - self.submit if timestamp is not None else None
+
+    def to_dict(self):
+        return {'norenordno': self.norenordno, 'exchange': self.exchange, 'product_type': self.product_type,
+                'price_type': self.price_type, 'tradingsymbol': self.tradingsymbol,
+                'submitted_at': self.submitted_at,
+                'latency': {stage: self.latency(stage) for stage in STAGES},
+                'events': [{'at': at, 'event': name, 'detail': detail} for at, name, detail in sorted(
+                    self.events, key=lambda event: event[0])]}
+
+
+class OrderLatencyTracker:
+    '''
+    Latency of every order placed through NorenApi, from the place_order call to the
+    REST acknowledgement, the first om update and the first fill.
+
+    The REST response gives the norenordno that joins the order with its om updates;
+    updates arriving before the response are kept aside and merged once it is known.
+    Latencies are kept per (exchange, product, price type) for stats(), and recorded in
+    an `order_latency_seconds` histogram when a MetricsRegistry is given. Orders slower
+    than `slow` seconds to fill (or to be acknowledged when they never fill) are kept
+    with their full timeline for dump_slow().
+    '''
+    def __init__(self, metrics=None, history=1024, slow=1.0, max_pending=4096, max_slow=100):
+        self.history = history
+        self.slow_threshold = slow
+        self.max_pending = max_pending
+        self.__histogram = None
+        if metrics is not None:
+            self.__histogram = metrics.histogram('order_latency_seconds', 'order latency from the place_order call',
+                                                 ('stage', 'exchange', 'product', 'price_type'))
+        # (exchange, product, price type) -> stage -> deque of seconds
+        self.__samples = {}
+        # norenordno -> OrderTimeline
+        self.__orders = collections.OrderedDict()
+        # norenordno -> [(perf_counter, message)] received before the REST response
+        self.__early = collections.OrderedDict()
+        self.slow = collections.deque(maxlen=max_slow)
+
+    def attach(self, api):
+        api.set_order_tracker(self)
+        api.add_order_listener(self.on_order_update)
+
+    def detach(self, api):
+        api.set_order_tracker(None)
+        api.remove_order_listener(self.on_order_update)
+
+    def on_submit(self, exchange, product_type, price_type, tradingsymbol=None):
+        return OrderTimeline(exchange, product_type, price_type, tradingsymbol)
+
+    def on_ack(self, timeline, response):
+        now = time.perf_counter()
+        timeline.ack = now
+        self.__record(timeline, 'ack')
+
+        if not isinstance(response, dict) or response.get('stat') != 'Ok':
+            timeline.event(now, 'rejected', response.get('emsg') if isinstance(response, dict) else None)
+            self.__finish(timeline)
+            return
+
+        timeline.norenordno = orderno = response.get('norenordno')
+        timeline.event(now, 'ack', orderno)
+        self.__orders[orderno] = timeline
+        while len(self.__orders) > self.max_pending:
+            self.__orders.popitem(last=False)
+
+        for timestamp, message in self.__early.pop(orderno, []):
+            self.__update(timeline, timestamp, message)
+
+    def on_order_update(self, message):
+        now = time.perf_counter()
+        orderno = message.get('norenordno')
+        timeline = self.__orders.get(orderno)
+        if timeline is None:
+            if orderno is not None:
+                self.__early.setdefault(orderno, []).append((now, message))
+                while len(self.__early) > self.max_pending:
+                    self.__early.popitem(last=False)
+            return
+
+        self.__update(timeline, now, message)
+
+    def __update(self, timeline, timestamp, message):
+        report = message.get('reporttype')
+        status = message.get('status')
+        timeline.event(timestamp, report or 'update', status)
+
+        if timeline.first_update is None:
+            timeline.first_update = timestamp
+            self.__record(timeline, 'first_update')
+
+        if timeline.fill is None and (report == 'Fill' or status == 'COMPLETE'):
+            timeline.fill = timestamp
+            self.__record(timeline, 'fill')
+
+        if status in FINAL_STATUS:
+            self.__orders.pop(timeline.norenordno, None)
+            self.__finish(timeline)
+
+    def __record(self, timeline, stage):
+        latency = timeline.latency(stage)
+        key = (timeline.exchange, timeline.product_type, timeline.price_type)
+        samples = self.__samples.get(key)
+        if samples is None:
+            samples = self.__samples[key] = {name: collections.deque(maxlen=self.history) for name in STAGES}
+        samples[stage].append(latency)
+
+        if self.__histogram is not None:
+            self.__histogram.labels(stage, *key).observe(latency)
+
+    def __finish(self, timeline):
+        latency = timeline.latency('fill')
+        if latency is None:
+            latency = timeline.latency('ack')
+        if latency is not None and latency >= self.slow_threshold:
+            self.slow.append(timeline)
+
+    def stats(self):
+        '''
+        count, p50, p90, p99 and max per (exchange, product, price type) and stage, in seconds
+        '''
+        stats = {}
+        for key, samples in self.__samples.items():
+            entry = {}
+            for stage, values in samples.items():
+                values = sorted(values)
+                count = len(values)
+                if count:
+                    entry[stage] = {'count': count, 'p50': values[int(0.5 * (count - 1))],
+                                    'p90': values[int(0.9 * (count - 1))], 'p99': values[int(0.99 * (count - 1))],
+                                    'max': values[-1]}
+            stats[key] = entry
+        return stats
+
+    def pending(self):
+        '''
+        timelines of the orders still expecting updates
+        '''
+        return list(self.__orders.values())
+
+    def dump_slow(self, path=None):
+        '''
+        returns the slow orders with their timeline, written as JSON lines when a path is given
+        '''
+        slow = [timeline.to_dict() for timeline in self.slow]
+        if path is not None:
+            with open(path, 'a') as f:
+                for timeline in slow:
+                    f.write(json.dumps(timeline) + '\n')
+        return slow
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# order updates after which the limits change
+INVALIDATING_REPORTS = ('Fill', 'Canceled', 'Rejected', 'Replaced', 'New')
+
+
+class LimitsCache:
+    '''
+    In-memory cache of get_limits keyed by (product, segment, exchange).
+
+    get() answers synchronously from memory together with staleness metadata. Entries are
+    refreshed in the background every `interval` seconds and as soon as an order update
+    (fill, cancel, reject, modification) is received; refreshes triggered by bursts of
+    order updates are coalesced into one request per key.
+    '''
+    def __init__(self, api, interval=30, debounce=0.2, max_age=None):
+        self.__api = api
+        self.interval = interval
+        self.debounce = debounce
+        # entries older than max_age are reported as stale, 2 refresh intervals by default
+        self.max_age = max_age if max_age is not None else 2 * interval
+        # key -> {'limits': dict, 'updated': monotonic time, 'dirty': bool, 'invalidated': monotonic time}
+        self.__entries = {}
+        self.__refreshing = {}
+        self.__dirty_task = None
+        self.__task = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(product_type=None, segment=None, exchange=None):
+        return (product_type, segment, exchange)
+
+    async def start(self, keys=((None, None, None),)):
+        '''
+        loads the given keys, registers the order listener and starts the background refresh
+        '''
+        await asyncio.gather(*[self.refresh(*key) for key in keys])
+        self.__api.add_order_listener(self.on_order_update)
+        self.__task = asyncio.create_task(self.__run())
+
+    async def stop(self):
+        self.__api.remove_order_listener(self.on_order_update)
+        for task in (self.__task, self.__dirty_task):
+            if task is not None:
+                task.cancel()
+
+    async def __run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.refresh_all()
+
+    async def refresh_all(self):
+        await asyncio.gather(*[self.refresh(*key) for key in list(self.__entries)])
+
+    async def refresh(self, product_type=None, segment=None, exchange=None):
+        '''
+        fetches the limits of one key, concurrent refreshes of the same key share one request.
+        an invalidation received while the shared request was in flight is followed by a new request.
+        '''
+        key = self.key(product_type, segment, exchange)
+        while True:
+            task = self.__refreshing.get(key)
+            if task is None or task.done():
+                task = asyncio.ensure_future(self.__fetch(key))
+                self.__refreshing[key] = task
+                task.add_done_callback(
+                    lambda done: self.__refreshing.pop(key, None) if self.__refreshing.get(key) is done else None)
+            ret = await asyncio.shield(task)
+
+            entry = self.__entries.get(key)
+            if not isinstance(ret, dict) or ret.get('stat') != 'Ok' or entry is None or not entry['dirty']:
+                return ret
+
+    async def __fetch(self, key):
+        product_type, segment, exchange = key
+        requested = time.monotonic()
+        ret = await self.__api.get_limits(product_type=product_type, segment=segment, exchange=exchange)
+
+        if isinstance(ret, dict) and ret.get('stat') == 'Ok':
+            entry = self.__entries.get(key)
+            # an order update received while the request was in flight keeps the entry dirty
+            dirty = entry is not None and entry['dirty'] and entry['invalidated'] > requested
+            self.__entries[key] = {'limits': ret, 'updated': time.monotonic(), 'dirty': dirty,
+                                   'invalidated': entry['invalidated'] if entry else 0.0}
+        else:
+            logger.error(f'get_limits failed for {key}: {ret}')
+
+        return ret
+
+    def get(self, product_type=None, segment=None, exchange=None):
+        '''
+        returns the cached limits and their staleness without any round trip:
+        {'limits': dict or None, 'age': seconds, 'dirty': bool, 'stale': bool}
+        '''
+        entry = self.__entries.get(self.key(product_type, segment, exchange))
+        if entry is None:
+            self.misses += 1
+            return {'limits': None, 'age': None, 'dirty': True, 'stale': True}
+
+        self.hits += 1
+        age = time.monotonic() - entry['updated']
+        return {'limits': entry['limits'], 'age': age, 'dirty': entry['dirty'],
+                'stale': entry['dirty'] or age > self.max_age}
+
+    def limits(self, product_type=None, segment=None, exchange=None):
+        return self.get(product_type, segment, exchange)['limits']
+
+    def invalidate(self):
+        now = time.monotonic()
+        for entry in self.__entries.values():
+            entry['dirty'] = True
+            entry['invalidated'] = now
+
+        if self.__dirty_task is None or self.__dirty_task.done():
+            self.__dirty_task = asyncio.ensure_future(self.__refresh_dirty())
+
+    async def __refresh_dirty(self):
+        # coalesce the refreshes of a burst of order updates
+        await asyncio.sleep(self.debounce)
+        await asyncio.gather(*[self.refresh(*key) for key, entry in list(self.__entries.items()) if entry['dirty']])
+
+    def adjust(self, field, delta, product_type=None, segment=None, exchange=None):
+        '''
+        optimistic update of a numeric field, e.g. the margin blocked by an order about to be sent.
+        the next refresh replaces it with the broker values.
+        '''
+        entry = self.__entries.get(self.key(product_type, segment, exchange))
+        if entry is None:
+            return
+
+        limits = dict(entry['limits'])
+        limits[field] = f'{float(limits.get(field, 0) or 0) + delta:.2f}'
+        entry['limits'] = limits
+        entry['dirty'] = True
+
+    def on_order_update(self, message):
+        if message.get('reporttype') in INVALIDATING_REPORTS:
+            self.invalidate()
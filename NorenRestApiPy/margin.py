@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# fields identifying a contract in a SpanCalc position
+CONTRACT_FIELDS = ('prd', 'exch', 'instname', 'symname', 'exd', 'optt', 'strprc')
+QUANTITY_FIELDS = ('buyqty', 'sellqty', 'netqty')
+
+
+def _value(item, field):
+    if isinstance(item, dict):
+        return item.get(field)
+    return getattr(item, field, None)
+
+
+def canonicalize(positions):
+    '''
+    returns a hashable key for a list of positions (position objects or dicts).
+    positions of the same contract are merged, empty positions dropped and the
+    result sorted, so that equivalent portfolios share the same key. the key only
+    identifies the portfolio, SpanCalc receives the positions as given.
+    '''
+    merged = {}
+    for item in positions:
+        contract = []
+        for field in CONTRACT_FIELDS:
+            value = _value(item, field)
+            if field == 'strprc':
+                value = f'{float(value if value not in (None, "") else -1):.4f}'
+            contract.append(str(value if value is not None else '').upper())
+        contract = tuple(contract)
+
+        quantities = merged.get(contract, (0, 0, 0))
+        merged[contract] = tuple(quantity + int(float(_value(item, field) or 0))
+                                 for quantity, field in zip(quantities, QUANTITY_FIELDS))
+
+    return tuple(sorted((contract, quantities) for contract, quantities in merged.items() if any(quantities)))
+
+
+def positions_from_key(key):
+    '''
+    rebuilds SpanCalc positions from a canonical key, for keys built without their positions
+    '''
+    positions = []
+    for contract, quantities in key:
+        item = dict(zip(CONTRACT_FIELDS, contract))
+        item.update({field: str(quantity) for field, quantity in zip(QUANTITY_FIELDS, quantities)})
+        positions.append(item)
+    return positions
+
+
+def combine(*portfolios):
+    '''
+    merges several lists of positions into one canonical key
+    '''
+    return canonicalize([item for portfolio in portfolios for item in portfolio])
+
+
+class MarginCalculator:
+    '''
+    Memoizing wrapper around NorenApi.span_calculator.
+
+    Position sets are canonicalized into a hashable key and SpanCalc results are cached
+    for `ttl` seconds. Concurrent requests for the same key share a single round trip,
+    so what-if checks of many candidate trades against one base portfolio cost one
+    SpanCalc for the base plus one per distinct combined portfolio.
+    '''
+    def __init__(self, api, ttl=30, max_entries=4096):
+        self.__api = api
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.__cache = {}
+        self.__pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        self.__cache.clear()
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __prune(self, now):
+        if len(self.__cache) < self.max_entries:
+            return
+
+        for key in [key for key, (expires, _) in self.__cache.items() if expires <= now]:
+            del self.__cache[key]
+
+        # still full, drop the oldest entries
+        while len(self.__cache) >= self.max_entries:
+            del self.__cache[next(iter(self.__cache))]
+
+    async def __calculate(self, key, positions):
+        ret = await self.__api.span_calculator(None, positions if positions is not None else positions_from_key(key))
+
+        if isinstance(ret, dict) and ret.get('stat') == 'Ok':
+            now = time.monotonic()
+            self.__prune(now)
+            self.__cache[key] = (now + self.ttl, ret)
+        else:
+            logger.error(f'SpanCalc failed: {ret}')
+
+        return ret
+
+    async def calculate_key(self, key, positions=None):
+        '''
+        SpanCalc response of a canonical key, positions being the ones sent on a cache miss
+        '''
+        if not key:
+            return {'stat': 'Ok', 'span': '0.00', 'expo': '0.00', 'span_trade': '0.00', 'expo_trade': '0.00'}
+
+        cached = self.__cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self.hits += 1
+            return cached[1]
+
+        # share the round trip with a concurrent request for the same portfolio
+        task = self.__pending.get(key)
+        if task is not None:
+            self.hits += 1
+            return await asyncio.shield(task)
+
+        self.misses += 1
+        task = asyncio.ensure_future(self.__calculate(key, positions))
+        self.__pending[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if task.done():
+                self.__pending.pop(key, None)
+            else:
+                task.add_done_callback(lambda _: self.__pending.pop(key, None))
+
+    async def calculate(self, positions):
+        '''
+        SpanCalc response for a list of positions, from the cache when possible
+        '''
+        positions = list(positions)
+        return await self.calculate_key(canonicalize(positions), positions)
+
+    async def what_if(self, base, candidates):
+        '''
+        margin impact of each candidate trade (a position or a list of positions) on the base portfolio.
+        returns one dict per candidate with the SpanCalc response of base + candidate and the
+        incremental 'margin' (span + expo) over the base portfolio.
+        '''
+        base = list(base)
+        portfolios = [base + (list(candidate) if isinstance(candidate, (list, tuple)) else [candidate])
+                      for candidate in candidates]
+        base_key = canonicalize(base)
+        keys = [canonicalize(portfolio) for portfolio in portfolios]
+
+        # duplicates are solved once, with the positions of their first occurrence
+        unique = {}
+        for key, portfolio in zip([base_key] + keys, [base] + portfolios):
+            unique.setdefault(key, portfolio)
+        results = dict(zip(unique, await asyncio.gather(*[self.calculate_key(key, portfolio)
+                                                          for key, portfolio in unique.items()])))
+
+        base_margin = total_margin(results[base_key])
+        impacts = []
+        for key in keys:
+            ret = results[key]
+            margin = total_margin(ret)
+            impacts.append({
+                'response': ret,
+                'margin': margin,
+                'incremental': None if margin is None or base_margin is None else margin - base_margin,
+            })
+
+        return impacts
+
+
+def total_margin(ret):
+    '''
+    span + exposure of a SpanCalc response, None on failure
+    '''
+    if not isinstance(ret, dict) or ret.get('stat') != 'Ok':
+        return None
+    return float(ret.get('span', 0)) + float(ret.get('expo', 0))
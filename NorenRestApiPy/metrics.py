@@ -0,0 +1,297 @@
+import bisect
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# seconds, suited to REST round trips and order acknowledgements
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation='', labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.__children = {}
+
+    def labels(self, *values):
+        '''
+        returns the child of a label combination, keep it for hot paths
+        '''
+        child = self.__children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f'{self.name} expects labels {self.label_names}')
+            child = self.__children[values] = self._child()
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def children(self):
+        if not self.label_names and not self.__children:
+            self.labels()
+        return list(self.__children.items())
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for values, child in self.children():
+            lines.extend(child.render(self.name, self.label_names, values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self, name, names, values):
+        return [f'{name}{_format_labels(names, values)} {_format_value(self.value)}']
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def _child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set_function(self, function):
+        '''
+        the gauge reads function() when rendered, for values owned by other objects
+        '''
+        self.function = function
+
+    def get(self):
+        if self.function is None:
+            return self.value
+        try:
+            return self.function()
+        except Exception as e:
+            logger.error(f'gauge function failed: {e!r}')
+            return math.nan
+
+    def render(self, name, names, values):
+        value = self.get()
+        if value is None:
+            return []
+        return [f'{name}{_format_labels(names, values)} {_format_value(value)}']
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def _child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # one count per bucket, cumulated when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, names, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f'{name}_bucket{_format_labels(names, values, le)} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(names, values)} {_format_value(self.sum)}')
+        lines.append(f'{name}_count{_format_labels(names, values)} {self.count}')
+        return lines
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation='', labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class MetricsRegistry:
+    '''
+    Counters, gauges and histograms rendered in the Prometheus text format.
+
+    Updates are plain attribute increments on pre-resolved label children, no locks are
+    taken: metrics are updated from the event loop and read by the exporter on the same
+    loop. serve() exposes them on a local aiohttp /metrics endpoint.
+    '''
+    def __init__(self, prefix='noren_'):
+        self.prefix = prefix
+        self.__metrics = {}
+
+    def __register(self, cls, name, *args, **kwargs):
+        name = self.prefix + name
+        metric = self.__metrics.get(name)
+        if metric is None:
+            metric = self.__metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f'{name} is already registered as a {metric.type}')
+        return metric
+
+    def counter(self, name, documentation='', labels=()):
+        return self.__register(Counter, name, documentation, labels)
+
+    def gauge(self, name, documentation='', labels=()):
+        return self.__register(Gauge, name, documentation, labels)
+
+    def histogram(self, name, documentation='', labels=(), buckets=DEFAULT_BUCKETS):
+        return self.__register(Histogram, name, documentation, labels, buckets=buckets)
+
+    def get(self, name):
+        return self.__metrics.get(self.prefix + name)
+
+    def track_cache(self, name, cache):
+        '''
+        exports the hits, misses and hit ratio of a cache with hits/misses counters
+        (MarginCalculator, LimitsCache)
+        '''
+        hits = self.gauge('cache_hits', 'cache hits', ('cache',)).labels(name)
+        misses = self.gauge('cache_misses', 'cache misses', ('cache',)).labels(name)
+        ratio = self.gauge('cache_hit_ratio', 'cache hit ratio', ('cache',)).labels(name)
+        hits.set_function(lambda: cache.hits)
+        misses.set_function(lambda: cache.misses)
+        ratio.set_function(lambda: cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else None)
+
+    def render(self):
+        lines = []
+        for metric in self.__metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host='127.0.0.1', port=9100, path='/metrics'):
+        '''
+        starts a local /metrics endpoint, returns the aiohttp AppRunner (await runner.cleanup() to stop)
+        '''
+        from aiohttp import web
+
+        async def handler(request):
+            return web.Response(text=self.render(), content_type='text/plain', charset='utf-8',
+                                headers={'X-Content-Type-Options': 'nosniff'})
+
+        app = web.Application()
+        app.router.add_get(path, handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f'metrics served on http://{host}:{port}{path}')
+        return runner
+
+
+class ClientMetrics:
+    '''
+    metrics recorded by NorenApi when it is given a registry, labelled with the account so
+    that several clients can share one registry. requests sent before the login are
+    recorded under the account ''.
+    '''
+    def __init__(self, registry, account=''):
+        self.registry = registry
+        self.requests = registry.counter('requests_total', 'REST requests sent', ('account', 'route'))
+        self.errors = registry.counter('request_errors_total', 'REST requests failed or answered Not_Ok',
+                                       ('account', 'route'))
+        self.latency = registry.histogram('request_seconds', 'REST round trip time', ('account', 'route'))
+        self.__ticks = registry.counter('ticks_total', 'websocket feed messages received', ('account',))
+        self.__order_updates = registry.counter('order_updates_total', 'websocket order updates received',
+                                                ('account',))
+        self.__connects = registry.counter('websocket_connects_total', 'websocket connections opened', ('account',))
+        self.bind(account)
+
+    def bind(self, account):
+        '''
+        records the next updates under account
+        '''
+        self.account = account
+        self.ticks = self.__ticks.labels(account)
+        self.order_updates = self.__order_updates.labels(account)
+        self.connects = self.__connects.labels(account)
+        self.__routes = {}
+
+    def route(self, name):
+        children = self.__routes.get(name)
+        if children is None:
+            account = self.account
+            children = self.__routes[name] = (self.requests.labels(account, name), self.errors.labels(account, name),
+                                              self.latency.labels(account, name))
+        return children
+
+    def request(self, route, seconds, ok):
+        requests, errors, latency = self.route(route)
+        requests.inc()
+        latency.observe(seconds)
+        if not ok:
+            errors.inc()
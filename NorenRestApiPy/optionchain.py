@@ -0,0 +1,227 @@
+import asyncio
+import datetime
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .NorenApi import FeedType
+from .greeks import expiry_timestamp, implied_volatility, time_to_expiry
+
+logger = logging.getLogger(__name__)
+
+# chain column -> websocket field
+FIELDS = {
+    'ltp': 'lp',
+    'oi': 'oi',
+    'bid': 'bp1',
+    'ask': 'sp1',
+    'volume': 'v',
+}
+COLUMNS = list(FIELDS) + ['iv']
+SIDES = ('CE', 'PE')
+
+
+class OptionChain:
+    '''
+    Live option chain around the ATM strike of an underlying.
+
+    Strikes and tokens are resolved from the local SymbolMaster, the ATM strike comes
+    from the live LTP of the underlying and the contracts are subscribed in bulk. The
+    table keeps CE/PE columns (ltp, oi, bid, ask, volume) updated in O(1) per tick and
+    update_iv solves the iv column of the whole chain at once.
+    When the spot moves to another strike the window is shifted: only the strikes
+    entering or leaving it are subscribed or unsubscribed.
+    '''
+    def __init__(self, api, master, exchange, symbol, expiry, underlying, count=10,
+                 recenter_threshold=1, feed_type=FeedType.TOUCHLINE):
+        self.__api = api
+        self.exchange = exchange
+        self.symbol = symbol
+        self.expiry = int(expiry)
+        # 'EXCH|token' of the underlying, e.g. 'NSE|26000' for NIFTY
+        self.underlying = underlying
+        self.count = count
+        self.recenter_threshold = recenter_threshold
+        self.feed_type = feed_type
+
+        self.spot = None
+        self.__spot_event = asyncio.Event()
+        self.__tasks = set()
+
+        # every listed strike of the expiry and their tokens
+        rows = master.filter_rows(exchange, symbol=symbol, expiry=self.expiry)
+        columns = master.columns(exchange)
+        self.__tokens = {}
+        for row in rows:
+            optt = columns['optt'][row].decode()
+            if optt in SIDES:
+                self.__tokens[(float(columns['strike'][row]), optt)] = f"{exchange}|{columns['token'][row]}"
+
+        self.all_strikes = np.array(sorted({strike for strike, _ in self.__tokens}), dtype=np.float64)
+        if not len(self.all_strikes):
+            raise ValueError(f'no options listed for {exchange} {symbol} {expiry}')
+
+        size = 2 * count + 1
+        self.__center = None
+        self.strikes = np.full(size, np.nan)
+        self.table = {side: {column: np.full(size, np.nan) for column in COLUMNS} for side in SIDES}
+        # 'EXCH|token' -> (side, row)
+        self.__rows = {}
+
+    async def start(self, spot=None, timeout=10):
+        '''
+        subscribes the underlying and the strikes around its LTP,
+        spot can be given to avoid waiting for the first underlying tick
+        '''
+        self.__api.add_feed_listener(self.on_tick)
+        await self.__api.subscribe(self.underlying, self.feed_type)
+
+        if spot is not None:
+            self.spot = float(spot)
+        else:
+            await asyncio.wait_for(self.__spot_event.wait(), timeout)
+
+        await self.recenter()
+
+    async def stop(self):
+        self.__api.remove_feed_listener(self.on_tick)
+
+        # recenters still running would subscribe strikes after the unsubscribe below
+        tasks = list(self.__tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        keys = list(self.__rows)
+        if keys:
+            await self.__api.unsubscribe(keys, self.feed_type)
+        await self.__api.unsubscribe(self.underlying, self.feed_type)
+        self.__rows = {}
+
+    def atm_index(self, spot):
+        index = int(np.searchsorted(self.all_strikes, spot))
+        if index > 0 and (index == len(self.all_strikes) or
+                          spot - self.all_strikes[index - 1] <= self.all_strikes[index] - spot):
+            index -= 1
+        return index
+
+    @property
+    def atm(self):
+        return float(self.all_strikes[self.__center]) if self.__center is not None else None
+
+    async def recenter(self):
+        '''
+        moves the window to the strike nearest to the spot, keeping the rows that stay in it
+        '''
+        center = self.atm_index(self.spot)
+        if center == self.__center:
+            return
+
+        previous = self.__center
+        self.__center = center
+        size = 2 * self.count + 1
+        first = center - self.count
+
+        strikes = np.full(size, np.nan)
+        for row in range(size):
+            index = first + row
+            if 0 <= index < len(self.all_strikes):
+                strikes[row] = self.all_strikes[index]
+
+        # shift the rows that stay in the window
+        if previous is not None:
+            shift = previous - center
+            for side in SIDES:
+                for column, values in self.table[side].items():
+                    shifted = np.full(size, np.nan)
+                    if 0 <= shift < size:
+                        shifted[shift:] = values[:size - shift]
+                    elif -size < shift < 0:
+                        shifted[:size + shift] = values[-shift:]
+                    self.table[side][column] = shifted
+
+        rows = {}
+        for row, strike in enumerate(strikes):
+            if np.isnan(strike):
+                continue
+            for side in SIDES:
+                key = self.__tokens.get((strike, side))
+                if key is not None:
+                    rows[key] = (side, row)
+
+        added = [key for key in rows if key not in self.__rows]
+        removed = [key for key in self.__rows if key not in rows]
+
+        self.strikes = strikes
+        self.__rows = rows
+
+        if removed:
+            await self.__api.unsubscribe(removed, self.feed_type)
+        if added:
+            await self.__api.subscribe(added, self.feed_type)
+
+    def on_tick(self, message):
+        key = f"{message['e']}|{message['tk']}"
+
+        if key == self.underlying:
+            if 'lp' in message:
+                self.spot = float(message['lp'])
+                self.__spot_event.set()
+                self.__check_center()
+            return
+
+        location = self.__rows.get(key)
+        if location is None:
+            return
+
+        side, row = location
+        table = self.table[side]
+        for column, field in FIELDS.items():
+            value = message.get(field)
+            if value is not None:
+                table[column][row] = float(value)
+
+    def __check_center(self):
+        if self.__center is None:
+            return
+
+        center = self.atm_index(self.spot)
+        if abs(center - self.__center) >= self.recenter_threshold:
+            task = asyncio.create_task(self.recenter())
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+    def update_iv(self, rate=0.07, price='mid', now=None, model='black_scholes'):
+        '''
+        solves the iv column (in percent) of both sides from the mid (or ltp) prices and the spot,
+        every strike being warm started from its previous iv
+        '''
+        if self.spot is None:
+            return
+
+        expiry = expiry_timestamp(datetime.datetime.strptime(str(self.expiry), '%Y%m%d').date())
+        years = time_to_expiry(expiry, now)
+
+        for side in SIDES:
+            table = self.table[side]
+            prices = table['ltp']
+            if price == 'mid':
+                mid = (table['bid'] + table['ask']) / 2
+                prices = np.where((table['bid'] > 0) & (table['ask'] > 0), mid, prices)
+
+            table['iv'] = implied_volatility(prices, self.spot, self.strikes, years, rate, side == 'CE',
+                                             initial=table['iv'] / 100, model=model) * 100
+
+    def token(self, strike, side):
+        return self.__tokens.get((float(strike), side))
+
+    def frame(self):
+        '''
+        returns a snapshot of the chain as a DataFrame indexed by strike
+        '''
+        data = {}
+        for side in SIDES:
+            for column in COLUMNS:
+                data[f'{side.lower()}_{column}'] = self.table[side][column].copy()
+        return pd.DataFrame(data, index=pd.Index(self.strikes.copy(), name='strike'))
@@ -0,0 +1,252 @@
+import asyncio
+import logging
+
+import numpy as np
+import pandas as pd
+
+from .slicer import SecurityInfoCache
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ('netqty', 'avgprc', 'realized', 'ltp', 'mult')
+
+
+class PositionEngine:
+    '''
+    Real-time positions and MTM without polling get_positions.
+
+    The engine is seeded from one PositionBook and one OrderBook call per account, the
+    latter giving the fills already counted for orders still open. It then applies the
+    fills reported by the om order updates and marks every position to market from the
+    tk/tf feed. Positions are rows of numpy columns (net quantity, average price, realized P&L,
+    LTP, multiplier): a tick or a fill updates one row in O(1) and the unrealized P&L of
+    every position is computed in one vectorized pass.
+
+    A fill in a symbol without a position gets its multiplier from get_security_info and
+    its token subscribed, through the first api started.
+    '''
+    def __init__(self, master=None, capacity=256):
+        # optional SymbolMaster, resolves the token of symbols traded after seeding
+        self.__master = master
+        self.__size = 0
+        self.__columns = {name: np.zeros(capacity) for name in COLUMNS}
+        self.__columns['mult'][:] = 1
+        self.__columns['ltp'][:] = np.nan
+        # row -> (actid, exch, tsym, prd, token)
+        self.__keys = []
+        # (actid, exch, tsym, prd) -> row
+        self.__rows = {}
+        # 'EXCH|token' -> rows
+        self.__by_token = {}
+        # norenordno -> (filled quantity, filled value)
+        self.__orders = {}
+        # api resolving and subscribing the symbols first seen in a fill
+        self.__api = None
+        self.__info = None
+        self.__subscribe = False
+        self.__tasks = set()
+
+    def __len__(self):
+        return self.__size
+
+    def __grow(self):
+        for name, values in self.__columns.items():
+            grown = np.zeros(len(values) * 2)
+            grown[len(values):] = 1 if name == 'mult' else (np.nan if name == 'ltp' else 0)
+            grown[:len(values)] = values
+            self.__columns[name] = grown
+
+    def __row(self, actid, exch, tsym, prd, token=None, mult=1.0):
+        key = (actid, exch, tsym, prd)
+        row = self.__rows.get(key)
+        if row is not None:
+            return row
+
+        if token is None and self.__master is not None:
+            token = self.__master.token(exch, tsym)
+
+        if self.__size == len(self.__columns['netqty']):
+            self.__grow()
+
+        row = self.__size
+        self.__size += 1
+        self.__columns['mult'][row] = mult
+        self.__keys.append((actid, exch, tsym, prd, token))
+        self.__rows[key] = row
+
+        if token is not None:
+            self.__by_token.setdefault(f'{exch}|{token}', []).append(row)
+
+        return row
+
+    async def seed(self, api):
+        '''
+        loads the positions of one account from PositionBook and the fills of its orders from OrderBook
+        '''
+        ret = await api.get_positions()
+        if not isinstance(ret, list):
+            # no open positions come back as Not_Ok
+            logger.info(f'no positions loaded: {ret}')
+            ret = []
+
+        columns = self.__columns
+        for item in ret:
+            mult = float(item.get('mult', 1) or 1) * float(item.get('prcftr', 1) or 1)
+            row = self.__row(item.get('actid'), item['exch'], item['tsym'], item['prd'], item.get('token'), mult)
+            columns['netqty'][row] = float(item.get('netqty', 0) or 0)
+            columns['avgprc'][row] = float(item.get('netavgprc', 0) or 0)
+            columns['realized'][row] = float(item.get('rpnl', 0) or 0)
+            if item.get('lp'):
+                columns['ltp'][row] = float(item['lp'])
+
+        # the fills already in the positions, the next update of a partly filled order
+        # carries its cumulative fillshares
+        orders = await api.get_order_book()
+        for order in orders if isinstance(orders, list) else []:
+            filled = int(float(order.get('fillshares', 0) or 0))
+            if filled:
+                self.__orders[order['norenordno']] = (filled, filled * float(order.get('avgprc', 0) or 0))
+
+    async def start(self, api, subscribe=True):
+        '''
+        seeds the account, registers the order and feed listeners and subscribes the position tokens
+        '''
+        if self.__api is None:
+            self.__api = api
+            self.__info = SecurityInfoCache(api, self.__master)
+            self.__subscribe = subscribe
+
+        await self.seed(api)
+        api.add_order_listener(self.on_order_update)
+        api.add_feed_listener(self.on_tick)
+
+        if subscribe and self.__by_token:
+            await api.subscribe(list(self.__by_token))
+
+    def tokens(self):
+        return list(self.__by_token)
+
+    def on_tick(self, message):
+        lp = message.get('lp')
+        if lp is None:
+            return
+
+        rows = self.__by_token.get(f"{message['e']}|{message['tk']}")
+        if rows is not None:
+            self.__columns['ltp'][rows] = float(lp)
+
+    def on_order_update(self, message):
+        orderno = message.get('norenordno')
+        if orderno is None:
+            return
+
+        filled, value = self.__orders.get(orderno, (0, 0.0))
+
+        if 'fillshares' in message and 'avgprc' in message:
+            total = int(float(message['fillshares'] or 0))
+            if total <= filled:
+                return
+            total_value = total * float(message['avgprc'])
+            quantity, price = total - filled, (total_value - value) / (total - filled)
+            self.__orders[orderno] = (total, total_value)
+        elif message.get('reporttype') == 'Fill' and 'flqty' in message:
+            quantity, price = int(float(message['flqty'])), float(message['flprc'])
+            self.__orders[orderno] = (filled + quantity, value + quantity * price)
+        else:
+            return
+
+        if message.get('trantype') == 'S':
+            quantity = -quantity
+
+        key = (message.get('actid'), message['exch'], message['tsym'], message.get('prd'))
+        created = key not in self.__rows
+        row = self.__row(*key, message.get('token'))
+        self.apply_fill(row, quantity, price)
+
+        if created and self.__api is not None:
+            task = asyncio.ensure_future(self.__resolve(row))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+    async def __resolve(self, row):
+        actid, exch, tsym, prd, token = self.__keys[row]
+        info = await self.__info.get(exch, tsym)
+        if info is not None:
+            columns = self.__columns
+            mult = float(info.get('mult', 1) or 1) * float(info.get('prcftr', 1) or 1)
+            # the fills applied so far were realized with a multiplier of 1
+            columns['realized'][row] *= mult / columns['mult'][row]
+            columns['mult'][row] = mult
+
+            if token is None and info.get('token'):
+                token = info['token']
+                self.__keys[row] = (actid, exch, tsym, prd, token)
+                self.__by_token.setdefault(f'{exch}|{token}', []).append(row)
+
+        if token is None:
+            logger.error(f'no token for the position in {exch} {tsym}')
+            return
+
+        key = f'{exch}|{token}'
+        if self.__subscribe and self.__by_token[key] == [row]:
+            await self.__api.subscribe(key)
+
+    def apply_fill(self, row, quantity, price):
+        '''
+        applies a signed fill to a position, average cost accounting
+        '''
+        columns = self.__columns
+        net = columns['netqty'][row]
+        avg = columns['avgprc'][row]
+
+        # marked at the fill price until the first tick
+        if np.isnan(columns['ltp'][row]):
+            columns['ltp'][row] = price
+
+        if net == 0 or (net > 0) == (quantity > 0):
+            columns['avgprc'][row] = (avg * abs(net) + price * abs(quantity)) / (abs(net) + abs(quantity))
+            columns['netqty'][row] = net + quantity
+            return
+
+        closing = min(abs(quantity), abs(net))
+        columns['realized'][row] += closing * (price - avg) * np.sign(net) * columns['mult'][row]
+        columns['netqty'][row] = net + quantity
+
+        if net + quantity == 0:
+            columns['avgprc'][row] = 0
+        elif (net + quantity > 0) != (net > 0):
+            # the fill reversed the position
+            columns['avgprc'][row] = price
+
+    def unrealized(self):
+        '''
+        unrealized P&L of every position, one vectorized pass
+        '''
+        size = self.__size
+        columns = self.__columns
+        pnl = (columns['ltp'][:size] - columns['avgprc'][:size]) * columns['netqty'][:size] * columns['mult'][:size]
+        return np.nan_to_num(pnl)
+
+    def frame(self):
+        '''
+        returns the positions with their realized and unrealized P&L as a DataFrame
+        '''
+        size = self.__size
+        frame = pd.DataFrame(self.__keys, columns=['actid', 'exch', 'tsym', 'prd', 'token'])
+        for name in COLUMNS:
+            frame[name] = self.__columns[name][:size]
+        frame['unrealized'] = self.unrealized()
+        frame['total'] = frame['realized'] + frame['unrealized']
+        return frame
+
+    def pnl(self, by='tsym'):
+        '''
+        realized, unrealized and total P&L grouped by 'tsym', 'prd', 'actid' or a list of them
+        '''
+        return self.frame().groupby(by)[['realized', 'unrealized', 'total']].sum()
+
+    def total(self):
+        size = self.__size
+        realized = float(self.__columns['realized'][:size].sum())
+        unrealized = float(self.unrealized().sum())
+        return {'realized': realized, 'unrealized': unrealized, 'total': realized + unrealized}
@@ -0,0 +1,317 @@
+import asyncio
+import json
+import logging
+import struct
+
+from .callbacks import as_dispatcher
+from .feed import QuoteTable
+from .NorenApi import FeedType
+
+logger = logging.getLogger(__name__)
+
+# frame: payload length (uint32), kind (uint8), compact JSON payload
+HEADER = struct.Struct('>IB')
+FEED = 1
+ORDER = 2
+SUBSCRIBE = 3
+UNSUBSCRIBE = 4
+
+MAX_FRAME = 1 << 20
+
+
+def encode(kind, message):
+    payload = json.dumps(message, separators=(',', ':')).encode()
+    return HEADER.pack(len(payload), kind) + payload
+
+
+async def read_frame(reader):
+    length, kind = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_FRAME:
+        raise ValueError(f'frame of {length} bytes')
+    return kind, json.loads(await reader.readexactly(length))
+
+
+# levels 2-5 of the depth, absent from touchline messages
+DEPTH_FIELDS = frozenset(f'{side}{level}' for side in ('bp', 'sp', 'bq', 'sq', 'bo', 'so') for level in range(2, 6))
+
+
+def _feed_code(feed_type):
+    if feed_type in (FeedType.SNAPQUOTE, 'd'):
+        return 'd'
+    return 't'
+
+
+class _Client:
+    __slots__ = ('writer', 'subscriptions', 'name')
+
+    def __init__(self, writer):
+        self.writer = writer
+        # (key, 't' or 'd')
+        self.subscriptions = set()
+        self.name = writer.get_extra_info('peername') or writer.get_extra_info('sockname')
+
+
+class TickRelayServer:
+    '''
+    Shares one broker websocket with local processes.
+
+    The relay owns the upstream NorenApi feed and serves it on a Unix socket (path) or a
+    local TCP port with length prefixed frames. Each client subscribes its own
+    instruments: upstream subscriptions are reference counted across clients, a client
+    subscribing to an instrument already streamed gets its snapshot from the QuoteTable
+    at once, and ticks are only sent to the clients subscribed to their instrument and
+    feed (touchline or depth). Order updates are sent to every client. Clients whose send
+    buffer exceeds max_buffer bytes are disconnected instead of slowing down the others.
+    '''
+    def __init__(self, api, quotes=None, path=None, host='127.0.0.1', port=8765, max_buffer=4 << 20):
+        self.__api = api
+        self.quotes = quotes if quotes is not None else QuoteTable()
+        self.__own_quotes = quotes is None
+        self.path = path
+        self.host = host
+        self.port = port
+        self.max_buffer = max_buffer
+        self.__server = None
+        self.__clients = set()
+        # ('EXCH|token', 't' or 'd') -> clients
+        self.__routes = {}
+        # (key, feed) -> number of clients
+        self.__refcounts = {}
+
+    async def start(self):
+        if self.__own_quotes:
+            self.quotes.attach(self.__api)
+        self.__api.add_feed_listener(self.on_tick)
+        self.__api.add_order_listener(self.on_order_update)
+
+        if self.path is not None:
+            self.__server = await asyncio.start_unix_server(self.__serve, path=self.path)
+            logger.info(f'tick relay listening on {self.path}')
+        else:
+            self.__server = await asyncio.start_server(self.__serve, self.host, self.port)
+            logger.info(f'tick relay listening on {self.host}:{self.port}')
+
+    async def stop(self):
+        self.__api.remove_feed_listener(self.on_tick)
+        self.__api.remove_order_listener(self.on_order_update)
+        if self.__own_quotes:
+            self.quotes.detach(self.__api)
+
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+        for client in list(self.__clients):
+            client.writer.close()
+
+    def clients(self):
+        return len(self.__clients)
+
+    def on_tick(self, message):
+        # touchline (tk/tf) and depth (dk/df) messages only go to the clients of that feed
+        clients = self.__routes.get((f"{message['e']}|{message['tk']}", 'd' if message.get('t') in ('dk', 'df') else 't'))
+        if clients:
+            self.__broadcast(clients, encode(FEED, message))
+
+    def on_order_update(self, message):
+        if self.__clients:
+            self.__broadcast(self.__clients, encode(ORDER, message))
+
+    def __broadcast(self, clients, frame):
+        for client in list(clients):
+            transport = client.writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > self.max_buffer:
+                logger.error(f'relay client {client.name} too slow, disconnecting')
+                transport.abort()
+                continue
+            client.writer.write(frame)
+
+    async def __serve(self, reader, writer):
+        client = _Client(writer)
+        self.__clients.add(client)
+        logger.info(f'relay client {client.name} connected')
+
+        try:
+            while True:
+                kind, message = await read_frame(reader)
+                keys = message.get('k', [])
+                feed = _feed_code(message.get('t'))
+                if kind == SUBSCRIBE:
+                    await self.__subscribe(client, keys, feed)
+                elif kind == UNSUBSCRIBE:
+                    await self.__unsubscribe(client, keys, feed)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.exception(e)
+        finally:
+            self.__clients.discard(client)
+            await self.__unsubscribe(client, [key for key, _ in client.subscriptions], None)
+            writer.close()
+            logger.info(f'relay client {client.name} disconnected')
+
+    async def __subscribe(self, client, keys, feed):
+        upstream = []
+        for key in keys:
+            if (key, feed) in client.subscriptions:
+                continue
+            client.subscriptions.add((key, feed))
+            self.__routes.setdefault((key, feed), set()).add(client)
+
+            count = self.__refcounts.get((key, feed), 0)
+            self.__refcounts[(key, feed)] = count + 1
+            if count == 0:
+                upstream.append(key)
+                continue
+
+            # already streamed, the broker will not send the acknowledgement again
+            snapshot = self.quotes.snapshot(key)
+            if snapshot is not None:
+                if feed == 't':
+                    snapshot = {field: value for field, value in snapshot.items() if field not in DEPTH_FIELDS}
+                snapshot['t'] = 'dk' if feed == 'd' else 'tk'
+                client.writer.write(encode(FEED, snapshot))
+
+        if upstream:
+            await self.__api.subscribe(upstream, FeedType.SNAPQUOTE if feed == 'd' else FeedType.TOUCHLINE)
+
+    async def __unsubscribe(self, client, keys, feed):
+        upstream = {'t': [], 'd': []}
+        for key in keys:
+            for code in ((feed,) if feed is not None else ('t', 'd')):
+                if (key, code) not in client.subscriptions:
+                    continue
+                client.subscriptions.discard((key, code))
+                clients = self.__routes.get((key, code))
+                if clients is not None:
+                    clients.discard(client)
+                    if not clients:
+                        del self.__routes[(key, code)]
+
+                count = self.__refcounts.get((key, code), 0) - 1
+                if count <= 0:
+                    self.__refcounts.pop((key, code), None)
+                    upstream[code].append(key)
+                else:
+                    self.__refcounts[(key, code)] = count
+
+        for code, keys in upstream.items():
+            if keys:
+                try:
+                    await self.__api.unsubscribe(keys, FeedType.SNAPQUOTE if code == 'd' else FeedType.TOUCHLINE)
+                except Exception as e:
+                    logger.error(f'upstream unsubscribe failed: {e!r}')
+
+
+class RelayClient:
+    '''
+    Feed of a TickRelayServer with the websocket methods of NorenApi: start_websocket,
+    subscribe, unsubscribe, close_websocket and the feed/order listeners, so QuoteTable,
+    BarBuilder, OptionChain and the other components can be attached to it.
+    '''
+    def __init__(self, path=None, host='127.0.0.1', port=8765):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.__reader = None
+        self.__writer = None
+        self.__task = None
+        self.__subscribers = {}
+        self.__feed_listeners = []
+        self.__order_listeners = []
+        self.__subscribe_callback = None
+        self.__order_update_callback = None
+        self.__on_close = None
+        self.__on_error = None
+
+    async def start_websocket(self, subscribe_callback=None, order_update_callback=None, socket_open_callback=None,
+                              socket_close_callback=None, socket_error_callback=None):
+        self.__subscribe_callback = as_dispatcher(subscribe_callback)
+        self.__order_update_callback = as_dispatcher(order_update_callback)
+        self.__on_close = as_dispatcher(socket_close_callback)
+        self.__on_error = as_dispatcher(socket_error_callback)
+
+        if self.__task is not None:
+            return
+
+        if self.path is not None:
+            self.__reader, self.__writer = await asyncio.open_unix_connection(self.path)
+        else:
+            self.__reader, self.__writer = await asyncio.open_connection(self.host, self.port)
+        logger.info('relay connected')
+
+        self.__task = asyncio.create_task(self.__receive())
+        on_open = as_dispatcher(socket_open_callback)
+        if on_open is not None:
+            await on_open()
+
+    async def __receive(self):
+        try:
+            while True:
+                kind, message = await read_frame(self.__reader)
+                if kind == FEED:
+                    self.__notify(self.__feed_listeners, message)
+                    if self.__subscribe_callback is not None:
+                        await self.__subscribe_callback(message)
+                elif kind == ORDER:
+                    self.__notify(self.__order_listeners, message)
+                    if self.__order_update_callback is not None:
+                        await self.__order_update_callback(message)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.IncompleteReadError:
+            logger.info('relay closed the connection')
+        except Exception as e:
+            logger.error(e)
+            if self.__on_error is not None:
+                await self.__on_error(e)
+        finally:
+            self.__task = None
+            self.__writer.close()
+            if self.__on_close is not None:
+                await self.__on_close()
+
+    @staticmethod
+    def __notify(listeners, message):
+        for listener in listeners:
+            try:
+                listener(message)
+            except Exception as e:
+                logger.exception(e)
+
+    def close_websocket(self):
+        if self.__task is not None:
+            self.__task.cancel()
+
+    async def subscribe(self, instrument, feed_type=FeedType.TOUCHLINE):
+        instruments = instrument if type(instrument) == list else [instrument]
+        feed = _feed_code(feed_type)
+        for key in instruments:
+            self.__subscribers[key] = feed
+        self.__writer.write(encode(SUBSCRIBE, {'k': instruments, 't': feed}))
+        await self.__writer.drain()
+
+    async def unsubscribe(self, instrument, feed_type=FeedType.TOUCHLINE):
+        instruments = instrument if type(instrument) == list else [instrument]
+        for key in instruments:
+            self.__subscribers.pop(key, None)
+        self.__writer.write(encode(UNSUBSCRIBE, {'k': instruments, 't': _feed_code(feed_type)}))
+        await self.__writer.drain()
+
+    def get_subscriptions(self):
+        return dict(self.__subscribers)
+
+    def add_feed_listener(self, listener):
+        self.__feed_listeners.append(listener)
+
+    def remove_feed_listener(self, listener):
+        if listener in self.__feed_listeners:
+            self.__feed_listeners.remove(listener)
+
+    def add_order_listener(self, listener):
+        self.__order_listeners.append(listener)
+
+    def remove_order_listener(self, listener):
+        if listener in self.__order_listeners:
+            self.__order_listeners.remove(listener)
@@ -0,0 +1,256 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# order updates releasing the exposure of an order
+CLOSED_REPORTS = ('Canceled', 'Rejected')
+
+
+def _value(order, field, default=None):
+    if isinstance(order, dict):
+        return order.get(field, default)
+    return getattr(order, field, default)
+
+
+class RiskManager:
+    '''
+    In-process pre-trade checks run by NorenApi.place_order and modify_order.
+
+    Every check is optional: maximum quantity and notional per order, price band around
+    the LTP from a QuoteTable, lot size multiples from a SymbolMaster, exchange freeze
+    quantities, per-symbol exposure of the orders accepted so far and available funds
+    from a LimitsCache for delivery buys. A rejected order never leaves the process and
+    gets a Not_Ok response like a broker rejection.
+
+    check_batch validates a whole basket, the per-order checks in one vectorized pass and
+    the exposure and funds accumulated over the orders accepted so far.
+    '''
+    def __init__(self, quotes=None, master=None, limits=None, max_quantity=None, max_notional=None,
+                 price_band=None, max_exposure=None, freeze_quantities=None):
+        self.quotes = quotes
+        self.master = master
+        self.limits = limits
+        self.max_quantity = max_quantity
+        self.max_notional = max_notional
+        # allowed distance from the LTP as a fraction, 0.05 for 5%
+        self.price_band = price_band
+        # maximum absolute signed notional per (exchange, tradingsymbol)
+        self.max_exposure = max_exposure
+        # (exchange, tradingsymbol) -> freeze quantity, exclusive like frzqty
+        self.freeze_quantities = dict(freeze_quantities or {})
+
+        self.exposure = {}
+        # norenordno -> (exchange, tradingsymbol, signed notional, order fields)
+        self.__orders = {}
+
+    def attach(self, api):
+        api.set_risk_manager(self)
+        api.add_order_listener(self.on_order_update)
+
+    def detach(self, api):
+        api.set_risk_manager(None)
+        api.remove_order_listener(self.on_order_update)
+
+    def set_freeze_quantity(self, exchange, tradingsymbol, quantity):
+        self.freeze_quantities[(exchange, tradingsymbol)] = int(quantity)
+
+    def __ltp(self, exchange, tradingsymbol):
+        if self.quotes is None:
+            return None
+        quote = self.quotes.lookup(exchange, tradingsymbol)
+        if quote is None or 'lp' not in quote:
+            return None
+        return float(quote['lp'])
+
+    def __lot_size(self, exchange, tradingsymbol):
+        if self.master is None:
+            return 1
+        contract = self.master.lookup(exchange, tradingsymbol)
+        return contract['ls'] if contract is not None else 1
+
+    def __available_funds(self):
+        if self.limits is None:
+            return None
+        limits = self.limits.limits()
+        if limits is None:
+            return None
+        return (float(limits.get('cash', 0) or 0) + float(limits.get('payin', 0) or 0) -
+                float(limits.get('marginused', 0) or 0))
+
+    def check_order(self, buy_or_sell, product_type, exchange, tradingsymbol, quantity, price_type,
+                    price=0.0, trigger_price=None, orderno=None):
+        '''
+        returns the reason for rejecting an order, None when every check passes.
+        for a modification, orderno replaces the exposure of the original order. without
+        buy_or_sell (modification of an order not placed through this manager) the exposure
+        check is skipped.
+        '''
+        quantity = int(quantity)
+        price = float(price or 0)
+        ltp = self.__ltp(exchange, tradingsymbol)
+        reference = price if price > 0 else (float(trigger_price) if trigger_price else ltp)
+
+        if quantity <= 0:
+            return f'invalid quantity {quantity}'
+
+        if self.max_quantity is not None and quantity > self.max_quantity:
+            return f'quantity {quantity} above the maximum {self.max_quantity}'
+
+        lot_size = self.__lot_size(exchange, tradingsymbol)
+        if quantity % lot_size:
+            return f'quantity {quantity} is not a multiple of the lot size {lot_size}'
+
+        freeze = self.freeze_quantities.get((exchange, tradingsymbol))
+        # frzqty is exclusive, an order of exactly the freeze quantity is frozen
+        if freeze is not None and quantity >= freeze:
+            return f'quantity {quantity} at or above the freeze quantity {freeze}'
+
+        if self.price_band is not None and ltp and price > 0 and abs(price - ltp) > self.price_band * ltp:
+            return f'price {price} outside the {self.price_band:.2%} band around the ltp {ltp}'
+
+        if reference is None:
+            # market order without any quote, notional checks cannot be made
+            return None
+
+        notional = quantity * reference
+        if self.max_notional is not None and notional > self.max_notional:
+            return f'notional {notional:.2f} above the maximum {self.max_notional}'
+
+        if self.max_exposure is not None and buy_or_sell is not None:
+            signed = notional if buy_or_sell == 'B' else -notional
+            current = self.exposure.get((exchange, tradingsymbol), 0.0)
+            if orderno is not None and str(orderno) in self.__orders:
+                current -= self.__orders[str(orderno)][2]
+            if abs(current + signed) > self.max_exposure:
+                return f'exposure {current + signed:.2f} on {tradingsymbol} above the maximum {self.max_exposure}'
+
+        if product_type == 'C' and buy_or_sell == 'B':
+            funds = self.__available_funds()
+            if funds is not None and notional > funds:
+                return f'notional {notional:.2f} above the available funds {funds:.2f}'
+
+        return None
+
+    def check_modify(self, orderno, exchange, tradingsymbol, quantity, price_type, price=0.0, trigger_price=None):
+        order = self.__orders.get(str(orderno))
+        buy_or_sell = order[3]['buy_or_sell'] if order is not None else None
+        product_type = order[3]['product_type'] if order is not None else None
+        return self.check_order(buy_or_sell, product_type, exchange, tradingsymbol, quantity, price_type,
+                                price, trigger_price, orderno=orderno)
+
+    def on_order_placed(self, response, buy_or_sell, product_type, exchange, tradingsymbol, quantity,
+                        price_type, price=0.0, trigger_price=None, orderno=None):
+        '''
+        records the exposure of an order accepted by the broker
+        '''
+        if not isinstance(response, dict) or response.get('stat') != 'Ok':
+            return
+
+        orderno = str(orderno or response.get('norenordno'))
+        previous = self.__orders.pop(orderno, None)
+        if previous is not None:
+            self.__release(previous)
+            buy_or_sell = buy_or_sell or previous[3]['buy_or_sell']
+            product_type = product_type or previous[3]['product_type']
+        if buy_or_sell is None:
+            # modification of an order not placed through this manager, its side is unknown
+            return
+
+        price = float(price or 0)
+        reference = price if price > 0 else (float(trigger_price) if trigger_price else
+                                             self.__ltp(exchange, tradingsymbol) or 0.0)
+        notional = int(quantity) * reference
+        signed = notional if buy_or_sell == 'B' else -notional
+
+        key = (exchange, tradingsymbol)
+        self.exposure[key] = self.exposure.get(key, 0.0) + signed
+        self.__orders[orderno] = (exchange, tradingsymbol, signed,
+                                  {'buy_or_sell': buy_or_sell, 'product_type': product_type})
+
+    def __release(self, order):
+        key = (order[0], order[1])
+        self.exposure[key] = self.exposure.get(key, 0.0) - order[2]
+
+    def on_order_update(self, message):
+        if message.get('reporttype') in CLOSED_REPORTS:
+            order = self.__orders.pop(str(message.get('norenordno')), None)
+            if order is not None:
+                self.__release(order)
+
+    def check_batch(self, orders):
+        '''
+        validates a basket in one pass, orders being dicts or objects with the place_order
+        argument names. returns one rejection reason (or None) per order; exposure accumulates
+        across the orders of the basket.
+        '''
+        count = len(orders)
+        exchanges = [_value(order, 'exchange') for order in orders]
+        tsyms = [_value(order, 'tradingsymbol') for order in orders]
+        sides = np.array([_value(order, 'buy_or_sell') == 'B' for order in orders], dtype=bool)
+        products = np.array([_value(order, 'product_type') == 'C' for order in orders], dtype=bool)
+        quantity = np.array([int(_value(order, 'quantity', 0) or 0) for order in orders], dtype=np.int64)
+        price = np.array([float(_value(order, 'price', 0) or 0) for order in orders], dtype=np.float64)
+        trigger = np.array([float(_value(order, 'trigger_price', 0) or 0) for order in orders], dtype=np.float64)
+        ltp = np.array([self.__ltp(e, t) or np.nan for e, t in zip(exchanges, tsyms)], dtype=np.float64)
+        lot_size = np.array([self.__lot_size(e, t) for e, t in zip(exchanges, tsyms)], dtype=np.int64)
+        freeze = np.array([self.freeze_quantities.get((e, t), np.iinfo(np.int64).max)
+                           for e, t in zip(exchanges, tsyms)], dtype=np.int64)
+
+        reference = np.where(price > 0, price, np.where(trigger > 0, trigger, ltp))
+        notional = quantity * reference
+        signed = np.where(sides, notional, -notional)
+
+        reasons = [None] * count
+        rejected = np.zeros(count, dtype=bool)
+
+        # the first failing check gives the reason of an order
+        def reject(mask, message):
+            mask = mask & ~rejected
+            rejected[mask] = True
+            for i in np.flatnonzero(mask):
+                reasons[i] = message(i)
+
+        reject(quantity <= 0, lambda i: f'invalid quantity {quantity[i]}')
+        if self.max_quantity is not None:
+            reject(quantity > self.max_quantity, lambda i: f'quantity {quantity[i]} above the maximum {self.max_quantity}')
+        reject(quantity % lot_size != 0,
+               lambda i: f'quantity {quantity[i]} is not a multiple of the lot size {lot_size[i]}')
+        reject(quantity >= freeze, lambda i: f'quantity {quantity[i]} at or above the freeze quantity {freeze[i]}')
+
+        if self.price_band is not None:
+            with np.errstate(invalid='ignore'):
+                outside = (price > 0) & (ltp > 0) & (np.abs(price - ltp) > self.price_band * ltp)
+            reject(outside, lambda i: f'price {price[i]} outside the {self.price_band:.2%} band around the ltp {ltp[i]}')
+
+        known = np.isfinite(notional)
+        if self.max_notional is not None:
+            reject(known & (notional > self.max_notional),
+                   lambda i: f'notional {notional[i]:.2f} above the maximum {self.max_notional}')
+
+        # running exposure per symbol and delivery buys through the basket, only the orders
+        # accepted so far count towards the next ones
+        funds = self.__available_funds()
+        if self.max_exposure is None and funds is None:
+            return reasons
+
+        exposure = {}
+        spent = 0.0
+        for i in np.flatnonzero(~rejected & known):
+            key = (exchanges[i], tsyms[i])
+            total = exposure.get(key, self.exposure.get(key, 0.0)) + signed[i]
+            if self.max_exposure is not None and abs(total) > self.max_exposure:
+                reasons[i] = f'exposure {total:.2f} on {tsyms[i]} above the maximum {self.max_exposure}'
+                continue
+
+            buy = products[i] and sides[i]
+            if funds is not None and buy and spent + notional[i] > funds:
+                reasons[i] = f'basket notional {spent + notional[i]:.2f} above the available funds {funds:.2f}'
+                continue
+
+            exposure[key] = total
+            if buy:
+                spent += notional[i]
+
+        return reasons
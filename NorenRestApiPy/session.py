@@ -0,0 +1,168 @@
+import asyncio
+import datetime
+import inspect
+import json
+import logging
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locking on windows, workers may then log in concurrently
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+# error messages of a request sent with an invalid or expired susertoken
+SESSION_ERRORS = ('Session Expired', 'Invalid Session Key')
+
+
+def is_session_error(response):
+    if not isinstance(response, dict) or response.get('stat') != 'Not_Ok':
+        return False
+    emsg = response.get('emsg', '')
+    return any(error in emsg for error in SESSION_ERRORS)
+
+
+def next_reset(now=None, reset=datetime.time(5, 0)):
+    '''
+    epoch of the next daily session reset, by default 05:00 IST
+    '''
+    now = datetime.datetime.fromtimestamp(now if now is not None else time.time(), IST)
+    expiry = datetime.datetime.combine(now.date(), reset, IST)
+    if expiry <= now:
+        expiry += datetime.timedelta(days=1)
+    return expiry.timestamp()
+
+
+class SessionStore:
+    '''
+    susertoken of every user persisted in a JSON file readable by the owner only.
+
+    SessionStore.login restores a saved token through set_session and validates it with
+    the cheap MWList call; QuickAuth is only sent when no valid token exists. The whole
+    sequence runs under an exclusive file lock, so N workers starting together share the
+    token obtained by the first one instead of logging in N times.
+    '''
+    def __init__(self, path, reset=datetime.time(5, 0)):
+        self.path = path
+        # tokens saved before this IST time of day are considered expired after it
+        self.reset = reset
+        self.__lock = asyncio.Lock()
+
+    def __read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.error(f'ignoring corrupted session file {self.path}')
+            return {}
+
+    def __write(self, sessions):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(sessions, f)
+        os.replace(tmp, self.path)
+
+    def load(self, userid):
+        '''
+        returns the saved session of a user, None when missing or expired
+        '''
+        session = self.__read().get(userid)
+        if session is None or session.get('expires', 0) <= time.time():
+            return None
+        return session
+
+    def save(self, userid, susertoken, expires=None):
+        now = time.time()
+        sessions = self.__read()
+        sessions[userid] = {'susertoken': susertoken, 'created': now,
+                            'expires': expires if expires is not None else next_reset(now, self.reset)}
+        self.__write(sessions)
+
+    def remove(self, userid):
+        sessions = self.__read()
+        if sessions.pop(userid, None) is not None:
+            self.__write(sessions)
+
+    def __acquire(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(f'{self.path}.lock', os.O_RDWR | os.O_CREAT, 0o600)
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    @staticmethod
+    def __release(fd):
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    async def login(self, api, userid, password, twoFA, vendor_code, api_secret, imei):
+        '''
+        restores the session of a user or logs in when there is no valid one.
+        twoFA may be a function (sync or async) returning the OTP/TOTP, it is only
+        called when a login is needed. returns the login response or
+        {'stat': 'Ok', 'susertoken': ..., 'restored': True}.
+        '''
+        loop = asyncio.get_running_loop()
+        async with self.__lock:
+            # flock blocks, wait for the other workers in a thread
+            fd = await loop.run_in_executor(None, self.__acquire)
+            try:
+                return await self.__login(api, userid, password, twoFA, vendor_code, api_secret, imei)
+            finally:
+                self.__release(fd)
+
+    async def __login(self, api, userid, password, twoFA, vendor_code, api_secret, imei):
+        session = self.load(userid)
+        if session is not None:
+            api.set_session(userid, password, session['susertoken'])
+            ret = await api.get_watch_list_names()
+            if not is_session_error(ret):
+                logger.info(f'{userid} session restored')
+                return {'stat': 'Ok', 'susertoken': session['susertoken'], 'restored': True}
+            logger.info(f'{userid} saved session rejected: {ret}')
+
+        if callable(twoFA):
+            twoFA = twoFA()
+            if inspect.isawaitable(twoFA):
+                twoFA = await twoFA
+
+        ret = await api.login(userid=userid, password=password, twoFA=twoFA, vendor_code=vendor_code,
+                              api_secret=api_secret, imei=imei)
+        return self.__store(userid, ret)
+
+    def __store(self, userid, ret):
+        if isinstance(ret, dict) and ret.get('stat') == 'Ok' and ret.get('susertoken'):
+            self.save(userid, ret['susertoken'])
+        else:
+            self.remove(userid)
+        return ret
+
+    async def renew(self, userid, expired_token, login):
+        '''
+        re-login after a session expiry, under the same locks as login: a token saved by
+        another worker since expired_token was issued is returned as restored, otherwise
+        login (a coroutine function returning the login response) is awaited and its token
+        saved. used by NorenApi when the credentials provider is given a store.
+        '''
+        loop = asyncio.get_running_loop()
+        async with self.__lock:
+            fd = await loop.run_in_executor(None, self.__acquire)
+            try:
+                session = self.load(userid)
+                if session is not None and session['susertoken'] != expired_token:
+                    logger.info(f'{userid} session renewed by another worker')
+                    return {'stat': 'Ok', 'susertoken': session['susertoken'], 'restored': True}
+
+                return self.__store(userid, await login())
+            finally:
+                self.__release(fd)
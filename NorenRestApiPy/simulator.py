@@ -0,0 +1,667 @@
+import asyncio
+import datetime
+import heapq
+import json
+import logging
+import random
+import urllib.parse
+
+from aiohttp import web, WSMsgType
+
+from .frames import tpseries_arrays
+
+logger = logging.getLogger(__name__)
+
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+FINAL_STATUS = ('COMPLETE', 'CANCELED', 'REJECTED')
+
+
+def _price(value):
+    return f'{value:.2f}'
+
+
+def _clock(epoch):
+    return datetime.datetime.fromtimestamp(epoch, IST)
+
+
+class _Instrument:
+    __slots__ = ('exch', 'token', 'tsym', 'ls', 'ti', 'lp', 'o', 'h', 'l', 'c', 'v', 'value', 'bids', 'asks',
+                 'stops')
+
+    def __init__(self, exch, token, tsym, ls, ti):
+        self.exch = exch
+        self.token = token
+        self.tsym = tsym
+        self.ls = ls
+        self.ti = ti
+        self.lp = None
+        self.o = self.h = self.l = self.c = None
+        self.v = 0
+        self.value = 0.0
+        # resting orders, (-price, seq, order) and (price, seq, order)
+        self.bids = []
+        self.asks = []
+        # stop orders waiting for their trigger
+        self.stops = []
+
+    @property
+    def key(self):
+        return f'{self.exch}|{self.token}'
+
+    def bid(self, spread):
+        return round(self.lp - spread * self.ti, 2)
+
+    def ask(self, spread):
+        return round(self.lp + spread * self.ti, 2)
+
+    def trade(self, price, volume):
+        self.lp = price
+        if self.o is None:
+            self.o = self.h = self.l = price
+        self.h = max(self.h, price)
+        self.l = min(self.l, price)
+        self.v += volume
+        self.value += price * volume
+
+    def quote(self, spread, depth=False):
+        ap = self.value / self.v if self.v else self.lp
+        quote = {'e': self.exch, 'tk': self.token, 'lp': _price(self.lp), 'v': str(self.v), 'ap': _price(ap),
+                 'o': _price(self.o), 'h': _price(self.h), 'l': _price(self.l),
+                 'pc': _price((self.lp - self.c) / self.c * 100 if self.c else 0.0),
+                 'bp1': _price(self.bid(spread)), 'sp1': _price(self.ask(spread))}
+        if depth:
+            for level in range(2, 6):
+                quote[f'bp{level}'] = _price(self.bid(spread + level - 1))
+                quote[f'sp{level}'] = _price(self.ask(spread + level - 1))
+        return quote
+
+
+class _Order:
+    __slots__ = ('norenordno', 'uid', 'actid', 'exch', 'tsym', 'token', 'trantype', 'prd', 'prctyp', 'qty', 'prc',
+                 'trgprc', 'ret', 'remarks', 'dscqty', 'status', 'filled', 'value', 'rejreason', 'seq', 'history',
+                 'norentm')
+
+    def message(self, reporttype, **fields):
+        message = {'t': 'om', 'norenordno': self.norenordno, 'uid': self.uid, 'actid': self.actid,
+                   'exch': self.exch, 'tsym': self.tsym, 'token': self.token, 'trantype': self.trantype,
+                   'prd': self.prd, 'prctyp': self.prctyp, 'qty': str(self.qty), 'prc': _price(self.prc),
+                   'ret': self.ret, 'status': self.status, 'reporttype': reporttype, 'dscqty': str(self.dscqty),
+                   'norentm': self.norentm, 'exchordid': self.norenordno}
+        if self.trgprc:
+            message['trgprc'] = _price(self.trgprc)
+        if self.remarks:
+            message['remarks'] = self.remarks
+        if self.filled:
+            message['fillshares'] = str(self.filled)
+            message['avgprc'] = _price(self.value / self.filled)
+        if self.rejreason:
+            message['rejreason'] = self.rejreason
+        message.update(fields)
+        return message
+
+    @property
+    def remaining(self):
+        return self.qty - self.filled
+
+
+class ExchangeSimulator:
+    '''
+    Local broker backend for backtests and load tests through the unchanged NorenApi.
+
+    An aiohttp server exposes the REST routes used for trading (QuickAuth, PlaceOrder,
+    ModifyOrder, CancelOrder, OrderBook, SingleOrdHist, TradeBook, PositionBook, Limits,
+    GetQuotes) and the websocket. Historical TPSeries candles or recorded ticks are
+    replayed on a virtual clock as tk/tf (dk/df for depth subscriptions) messages.
+
+    Resting orders are matched against the replayed trades in price-time priority and fill
+    at their limit price, each trade filling at most its volume; market orders and marketable limit orders fill at
+    the simulated touch, `spread` ticks around the last price. Fills, modifications,
+    cancellations and rejections are sent as om messages. The intra-candle price path
+    comes from a seeded generator, so a run is deterministic for a seed, and run() goes
+    as fast as the event loop allows unless a speed factor is given.
+    '''
+    def __init__(self, seed=0, host='127.0.0.1', port=0, spread=1, cash=10000000.0):
+        self.seed = seed
+        self.spread = spread
+        self.cash = cash
+        self.__random = random.Random(seed)
+        self.__host = host
+        self.__port = port
+        self.__runner = None
+        self.now = None
+
+        self.__instruments = {}
+        self.__by_tsym = {}
+        # (time, sequence, key, price, volume)
+        self.__events = []
+        self.__sequence = 0
+
+        self.__orders = {}
+        self.__trades = []
+        self.__order_seq = 0
+        self.__sessions = {}
+        # websocket -> {'uid', 'keys': {key: depth}}
+        self.__sockets = {}
+
+    # data
+
+    def __instrument(self, exchange, token, tradingsymbol, lot_size, tick_size):
+        key = f'{exchange}|{token}'
+        instrument = self.__instruments.get(key)
+        if instrument is None:
+            instrument = _Instrument(exchange, str(token), tradingsymbol or str(token), int(lot_size), tick_size)
+            self.__instruments[key] = instrument
+            self.__by_tsym[(exchange, instrument.tsym)] = instrument
+        return instrument
+
+    def __push(self, timestamp, key, price, volume):
+        self.__sequence += 1
+        heapq.heappush(self.__events, (timestamp, self.__sequence, key, price, volume))
+
+    def load_ticks(self, exchange, token, ticks, tradingsymbol=None, lot_size=1, tick_size=0.05):
+        '''
+        queues recorded trades, ticks being (epoch seconds, price, volume) tuples
+        '''
+        instrument = self.__instrument(exchange, token, tradingsymbol, lot_size, tick_size)
+        for timestamp, price, volume in ticks:
+            self.__push(float(timestamp), instrument.key, float(price), int(volume))
+
+    def load_tpseries(self, exchange, token, rows, tradingsymbol=None, lot_size=1, tick_size=0.05, interval=60):
+        '''
+        queues a TPSeries response (candles of `interval` seconds) as four trades per candle:
+        open, high and low in a seeded order, close
+        '''
+        instrument = self.__instrument(exchange, token, tradingsymbol, lot_size, tick_size)
+        columns = tpseries_arrays(rows)
+        step = interval / 4
+        for i in range(len(columns['time'])):
+            start = float(columns['time'][i])
+            o, h, l, c = (float(columns[field][i]) for field in ('into', 'inth', 'intl', 'intc'))
+            volume = int(columns['intv'][i]) if columns['intv'][i] == columns['intv'][i] else 0
+            path = (o, h, l, c) if self.__random.random() < 0.5 else (o, l, h, c)
+            share = volume // 4
+            volumes = (share, share, share, volume - 3 * share)
+            for n, (price, part) in enumerate(zip(path, volumes)):
+                self.__push(start + n * step, instrument.key, price, part)
+
+    # server
+
+    @property
+    def host(self):
+        return f'http://{self.__host}:{self.__port}/NorenWClientTP'
+
+    @property
+    def websocket(self):
+        return f'ws://{self.__host}:{self.__port}/NorenWSTP/'
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/NorenWSTP/', self.__websocket)
+        app.router.add_post('/NorenWClientTP/{route}', self.__rest)
+        self.__runner = web.AppRunner(app)
+        await self.__runner.setup()
+        site = web.TCPSite(self.__runner, self.__host, self.__port)
+        await site.start()
+        # port 0 picks a free port
+        self.__port = site._server.sockets[0].getsockname()[1]
+        logger.info(f'simulator listening on {self.host}')
+
+    async def stop(self):
+        for ws in list(self.__sockets):
+            await ws.close()
+        if self.__runner is not None:
+            await self.__runner.cleanup()
+
+    def client(self, **kwargs):
+        '''
+        returns a NorenApi connected to the simulator
+        '''
+        from .NorenApi import NorenApi
+        return NorenApi(host=self.host, websocket=self.websocket, **kwargs)
+
+    # replay
+
+    def __clock(self):
+        return _clock(self.now if self.now is not None else 0)
+
+    async def run(self, speed=None, until=None):
+        '''
+        replays the queued trades up to `until` (epoch seconds), as fast as possible or
+        `speed` times faster than real time. returns the number of trades replayed.
+        '''
+        count = 0
+        loop = asyncio.get_running_loop()
+        started = None
+        while self.__events and (until is None or self.__events[0][0] <= until):
+            timestamp, _, key, price, volume = heapq.heappop(self.__events)
+
+            if speed is not None:
+                if started is None:
+                    started = (loop.time(), timestamp)
+                delay = started[0] + (timestamp - started[1]) / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            self.now = timestamp
+            await self.__trade(self.__instruments[key], price, volume)
+            count += 1
+            # let the clients process the messages
+            await asyncio.sleep(0)
+
+        if until is not None:
+            self.now = max(self.now or until, until)
+        return count
+
+    async def __trade(self, instrument, price, volume):
+        first = instrument.lp is None
+        instrument.trade(price, volume)
+
+        await self.__publish(instrument, first)
+        await self.__trigger_stops(instrument)
+        await self.__match(instrument, price, volume)
+
+    async def __publish(self, instrument, first):
+        for ws, client in list(self.__sockets.items()):
+            depth = client['keys'].get(instrument.key)
+            if depth is None:
+                continue
+            message = instrument.quote(self.spread, depth)
+            message['t'] = ('dk' if depth else 'tk') if first else ('df' if depth else 'tf')
+            message['ft'] = str(int(self.now))
+            if first:
+                message.update({'ts': instrument.tsym, 'ls': str(instrument.ls), 'ti': str(instrument.ti)})
+            await self.__send(ws, message)
+
+    async def __send(self, ws, message):
+        try:
+            await ws.send_str(json.dumps(message))
+        except Exception as e:
+            logger.error(f'websocket send failed: {e!r}')
+            self.__sockets.pop(ws, None)
+
+    async def __notify(self, order, reporttype, **fields):
+        order.norentm = self.__clock().strftime('%H:%M:%S %d-%m-%Y')
+        message = order.message(reporttype, **fields)
+        order.history.append(message)
+        for ws, client in list(self.__sockets.items()):
+            if client['uid'] == order.uid:
+                await self.__send(ws, message)
+
+    # matching
+
+    def __rest_order(self, instrument, order):
+        self.__order_seq += 1
+        order.seq = self.__order_seq
+        if order.trantype == 'B':
+            heapq.heappush(instrument.bids, (-order.prc, order.seq, order))
+        else:
+            heapq.heappush(instrument.asks, (order.prc, order.seq, order))
+
+    async def __fill(self, order, price, quantity):
+        order.filled += quantity
+        order.value += price * quantity
+        if order.remaining == 0:
+            order.status = 'COMPLETE'
+        self.__trades.append((order, price, quantity, self.now))
+        await self.__notify(order, 'Fill', flqty=str(quantity), flprc=_price(price), flid=str(len(self.__trades)),
+                            fltm=self.__clock().strftime('%d-%m-%Y %H:%M:%S'))
+
+    async def __match(self, instrument, price, volume):
+        # resting orders priced through the trade fill at their limit in price-time priority, up to its volume
+        available = volume if volume > 0 else None
+        for book, crosses in ((instrument.bids, lambda p: -p >= price), (instrument.asks, lambda p: p <= price)):
+            while book and (available is None or available > 0):
+                key, seq, order = book[0]
+                if order.status != 'OPEN' or seq != order.seq:
+                    # canceled, filled or modified since it was queued
+                    heapq.heappop(book)
+                    continue
+                if not crosses(key):
+                    break
+                quantity = order.remaining if available is None else min(order.remaining, available)
+                if available is not None:
+                    available -= quantity
+                await self.__fill(order, order.prc, quantity)
+                if order.remaining == 0:
+                    heapq.heappop(book)
+
+    async def __trigger_stops(self, instrument):
+        triggered = [order for order in instrument.stops if order.status == 'TRIGGER_PENDING' and (
+            instrument.lp >= order.trgprc if order.trantype == 'B' else instrument.lp <= order.trgprc)]
+        if not triggered:
+            return
+        instrument.stops = [order for order in instrument.stops if order not in triggered]
+        for order in sorted(triggered, key=lambda order: order.seq):
+            order.status = 'OPEN'
+            order.prctyp = 'LMT' if order.prctyp == 'SL-LMT' else 'MKT'
+            await self.__notify(order, 'TriggerHit')
+            await self.__execute(instrument, order)
+
+    async def __execute(self, instrument, order):
+        '''
+        fills a new or triggered order at the touch when marketable, otherwise rests it
+        '''
+        if instrument.lp is not None:
+            if order.trantype == 'B':
+                touch = instrument.ask(self.spread)
+                marketable = order.prctyp == 'MKT' or order.prc >= touch
+            else:
+                touch = instrument.bid(self.spread)
+                marketable = order.prctyp == 'MKT' or order.prc <= touch
+            if marketable:
+                await self.__fill(order, touch, order.remaining)
+                return
+
+        if order.prctyp == 'MKT':
+            order.status = 'REJECTED'
+            order.rejreason = 'no market price'
+            await self.__notify(order, 'Rejected')
+            return
+
+        self.__rest_order(instrument, order)
+
+    # rest api
+
+    async def __rest(self, request):
+        route = request.match_info['route']
+        body = await request.text()
+        data, _, key = body.partition('&jKey=')
+        try:
+            values = json.loads(data[len('jData='):])
+        except ValueError:
+            return web.json_response({'stat': 'Not_Ok', 'emsg': 'Invalid Input : jData is invalid'})
+
+        if route == 'QuickAuth':
+            return web.json_response(self.__login(values))
+
+        uid = self.__sessions.get(key)
+        if uid is None:
+            return web.json_response({'stat': 'Not_Ok', 'emsg': 'Session Expired :  Invalid Session Key'})
+
+        handler = {
+            'PlaceOrder': self.__place_order,
+            'ModifyOrder': self.__modify_order,
+            'CancelOrder': self.__cancel_order,
+            'OrderBook': self.__order_book,
+            'SingleOrdHist': self.__order_history,
+            'TradeBook': self.__trade_book,
+            'PositionBook': self.__position_book,
+            'Limits': self.__limits,
+            'GetQuotes': self.__quotes,
+            'MWList': self.__watch_lists,
+            'Logout': self.__logout,
+        }.get(route)
+        if handler is None:
+            return web.json_response({'stat': 'Not_Ok', 'emsg': f'{route} is not simulated'})
+
+        result = handler(uid, values, key)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return web.json_response(result)
+
+    def __login(self, values):
+        uid = values.get('uid')
+        if not uid:
+            return {'stat': 'Not_Ok', 'emsg': 'Invalid Input : uid'}
+        susertoken = f'sim{self.seed}{uid}{len(self.__sessions)}'
+        self.__sessions[susertoken] = uid
+        return {'stat': 'Ok', 'susertoken': susertoken, 'uname': uid, 'actid': uid,
+                'request_time': self.__clock().strftime('%H:%M:%S %d-%m-%Y')}
+
+    def __logout(self, uid, values, key):
+        self.__sessions.pop(key, None)
+        return {'stat': 'Ok'}
+
+    def __watch_lists(self, uid, values, key):
+        return {'stat': 'Ok', 'values': ['1']}
+
+    async def __place_order(self, uid, values, key):
+        tsym = urllib.parse.unquote_plus(values.get('tsym', ''))
+        instrument = self.__by_tsym.get((values.get('exch'), tsym))
+        if instrument is None:
+            return {'stat': 'Not_Ok', 'emsg': 'Invalid Trading Symbol'}
+
+        order = _Order()
+        order.norenordno = f'{_clock(self.now or 0).strftime("%y%m%d")}{len(self.__orders) + 1:08d}'
+        order.uid = uid
+        order.actid = values.get('actid', uid)
+        order.exch = instrument.exch
+        order.tsym = instrument.tsym
+        order.token = instrument.token
+        order.trantype = values.get('trantype')
+        order.prd = values.get('prd')
+        order.prctyp = values.get('prctyp')
+        order.qty = int(values.get('qty', 0))
+        order.prc = float(values.get('prc') or 0)
+        order.trgprc = float(values['trgprc']) if values.get('trgprc') not in (None, 'None', '') else None
+        order.ret = values.get('ret', 'DAY')
+        order.remarks = values.get('remarks') if values.get('remarks') != 'None' else None
+        order.dscqty = int(values.get('dscqty') or 0)
+        order.filled = 0
+        order.value = 0.0
+        order.rejreason = None
+        order.seq = 0
+        order.history = []
+        order.status = 'PENDING'
+        self.__orders[order.norenordno] = order
+
+        response = {'stat': 'Ok', 'norenordno': order.norenordno,
+                    'request_time': self.__clock().strftime('%H:%M:%S %d-%m-%Y')}
+        asyncio.ensure_future(self.__accept(instrument, order))
+        return response
+
+    async def __accept(self, instrument, order):
+        reason = None
+        if order.trantype not in ('B', 'S'):
+            reason = 'invalid transaction type'
+        elif order.prctyp not in ('LMT', 'MKT', 'SL-LMT', 'SL-MKT'):
+            reason = 'invalid price type'
+        elif order.qty <= 0 or order.qty % instrument.ls:
+            reason = f'quantity should be a multiple of the lot size {instrument.ls}'
+        elif order.prctyp in ('LMT', 'SL-LMT') and order.prc <= 0:
+            reason = 'invalid price'
+        elif order.prctyp.startswith('SL') and not order.trgprc:
+            reason = 'trigger price required'
+
+        if reason is not None:
+            order.status = 'REJECTED'
+            order.rejreason = reason
+            await self.__notify(order, 'Rejected')
+            return
+
+        if order.prctyp.startswith('SL'):
+            order.status = 'TRIGGER_PENDING'
+            self.__order_seq += 1
+            order.seq = self.__order_seq
+            instrument.stops.append(order)
+            await self.__notify(order, 'New')
+            return
+
+        order.status = 'OPEN'
+        await self.__notify(order, 'New')
+        await self.__execute(instrument, order)
+
+    async def __modify_order(self, uid, values, key):
+        order = self.__orders.get(str(values.get('norenordno')))
+        if order is None or order.uid != uid:
+            return {'stat': 'Not_Ok', 'emsg': 'Invalid Order Number'}
+        if order.status in FINAL_STATUS:
+            return {'stat': 'Not_Ok', 'emsg': f'Order is {order.status}'}
+
+        instrument = self.__by_tsym[(order.exch, order.tsym)]
+        quantity = int(values.get('qty', order.qty))
+        if quantity <= order.filled or quantity % instrument.ls:
+            return {'stat': 'Not_Ok', 'emsg': 'invalid quantity'}
+
+        price = float(values.get('prc') or 0)
+        price_type = values.get('prctyp', order.prctyp)
+        # a new price or a larger quantity loses the time priority
+        requeue = price != order.prc or quantity > order.qty or price_type != order.prctyp
+        order.qty = quantity
+        order.prc = price
+        order.prctyp = price_type
+        if values.get('trgprc') not in (None, 'None', ''):
+            order.trgprc = float(values['trgprc'])
+
+        async def replace():
+            await self.__notify(order, 'Replaced')
+            if order.status == 'OPEN' and requeue:
+                # the new sequence number invalidates the previous book entry
+                await self.__execute(instrument, order)
+
+        asyncio.ensure_future(replace())
+        return {'stat': 'Ok', 'result': order.norenordno,
+                'request_time': self.__clock().strftime('%H:%M:%S %d-%m-%Y')}
+
+    async def __cancel_order(self, uid, values, key):
+        order = self.__orders.get(str(values.get('norenordno')))
+        if order is None or order.uid != uid:
+            return {'stat': 'Not_Ok', 'emsg': 'Invalid Order Number'}
+        if order.status in FINAL_STATUS:
+            return {'stat': 'Not_Ok', 'emsg': f'Order is {order.status}'}
+
+        order.status = 'CANCELED'
+        asyncio.ensure_future(self.__notify(order, 'Canceled', cancelqty=str(order.remaining)))
+        return {'stat': 'Ok', 'result': order.norenordno,
+                'request_time': self.__clock().strftime('%H:%M:%S %d-%m-%Y')}
+
+    def __order_book(self, uid, values, key):
+        orders = [order.message('')
+                  for order in self.__orders.values() if order.uid == uid]
+        for order in orders:
+            del order['t'], order['reporttype']
+            order['stat'] = 'Ok'
+        if not orders:
+            return {'stat': 'Not_Ok', 'emsg': 'no data'}
+        return orders[::-1]
+
+    def __order_history(self, uid, values, key):
+        order = self.__orders.get(str(values.get('norenordno')))
+        if order is None or order.uid != uid or not order.history:
+            return {'stat': 'Not_Ok', 'emsg': 'no data'}
+        history = []
+        for message in reversed(order.history):
+            message = dict(message)
+            del message['t']
+            message['stat'] = 'Ok'
+            history.append(message)
+        return history
+
+    def __trade_book(self, uid, values, key):
+        trades = []
+        for n, (order, price, quantity, timestamp) in enumerate(self.__trades, start=1):
+            if order.uid == uid:
+                trades.append({'stat': 'Ok', 'norenordno': order.norenordno, 'uid': uid, 'actid': order.actid,
+                               'exch': order.exch, 'tsym': order.tsym, 'token': order.token,
+                               'trantype': order.trantype, 'prd': order.prd, 'prctyp': order.prctyp,
+                               'qty': str(order.qty), 'flqty': str(quantity), 'flprc': _price(price),
+                               'flid': str(n), 'fltm': _clock(timestamp).strftime('%d-%m-%Y %H:%M:%S')})
+        if not trades:
+            return {'stat': 'Not_Ok', 'emsg': 'no data'}
+        return trades[::-1]
+
+    def __position_book(self, uid, values, key):
+        positions = {}
+        for order, price, quantity, _ in self.__trades:
+            if order.uid != uid:
+                continue
+            position = positions.setdefault((order.exch, order.tsym, order.prd), {
+                'token': order.token, 'actid': order.actid, 'net': 0, 'avg': 0.0, 'rpnl': 0.0,
+                'buyqty': 0, 'buyamt': 0.0, 'sellqty': 0, 'sellamt': 0.0})
+            signed = quantity if order.trantype == 'B' else -quantity
+            if order.trantype == 'B':
+                position['buyqty'] += quantity
+                position['buyamt'] += quantity * price
+            else:
+                position['sellqty'] += quantity
+                position['sellamt'] += quantity * price
+
+            net = position['net']
+            if net == 0 or (net > 0) == (signed > 0):
+                position['avg'] = (position['avg'] * abs(net) + price * quantity) / (abs(net) + quantity)
+            else:
+                closing = min(quantity, abs(net))
+                position['rpnl'] += closing * (price - position['avg']) * (1 if net > 0 else -1)
+                if abs(signed) > abs(net):
+                    position['avg'] = price
+                elif net + signed == 0:
+                    position['avg'] = 0.0
+            position['net'] = net + signed
+
+        if not positions:
+            return {'stat': 'Not_Ok', 'emsg': 'no data'}
+
+        rows = []
+        for (exch, tsym, prd), position in positions.items():
+            instrument = self.__by_tsym[(exch, tsym)]
+            urmtom = (instrument.lp - position['avg']) * position['net'] if position['net'] else 0.0
+            rows.append({'stat': 'Ok', 'uid': uid, 'actid': position['actid'], 'exch': exch, 'tsym': tsym,
+                         'token': position['token'], 'prd': prd, 'netqty': str(position['net']),
+                         'netavgprc': _price(position['avg']), 'lp': _price(instrument.lp),
+                         'rpnl': _price(position['rpnl']), 'urmtom': _price(urmtom),
+                         'daybuyqty': str(position['buyqty']), 'daysellqty': str(position['sellqty']),
+                         'daybuyamt': _price(position['buyamt']), 'daysellamt': _price(position['sellamt']),
+                         'ls': str(instrument.ls), 'ti': str(instrument.ti), 'mult': '1', 'prcftr': '1.000000'})
+        return rows
+
+    def __limits(self, uid, values, key):
+        used = sum(order.value for order in self.__orders.values() if order.uid == uid and order.trantype == 'B')
+        return {'stat': 'Ok', 'actid': uid, 'cash': _price(self.cash), 'payin': '0.00',
+                'marginused': _price(used)}
+
+    def __quotes(self, uid, values, key):
+        instrument = self.__instruments.get(f"{values.get('exch')}|{values.get('token')}")
+        if instrument is None or instrument.lp is None:
+            return {'stat': 'Not_Ok', 'emsg': 'no data'}
+        quote = instrument.quote(self.spread, depth=True)
+        quote.update({'stat': 'Ok', 'exch': instrument.exch, 'tsym': instrument.tsym, 'token': instrument.token,
+                      'ls': str(instrument.ls), 'ti': str(instrument.ti)})
+        return quote
+
+    # websocket
+
+    async def __websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        client = {'uid': None, 'keys': {}}
+
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                message = json.loads(msg.data)
+            except ValueError:
+                continue
+
+            kind = message.get('t')
+            if kind == 'c':
+                if self.__sessions.get(message.get('susertoken')) == message.get('uid'):
+                    client['uid'] = message['uid']
+                    self.__sockets[ws] = client
+                    await ws.send_str(json.dumps({'t': 'ck', 's': 'OK', 'uid': client['uid']}))
+                else:
+                    await ws.send_str(json.dumps({'t': 'ck', 's': 'NOT_OK'}))
+                continue
+
+            if client['uid'] is None:
+                continue
+
+            keys = [key for key in message.get('k', '').split('#') if key]
+            if kind in ('t', 'd'):
+                for key in keys:
+                    client['keys'][key] = kind == 'd'
+                    instrument = self.__instruments.get(key)
+                    if instrument is not None and instrument.lp is not None:
+                        # subscription acknowledgement with the current state
+                        snapshot = instrument.quote(self.spread, kind == 'd')
+                        snapshot.update({'t': 'dk' if kind == 'd' else 'tk', 'ts': instrument.tsym,
+                                         'ls': str(instrument.ls), 'ti': str(instrument.ti),
+                                         'ft': str(int(self.now))})
+                        await ws.send_str(json.dumps(snapshot))
+            elif kind in ('u', 'ud'):
+                for key in keys:
+                    client['keys'].pop(key, None)
+
+        self.__sockets.pop(ws, None)
+        return ws
@@ -0,0 +1,276 @@
+import asyncio
+import collections
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# order states after which a child order does not change anymore
+FINAL_STATUS = ('COMPLETE', 'CANCELED', 'REJECTED')
+
+
+class SecurityInfoCache:
+    '''
+    get_security_info responses cached per (exchange, tradingsymbol) for the day
+    '''
+    def __init__(self, api, master=None):
+        self.__api = api
+        self.__master = master
+        self.__cache = {}
+
+    async def __token(self, exchange, tradingsymbol):
+        if self.__master is not None:
+            token = self.__master.token(exchange, tradingsymbol)
+            if token is not None:
+                return token
+
+        ret = await self.__api.searchscrip(exchange=exchange, searchtext=tradingsymbol)
+        for scrip in (ret or {}).get('values', []):
+            if scrip.get('tsym') == tradingsymbol:
+                return scrip['token']
+        return None
+
+    async def get(self, exchange, tradingsymbol):
+        key = (exchange, tradingsymbol)
+        info = self.__cache.get(key)
+        if info is not None:
+            return await asyncio.shield(info) if isinstance(info, asyncio.Future) else info
+
+        # concurrent lookups of the same symbol share one request
+        future = asyncio.ensure_future(self.__fetch(exchange, tradingsymbol))
+        self.__cache[key] = future
+        info = await asyncio.shield(future)
+        if info is None:
+            self.__cache.pop(key, None)
+        else:
+            self.__cache[key] = info
+        return info
+
+    async def __fetch(self, exchange, tradingsymbol):
+        token = await self.__token(exchange, tradingsymbol)
+        if token is None:
+            logger.error(f'unknown symbol {exchange} {tradingsymbol}')
+            return None
+
+        ret = await self.__api.get_security_info(exchange=exchange, token=token)
+        if not isinstance(ret, dict) or ret.get('stat') != 'Ok':
+            logger.error(f'get_security_info failed for {exchange} {tradingsymbol}: {ret}')
+            return None
+        return ret
+
+
+def split_quantity(quantity, freeze_quantity=None, lot_size=1):
+    '''
+    splits a quantity into lot multiples strictly below the freeze quantity
+    '''
+    quantity = int(quantity)
+    lot_size = max(int(lot_size or 1), 1)
+    if not freeze_quantity:
+        return [quantity]
+
+    child = ((int(freeze_quantity) - 1) // lot_size) * lot_size
+    if child <= 0:
+        raise ValueError(f'freeze quantity {freeze_quantity} is below the lot size {lot_size}')
+
+    children = [child] * (quantity // child)
+    if quantity % child:
+        children.append(quantity % child)
+    return children
+
+
+class ChildOrder:
+    __slots__ = ('quantity', 'norenordno', 'status', 'filled', 'avgprc', 'response', 'done')
+
+    def __init__(self, quantity):
+        self.quantity = quantity
+        self.norenordno = None
+        self.status = None
+        self.filled = 0
+        self.avgprc = 0.0
+        self.response = None
+        self.done = asyncio.Event()
+
+    def __repr__(self):
+        return (f'ChildOrder(quantity={self.quantity}, norenordno={self.norenordno}, status={self.status}, '
+                f'filled={self.filled}, avgprc={self.avgprc})')
+
+
+class ParentOrder:
+    '''
+    aggregate state of the child orders of a sliced order
+    '''
+    def __init__(self, order, quantities):
+        self.order = order
+        self.children = [ChildOrder(quantity) for quantity in quantities]
+        self.task = None
+
+    @property
+    def quantity(self):
+        return sum(child.quantity for child in self.children)
+
+    @property
+    def filled(self):
+        return sum(child.filled for child in self.children)
+
+    @property
+    def avgprc(self):
+        filled = self.filled
+        return sum(child.filled * child.avgprc for child in self.children) / filled if filled else 0.0
+
+    @property
+    def complete(self):
+        return all(child.done.is_set() for child in self.children)
+
+    async def wait(self, timeout=None):
+        '''
+        waits until every child order is complete, canceled or rejected
+        '''
+        await asyncio.wait_for(asyncio.gather(*[child.done.wait() for child in self.children]), timeout)
+        return self
+
+    def __repr__(self):
+        return f'ParentOrder(quantity={self.quantity}, filled={self.filled}, avgprc={self.avgprc:.2f})'
+
+
+class OrderSlicer:
+    '''
+    Splits orders above the exchange freeze quantity into lot multiples and submits the
+    children through NorenApi.place_order.
+
+    Freeze quantity and lot size come from get_security_info (cached, the token being
+    resolved from the SymbolMaster when given). Children are sent concurrently, the client
+    RateLimiter spacing the requests, or paced: 'twap' sends one child every `interval`
+    seconds and 'iceberg' sends the next child once the previous one is complete. Fill
+    state is aggregated from the om order updates.
+
+    With a RiskManager the freeze quantities looked up are also registered for its checks.
+    '''
+    def __init__(self, api, master=None, risk_manager=None, max_pending=4096):
+        self.__api = api
+        self.__master = master
+        self.__risk_manager = risk_manager
+        self.max_pending = max_pending
+        self.info = SecurityInfoCache(api, master)
+        # norenordno -> ChildOrder
+        self.__children = {}
+        # number of PlaceOrder requests waiting for their response
+        self.__placing = 0
+        # norenordno -> order updates received before the PlaceOrder response, oldest first
+        self.__early = collections.OrderedDict()
+        api.add_order_listener(self.on_order_update)
+
+    async def quantities(self, exchange, tradingsymbol):
+        '''
+        returns (freeze quantity, lot size) of a contract, freeze quantity None when there is none
+        '''
+        info = await self.info.get(exchange, tradingsymbol)
+        lot_size = 1
+        freeze = None
+        if info is not None:
+            lot_size = int(float(info.get('ls', 1) or 1))
+            freeze = int(float(info.get('frzqty', 0) or 0)) or None
+        elif self.__master is not None:
+            contract = self.__master.lookup(exchange, tradingsymbol)
+            if contract is not None:
+                lot_size = contract['ls']
+
+        if freeze is not None and self.__risk_manager is not None:
+            self.__risk_manager.set_freeze_quantity(exchange, tradingsymbol, freeze)
+        return freeze, lot_size
+
+    async def place_order(self, buy_or_sell, product_type, exchange, tradingsymbol, quantity, discloseqty,
+                          price_type, price=0.0, trigger_price=None, retention='DAY', remarks=None,
+                          pacing=None, interval=1.0, wait=False):
+        '''
+        places a parent order as children below the freeze quantity and returns the ParentOrder.
+        pacing is None (all children at once), 'twap' or 'iceberg'. with wait=False the paced
+        submission runs in the background (ParentOrder.task).
+        '''
+        freeze, lot_size = await self.quantities(exchange, tradingsymbol)
+        quantities = split_quantity(quantity, freeze, lot_size)
+
+        order = {'buy_or_sell': buy_or_sell, 'product_type': product_type, 'exchange': exchange,
+                 'tradingsymbol': tradingsymbol, 'discloseqty': discloseqty, 'price_type': price_type,
+                 'price': price, 'trigger_price': trigger_price, 'retention': retention, 'remarks': remarks}
+        parent = ParentOrder(order, quantities)
+
+        if pacing is None:
+            await asyncio.gather(*[self.__submit(parent, child) for child in parent.children])
+            return parent
+
+        if pacing not in ('twap', 'iceberg'):
+            raise ValueError(f'unknown pacing {pacing}')
+
+        parent.task = asyncio.create_task(self.__paced(parent, pacing, interval))
+        if wait:
+            await parent.task
+        return parent
+
+    async def __paced(self, parent, pacing, interval):
+        start = time.monotonic()
+        for index, child in enumerate(parent.children):
+            if pacing == 'twap':
+                delay = start + index * interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self.__submit(parent, child)
+            else:
+                await self.__submit(parent, child)
+                await child.done.wait()
+                if child.status != 'COMPLETE':
+                    # stop slicing when a child is canceled or rejected
+                    logger.error(f'iceberg stopped, child {child.norenordno} is {child.status}')
+                    for remaining in parent.children[index + 1:]:
+                        remaining.status = 'CANCELED'
+                        remaining.done.set()
+                    return
+
+    async def __submit(self, parent, child):
+        self.__placing += 1
+        try:
+            ret = await self.__api.place_order(quantity=child.quantity, **parent.order)
+            child.response = ret
+
+            if not isinstance(ret, dict) or ret.get('stat') != 'Ok':
+                logger.error(f'child order rejected: {ret}')
+                child.status = 'REJECTED'
+                child.done.set()
+                return
+
+            child.norenordno = ret['norenordno']
+            self.__children[child.norenordno] = child
+
+            for message in self.__early.pop(child.norenordno, []):
+                self.__update(child, message)
+        finally:
+            self.__placing -= 1
+            if self.__placing == 0:
+                # what is left are the updates of orders placed elsewhere
+                self.__early.clear()
+
+    def on_order_update(self, message):
+        orderno = message.get('norenordno')
+        child = self.__children.get(orderno)
+        if child is None:
+            # the update can arrive before the PlaceOrder response, kept only while a placement is in flight
+            if orderno is not None and self.__placing:
+                messages = self.__early.get(orderno)
+                if messages is None:
+                    messages = self.__early[orderno] = []
+                    while len(self.__early) > self.max_pending:
+                        self.__early.popitem(last=False)
+                messages.append(message)
+            return
+
+        self.__update(child, message)
+
+    def __update(self, child, message):
+        child.status = message.get('status', child.status)
+        if 'fillshares' in message:
+            child.filled = int(float(message['fillshares'] or 0))
+        if 'avgprc' in message:
+            child.avgprc = float(message['avgprc'] or 0)
+
+        if child.status in FINAL_STATUS:
+            child.done.set()
+            self.__children.pop(child.norenordno, None)
@@ -0,0 +1,304 @@
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+import zipfile
+
+import aiohttp
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# exchange timestamps are Indian Standard Time
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+MASTERS_ROOT = 'https://api.shoonya.com/'
+EXCHANGES = ('NSE', 'NFO', 'CDS', 'MCX', 'BSE')
+
+# column name -> numpy dtype
+COLUMNS = {
+    'tsym': 'S48',
+    'token': np.int64,
+    'symbol': 'S32',
+    'instrument': 'S8',
+    'expiry': np.int32,
+    'strike': np.float64,
+    'optt': 'S2',
+    'lotsize': np.int32,
+    'ticksize': np.float64,
+}
+
+
+def parse_expiry(expiry):
+    '''
+    converts '27-OCT-2022' to 20221027, 0 when there is no expiry
+    '''
+    if not expiry:
+        return 0
+    return int(datetime.datetime.strptime(expiry.strip(), '%d-%b-%Y').strftime('%Y%m%d'))
+
+
+def parse_master(text):
+    '''
+    parses a <EXCH>_symbols.txt master into a dict of numpy columns sorted by trading symbol
+    '''
+    rows = list(csv.DictReader(io.StringIO(text)))
+
+    # DictReader gives None for the missing trailing fields of a short row
+    columns = {
+        'tsym': [row['TradingSymbol'].strip().encode() for row in rows],
+        'token': [int(row['Token']) for row in rows],
+        'symbol': [(row.get('Symbol') or '').strip().encode() for row in rows],
+        'instrument': [(row.get('Instrument') or '').strip().encode() for row in rows],
+        'expiry': [parse_expiry(row.get('Expiry')) for row in rows],
+        'strike': [float(row.get('StrikePrice') or 0) for row in rows],
+        'optt': [(row.get('OptionType') or '').strip().encode() for row in rows],
+        'lotsize': [int(row.get('LotSize') or 1) for row in rows],
+        'ticksize': [float(row.get('TickSize') or 0) for row in rows],
+    }
+    columns = {name: np.array(values, dtype=COLUMNS[name]) for name, values in columns.items()}
+
+    # rows are stored sorted by trading symbol so that prefix search is a binary search
+    order = np.argsort(columns['tsym'], kind='stable')
+    return {name: values[order] for name, values in columns.items()}
+
+
+class _Exchange:
+    def __init__(self, columns):
+        self.columns = columns
+        self.__by_token = None
+        self.__by_tsym = None
+        self.__by_symbol = None
+
+    def __len__(self):
+        return len(self.columns['token'])
+
+    @property
+    def by_token(self):
+        if self.__by_token is None:
+            self.__by_token = {token: row for row, token in enumerate(self.columns['token'].tolist())}
+        return self.__by_token
+
+    @property
+    def by_symbol(self):
+        # underlying -> rows, so that filters only scan the contracts of one underlying
+        if self.__by_symbol is None:
+            symbols, inverse = np.unique(self.columns['symbol'], return_inverse=True)
+            order = np.argsort(inverse, kind='stable')
+            bounds = np.searchsorted(inverse[order], np.arange(len(symbols) + 1))
+            self.__by_symbol = {symbol.decode(): order[bounds[i]:bounds[i + 1]] for i, symbol in enumerate(symbols)}
+        return self.__by_symbol
+
+    @property
+    def by_tsym(self):
+        if self.__by_tsym is None:
+            self.__by_tsym = {tsym.decode(): row for row, tsym in enumerate(self.columns['tsym'].tolist())}
+        return self.__by_tsym
+
+    def record(self, exchange, row):
+        columns = self.columns
+        return {
+            'exch': exchange,
+            'token': str(columns['token'][row]),
+            'tsym': columns['tsym'][row].decode(),
+            'symname': columns['symbol'][row].decode(),
+            'instname': columns['instrument'][row].decode(),
+            'exd': int(columns['expiry'][row]),
+            'strprc': float(columns['strike'][row]),
+            'optt': columns['optt'][row].decode(),
+            'ls': int(columns['lotsize'][row]),
+            'ti': float(columns['ticksize'][row]),
+        }
+
+
+class SymbolMaster:
+    '''
+    Local symbol master built from the daily scrip master files.
+
+    The masters are downloaded once a day and stored per exchange as numpy columns
+    (cache_dir/EXCH/<column>.npy) which are memory mapped on load. Lookups between
+    token and trading symbol are dict based, prefix search is a binary search over
+    the sorted trading symbols and instrument filters are vectorized masks.
+    '''
+    def __init__(self, cache_dir, exchanges=EXCHANGES, root=MASTERS_ROOT):
+        self.cache_dir = cache_dir
+        self.exchanges = tuple(exchanges)
+        self.root = root
+        self.__exchanges = {}
+
+    def __path(self, exchange, name):
+        return os.path.join(self.cache_dir, exchange, name)
+
+    def is_current(self, exchange):
+        try:
+            with open(self.__path(exchange, 'meta.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        return meta.get('date') == datetime.datetime.now(tz=IST).strftime('%Y%m%d')
+
+    async def update(self, force=False):
+        '''
+        downloads and indexes the masters that were not already downloaded today, then loads them
+        '''
+        async with aiohttp.ClientSession() as session:
+            for exchange in self.exchanges:
+                if force or not self.is_current(exchange):
+                    await self.__download(session, exchange)
+
+        self.load()
+
+    async def __download(self, session, exchange):
+        url = f'{self.root}{exchange}_symbols.txt.zip'
+        logger.info(f'downloading {url}')
+
+        async with session.get(url) as response:
+            content = await response.read()
+
+        try:
+            with zipfile.ZipFile(io.BytesIO(content)) as z:
+                text = z.read(z.namelist()[0]).decode('utf-8', errors='replace')
+        except zipfile.BadZipFile:
+            logger.error(f'invalid master file {url}')
+            return
+
+        self.store(exchange, parse_master(text))
+
+    def store(self, exchange, columns):
+        os.makedirs(self.__path(exchange, ''), exist_ok=True)
+
+        for name, values in columns.items():
+            tmp_path = self.__path(exchange, name + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                np.save(f, values)
+            os.replace(tmp_path, self.__path(exchange, name + '.npy'))
+
+        with open(self.__path(exchange, 'meta.json'), 'w') as f:
+            json.dump({'date': datetime.datetime.now(tz=IST).strftime('%Y%m%d'), 'rows': len(columns['token'])}, f)
+
+    def load(self):
+        for exchange in self.exchanges:
+            try:
+                columns = {name: np.load(self.__path(exchange, name + '.npy'), mmap_mode='r') for name in COLUMNS}
+            except OSError:
+                logger.error(f'{exchange} master is not available, call update() first')
+                continue
+
+            self.__exchanges[exchange] = _Exchange(columns)
+
+    def __exchange(self, exchange):
+        return self.__exchanges.get(exchange)
+
+    def get(self, exchange, token):
+        '''
+        returns the contract details for a token, None if unknown
+        '''
+        data = self.__exchange(exchange)
+        if data is None:
+            return None
+
+        row = data.by_token.get(int(token))
+        return data.record(exchange, row) if row is not None else None
+
+    def tsym(self, exchange, token):
+        data = self.__exchange(exchange)
+        if data is None:
+            return None
+
+        row = data.by_token.get(int(token))
+        return data.columns['tsym'][row].decode() if row is not None else None
+
+    def token(self, exchange, tsym):
+        data = self.__exchange(exchange)
+        if data is None:
+            return None
+
+        row = data.by_tsym.get(tsym)
+        return str(data.columns['token'][row]) if row is not None else None
+
+    def lookup(self, exchange, tsym):
+        '''
+        returns the contract details for a trading symbol, None if unknown
+        '''
+        data = self.__exchange(exchange)
+        if data is None:
+            return None
+
+        row = data.by_tsym.get(tsym)
+        return data.record(exchange, row) if row is not None else None
+
+    def search(self, exchange, prefix, limit=20):
+        '''
+        returns the contracts whose trading symbol starts with prefix, like searchscrip
+        '''
+        data = self.__exchange(exchange)
+        if data is None:
+            return []
+
+        tsyms = data.columns['tsym']
+        prefix = prefix.upper().encode()
+        lo = np.searchsorted(tsyms, prefix, side='left')
+        hi = np.searchsorted(tsyms, prefix + b'\xff', side='left')
+
+        return [data.record(exchange, row) for row in range(lo, min(hi, lo + limit))]
+
+    def filter_rows(self, exchange, symbol=None, instrument=None, expiry=None, optt=None,
+                    strike=None, min_strike=None, max_strike=None, lotsize=None):
+        '''
+        returns the row numbers matching every given field, expiry as YYYYMMDD
+        '''
+        data = self.__exchange(exchange)
+        if data is None:
+            return np.empty(0, dtype=np.int64)
+
+        if symbol is not None:
+            rows = data.by_symbol.get(symbol)
+            if rows is None:
+                return np.empty(0, dtype=np.int64)
+        else:
+            rows = np.arange(len(data))
+
+        columns = data.columns
+        mask = np.ones(len(rows), dtype=bool)
+
+        if instrument is not None:
+            mask &= columns['instrument'][rows] == instrument.encode()
+        if expiry is not None:
+            mask &= columns['expiry'][rows] == int(expiry)
+        if optt is not None:
+            mask &= columns['optt'][rows] == optt.encode()
+        if strike is not None:
+            mask &= columns['strike'][rows] == float(strike)
+        if min_strike is not None:
+            mask &= columns['strike'][rows] >= float(min_strike)
+        if max_strike is not None:
+            mask &= columns['strike'][rows] <= float(max_strike)
+        if lotsize is not None:
+            mask &= columns['lotsize'][rows] == int(lotsize)
+
+        return rows[mask]
+
+    def filter(self, exchange, **kwargs):
+        '''
+        returns the contracts matching the given fields, see filter_rows
+        '''
+        data = self.__exchange(exchange)
+        return [data.record(exchange, row) for row in self.filter_rows(exchange, **kwargs)]
+
+    def columns(self, exchange):
+        '''
+        returns the memory mapped columns of one exchange
+        '''
+        data = self.__exchange(exchange)
+        return data.columns if data is not None else None
+
+    def expiries(self, exchange, symbol, instrument=None):
+        '''
+        returns the sorted expiries (YYYYMMDD) listed for an underlying
+        '''
+        rows = self.filter_rows(exchange, symbol=symbol, instrument=instrument)
+        expiries = np.unique(self.__exchange(exchange).columns['expiry'][rows]) if len(rows) else []
+        return [int(expiry) for expiry in expiries if expiry]
@@ -0,0 +1,194 @@
+import asyncio
+import inspect
+import logging
+import queue
+import threading
+
+from .NorenApi import NorenApi
+
+logger = logging.getLogger(__name__)
+
+# coroutines running as long as the connection, started by start_websocket and never awaited to completion
+ASYNC_ONLY = ('websocket_task_async',)
+
+
+class EventLoopThread:
+    '''
+    one event loop running forever in a daemon thread
+    '''
+    def __init__(self, name='NorenApiLoop'):
+        self.loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__run, name=name, daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro, timeout=None):
+        '''
+        runs a coroutine on the loop and blocks until its result
+        '''
+        if threading.current_thread() is self.__thread:
+            coro.close()
+            raise RuntimeError('blocking call from the event loop thread, use the async api there')
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.__thread.join()
+        self.loop.close()
+
+
+class CallbackThread:
+    '''
+    runs the sync callbacks in arrival order on one thread, away from the event loop
+    '''
+    def __init__(self, name='NorenApiCallbacks'):
+        self.__queue = queue.SimpleQueue()
+        self.__thread = threading.Thread(target=self.__run, name=name, daemon=True)
+        self.__thread.start()
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            callback, args = item
+            try:
+                callback(*args)
+            except Exception as e:
+                logger.exception(e)
+
+    def submit(self, callback, *args):
+        self.__queue.put((callback, args))
+
+    def stop(self):
+        self.__queue.put(None)
+        if threading.current_thread() is not self.__thread:
+            self.__thread.join()
+
+
+class SyncApi:
+    '''
+    Blocking facade over an async client.
+
+    The async instance lives on one persistent event loop in a background thread, so the
+    pooled aiohttp connections stay warm between calls; every coroutine method gets a
+    blocking twin dispatched with run_coroutine_threadsafe. Sync websocket callbacks and
+    listeners are delivered in order on a callback thread, where they may call the facade.
+    Other attributes are read from the async instance, available as `api`.
+    '''
+    _async_class = None
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        self.timeout = timeout
+        self.__loop = EventLoopThread()
+        self.__callbacks = CallbackThread()
+        self.__listeners = {}
+
+        # the aiohttp session must be created on the loop it is used from
+        async def create():
+            return self._async_class(*args, **kwargs)
+
+        self.api = self.__loop.run(create())
+
+    def __getattr__(self, name):
+        if name == 'api':
+            raise AttributeError(name)
+        return getattr(self.api, name)
+
+    @property
+    def loop(self):
+        return self.__loop.loop
+
+    def run(self, coro, timeout=None):
+        '''
+        runs any coroutine on the background loop, e.g. one using the async api with other components
+        '''
+        return self.__loop.run(coro, timeout if timeout is not None else self.timeout)
+
+    def __deliver(self, callback):
+        if callback is None or inspect.iscoroutinefunction(callback):
+            return callback
+
+        async def deliver(*args):
+            self.__callbacks.submit(callback, *args)
+
+        return deliver
+
+    def start_websocket(self, subscribe_callback=None, order_update_callback=None, socket_open_callback=None,
+                        socket_close_callback=None, socket_error_callback=None):
+        '''
+        sync callbacks run on the callback thread, coroutine functions on the event loop
+        '''
+        return self.run(self.api.start_websocket(
+            subscribe_callback=self.__deliver(subscribe_callback),
+            order_update_callback=self.__deliver(order_update_callback),
+            socket_open_callback=self.__deliver(socket_open_callback),
+            socket_close_callback=self.__deliver(socket_close_callback),
+            socket_error_callback=self.__deliver(socket_error_callback)))
+
+    def __listener(self, listener):
+        wrapper = self.__listeners.get(listener)
+        if wrapper is None:
+            wrapper = self.__listeners[listener] = lambda message: self.__callbacks.submit(listener, message)
+        return wrapper
+
+    def add_feed_listener(self, listener):
+        self.loop.call_soon_threadsafe(self.api.add_feed_listener, self.__listener(listener))
+
+    def remove_feed_listener(self, listener):
+        if listener in self.__listeners:
+            self.loop.call_soon_threadsafe(self.api.remove_feed_listener, self.__listeners[listener])
+
+    def add_order_listener(self, listener):
+        self.loop.call_soon_threadsafe(self.api.add_order_listener, self.__listener(listener))
+
+    def remove_order_listener(self, listener):
+        if listener in self.__listeners:
+            self.loop.call_soon_threadsafe(self.api.remove_order_listener, self.__listeners[listener])
+
+    def close(self):
+        '''
+        closes the connections and stops the background threads
+        '''
+        close = getattr(self.api, 'close', None)
+        if close is not None and inspect.iscoroutinefunction(close):
+            self.run(close())
+        self.__callbacks.stop()
+        self.__loop.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _sync_method(name, method):
+    def call(self, *args, **kwargs):
+        return self.run(getattr(self.api, name)(*args, **kwargs))
+
+    call.__name__ = name
+    call.__qualname__ = name
+    call.__doc__ = method.__doc__
+    call.__signature__ = inspect.signature(method)
+    return call
+
+
+def make_sync(async_class, name=None):
+    '''
+    generates a SyncApi subclass with a blocking method for every public coroutine method of async_class,
+    except the websocket loop that never returns
+    '''
+    namespace = {'_async_class': async_class, '__doc__': f'blocking facade over {async_class.__name__}'}
+    for attr, method in inspect.getmembers(async_class, inspect.iscoroutinefunction):
+        if attr.startswith('_') or attr in ASYNC_ONLY or hasattr(SyncApi, attr):
+            continue
+        namespace[attr] = _sync_method(attr, method)
+    return type(name or f'Sync{async_class.__name__}', (SyncApi,), namespace)
+
+
+SyncNorenApi = make_sync(NorenApi, 'SyncNorenApi')
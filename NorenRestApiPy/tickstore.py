@@ -0,0 +1,281 @@
+import datetime
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from .frames import IST_OFFSET
+
+logger = logging.getLogger(__name__)
+
+# column -> (message field, scale to integers, or a dict of scales per exchange with None as default);
+# currency derivatives are quoted with 4 decimals
+DEFAULT_FIELDS = {'price': ('lp', {'CDS': 10000, 'BCD': 10000, None: 100}), 'volume': ('v', 1), 'oi': ('oi', 1)}
+
+
+def zigzag(values):
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def unzigzag(values):
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def varint_encode(values):
+    '''
+    LEB128 encoding of an uint64 array, vectorized
+    '''
+    count = len(values)
+    if count == 0:
+        return b''
+
+    lengths = np.ones(count, dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+
+    total = int(lengths.sum())
+    starts = np.cumsum(lengths) - lengths
+    owner = np.repeat(np.arange(count), lengths)
+    position = np.arange(total) - starts[owner]
+    encoded = ((values[owner] >> (7 * position).astype(np.uint64)) & np.uint64(0x7f)).astype(np.uint8)
+    encoded |= (position < lengths[owner] - 1).astype(np.uint8) << 7
+    return encoded.tobytes()
+
+
+def varint_decode(data):
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.empty(0, dtype=np.uint64)
+
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.r_[0, ends[:-1] + 1]
+    lengths = ends - starts + 1
+    position = np.arange(len(data)) - np.repeat(starts, lengths)
+    groups = (data & 0x7f).astype(np.uint64) << (7 * position).astype(np.uint64)
+    # the 7 bit groups do not overlap, their sum is the value
+    return np.add.reduceat(groups, starts)
+
+
+def encode_column(values):
+    '''
+    delta + zigzag + varint, returns (first value, bytes)
+    '''
+    base = int(values[0])
+    return base, varint_encode(zigzag(np.diff(values, prepend=base)))
+
+
+def decode_column(base, data):
+    return np.cumsum(unzigzag(varint_decode(data))) + base
+
+
+def trading_day(timestamp):
+    '''
+    IST date of an epoch in seconds, as YYYYMMDD
+    '''
+    return time.strftime('%Y%m%d', time.gmtime(timestamp + IST_OFFSET))
+
+
+class TickStore:
+    '''
+    Compressed columnar store of the websocket ticks.
+
+    Ticks are kept per 'EXCH|token' and IST day under root/EXCH/token/YYYYMMDD/. Every
+    column (receive time in ms, price, cumulative volume, open interest) is stored as
+    integers, prices in 1/100 or 1/10000 (CDS, BCD) of a rupee, and written in blocks of
+    `block_size` ticks, delta + zigzag + varint encoded, so a tick takes a few bytes.
+    index.bin holds one fixed size record per block (time range, count, and the offset,
+    length, first value and scale of each column): query() memory maps the column files
+    and only decodes the blocks overlapping the requested range.
+    '''
+    def __init__(self, root, block_size=4096, fields=DEFAULT_FIELDS, clock=time.time):
+        self.root = root
+        self.block_size = block_size
+        self.fields = dict(fields)
+        self.columns = ['time'] + list(self.fields)
+        self.clock = clock
+
+        index = [('first', '<i8'), ('last', '<i8'), ('count', '<i4')]
+        for column in self.columns:
+            index += [(f'{column}_offset', '<i8'), (f'{column}_length', '<i4'), (f'{column}_base', '<i8'),
+                      (f'{column}_scale', '<i8')]
+        self.index_dtype = np.dtype(index)
+
+        # key -> {'day', 'rows': {column: list}} of the ticks not written yet
+        self.__buffers = {}
+        # key -> last value of each field, tf messages only carry the changes
+        self.__last = {}
+        # key -> scale of each column
+        self.__scales = {}
+        self.written = 0
+
+    def attach(self, api):
+        api.add_feed_listener(self.on_tick)
+
+    def detach(self, api):
+        api.remove_feed_listener(self.on_tick)
+
+    def scales(self, key):
+        '''
+        integer scale of every column of an instrument
+        '''
+        scales = self.__scales.get(key)
+        if scales is None:
+            exchange = key.split('|')[0]
+            scales = {'time': 1000}
+            for column, (_, scale) in self.fields.items():
+                scales[column] = scale.get(exchange, scale.get(None, 1)) if isinstance(scale, dict) else scale
+            self.__scales[key] = scales
+        return scales
+
+    def __directory(self, key, day):
+        exchange, token = key.split('|')
+        return os.path.join(self.root, exchange, token, day)
+
+    def on_tick(self, message):
+        if 'lp' not in message and 'v' not in message:
+            return
+
+        key = f"{message['e']}|{message['tk']}"
+        last = self.__last.get(key)
+        if last is None:
+            last = self.__last[key] = {column: 0 for column in self.fields}
+        scales = self.scales(key)
+        for column, (field, _) in self.fields.items():
+            value = message.get(field)
+            if value not in (None, ''):
+                last[column] = int(round(float(value) * scales[column]))
+
+        if last.get('price', 1) == 0:
+            # no trade price yet
+            return
+
+        self.append(key, self.clock(), last)
+
+    def append(self, key, timestamp, values):
+        '''
+        stores one tick, values being the integer of every field at the scales() of the key
+        '''
+        day = trading_day(timestamp)
+        buffer = self.__buffers.get(key)
+        if buffer is not None and buffer['day'] != day:
+            self.__write(key, buffer)
+            buffer = None
+        if buffer is None:
+            buffer = self.__buffers[key] = {'day': day, 'rows': {column: [] for column in self.columns}}
+
+        rows = buffer['rows']
+        rows['time'].append(int(timestamp * 1000))
+        for column in self.fields:
+            rows[column].append(values.get(column, 0))
+
+        if len(rows['time']) >= self.block_size:
+            self.__write(key, buffer)
+            del self.__buffers[key]
+
+    def __write(self, key, buffer):
+        rows = buffer['rows']
+        count = len(rows['time'])
+        if count == 0:
+            return
+
+        directory = self.__directory(key, buffer['day'])
+        os.makedirs(directory, exist_ok=True)
+        scales = self.scales(key)
+
+        record = np.zeros(1, dtype=self.index_dtype)
+        record['first'] = rows['time'][0]
+        record['last'] = rows['time'][-1]
+        record['count'] = count
+
+        for column in self.columns:
+            base, data = encode_column(np.array(rows[column], dtype=np.int64))
+            path = os.path.join(directory, f'{column}.bin')
+            with open(path, 'ab') as f:
+                record[f'{column}_offset'] = f.tell()
+                f.write(data)
+            record[f'{column}_length'] = len(data)
+            record[f'{column}_base'] = base
+            record[f'{column}_scale'] = scales[column]
+
+        # the index is written last, a block is only visible once its columns are complete
+        with open(os.path.join(directory, 'index.bin'), 'ab') as f:
+            f.write(record.tobytes())
+        self.written += count
+
+    def flush(self):
+        '''
+        writes the partial blocks, e.g. at the end of the session
+        '''
+        for key, buffer in list(self.__buffers.items()):
+            self.__write(key, buffer)
+        self.__buffers.clear()
+
+    def days(self, exchange, token):
+        directory = os.path.join(self.root, exchange, str(token))
+        if not os.path.isdir(directory):
+            return []
+        return sorted(os.listdir(directory))
+
+    def query(self, exchange, token, start, end):
+        '''
+        ticks of one instrument between start and end (epoch seconds or datetimes), as a dict
+        of numpy arrays: time in seconds and the fields unscaled
+        '''
+        if isinstance(start, datetime.datetime):
+            start = start.timestamp()
+        if isinstance(end, datetime.datetime):
+            end = end.timestamp()
+        start_ms, end_ms = int(start * 1000), int(end * 1000)
+        first_day, last_day = trading_day(start), trading_day(end)
+
+        parts = {column: [] for column in self.columns}
+        key = f'{exchange}|{token}'
+        for day in self.days(exchange, token):
+            if not first_day <= day <= last_day:
+                continue
+            self.__read_day(self.__directory(key, day), start_ms, end_ms, parts)
+
+        return {column: np.concatenate(parts[column]) if parts[column] else np.empty(0)
+                for column in self.columns}
+
+    def __read_day(self, directory, start_ms, end_ms, parts):
+        path = os.path.join(directory, 'index.bin')
+        if not os.path.exists(path) or os.path.getsize(path) < self.index_dtype.itemsize:
+            return
+
+        index = np.memmap(path, dtype=self.index_dtype, mode='r',
+                          shape=(os.path.getsize(path) // self.index_dtype.itemsize,))
+        blocks = np.flatnonzero((index['last'] >= start_ms) & (index['first'] <= end_ms))
+        if len(blocks) == 0:
+            return
+
+        files = {column: np.memmap(os.path.join(directory, f'{column}.bin'), dtype=np.uint8, mode='r')
+                 for column in self.columns}
+        for block in blocks:
+            record = index[block]
+            decoded = {}
+            for column in self.columns:
+                offset = int(record[f'{column}_offset'])
+                data = files[column][offset:offset + int(record[f'{column}_length'])]
+                decoded[column] = decode_column(int(record[f'{column}_base']), data)
+
+            times = decoded['time']
+            mask = (times >= start_ms) & (times <= end_ms)
+            for column in self.columns:
+                # each block records the scale it was written with
+                parts[column].append(decoded[column][mask] / int(record[f'{column}_scale']))
+
+    def frame(self, exchange, token, start, end):
+        '''
+        query() as a DataFrame indexed by IST time
+        '''
+        columns = self.query(exchange, token, start, end)
+        frame = pd.DataFrame({column: columns[column] for column in self.fields})
+        frame.index = pd.to_datetime(columns['time'], unit='s', utc=True).tz_convert('Asia/Kolkata')
+        frame.index.name = 'time'
+        return frame
@@ -0,0 +1,190 @@
+import collections
+import logging
+import time
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('queued', 'dns', 'connect', 'ttfb', 'body', 'parse', 'total')
+
+
+class Trace:
+    '''
+    timings of one request, in seconds
+    '''
+    __slots__ = ('route', 'start', 'start_ns', 'reused', 'queued', 'dns', 'connect', 'ttfb', 'body', 'parse',
+                 'total', '_mark', '_dns', '_headers')
+
+    def __init__(self, route):
+        self.route = route
+        self.start = time.perf_counter()
+        self.start_ns = time.time_ns()
+        self.reused = None
+        self.queued = 0.0
+        self.dns = 0.0
+        self.connect = 0.0
+        self.ttfb = None
+        self.body = None
+        self.parse = None
+        self.total = None
+        self._mark = self.start
+        self._dns = None
+        self._headers = None
+
+    def attributes(self):
+        attributes = {'http.route': self.route, 'noren.connection.reused': bool(self.reused)}
+        for stage in STAGES:
+            value = getattr(self, stage)
+            if value is not None:
+                attributes[f'noren.{stage}_ms'] = value * 1e3
+        return attributes
+
+
+class RequestTracer:
+    '''
+    Per route breakdown of the REST requests from aiohttp trace signals.
+
+    Records whether the pooled connection was reused, the pool wait, DNS resolution,
+    connect (TCP and TLS handshake, aiohttp has no separate TLS signal), time to first
+    byte (request sent until response headers), body read and JSON parse. Rolling
+    percentiles over the last `history` requests of each route are returned by stats().
+
+    span_hook(name, start_ns, end_ns, attributes) is called for every request, the
+    arguments map to an OpenTelemetry span:
+    tracer.start_span(name, start_time=start_ns, attributes=attributes).end(end_time=end_ns)
+    '''
+    def __init__(self, history=1024, span_hook=None):
+        self.history = history
+        self.span_hook = span_hook
+        # route -> stage -> deque of seconds
+        self.__samples = {}
+        # route -> {'count', 'reused', 'new', 'errors'}
+        self.__counts = {}
+
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_connection_queued_start.append(self.__on_queued_start)
+        self.trace_config.on_connection_queued_end.append(self.__on_queued_end)
+        self.trace_config.on_connection_reuseconn.append(self.__on_reuse)
+        self.trace_config.on_connection_create_start.append(self.__on_create_start)
+        self.trace_config.on_connection_create_end.append(self.__on_create_end)
+        self.trace_config.on_dns_resolvehost_start.append(self.__on_dns_start)
+        self.trace_config.on_dns_resolvehost_end.append(self.__on_dns_end)
+        self.trace_config.on_request_headers_sent.append(self.__on_headers_sent)
+        self.trace_config.on_request_end.append(self.__on_request_end)
+
+    @staticmethod
+    def __trace(context):
+        trace = context.trace_request_ctx
+        return trace if isinstance(trace, Trace) else None
+
+    async def __on_queued_start(self, session, context, params):
+        trace = self.__trace(context)
+        if trace is not None:
+            trace._mark = time.perf_counter()
+
+    async def __on_queued_end(self, session, context, params):
+        trace = self.__trace(context)
+        if trace is not None:
+            trace.queued = time.perf_counter() - trace._mark
+
+    async def __on_reuse(self, session, context, params):
+        trace = self.__trace(context)
+        if trace is not None:
+            trace.reused = True
+
+    async def __on_create_start(self, session, context, params):
+        trace = self.__trace(context)
+        if trace is not None:
+            trace.reused = False
+            trace._mark = time.perf_counter()
+
+    async def __on_create_end(self, session, context, params):
+        trace = self.__trace(context)
+        if trace is not None:
+            # the connection creation includes the name resolution
+            trace.connect = time.perf_counter() - trace._mark - trace.dns
+
+    async def __on_dns_start(self, session, context, params):
+        trace = self.__trace(context)
+        if trace is not None:
+            trace._dns = time.perf_counter()
+
+    async def __on_dns_end(self, session, context, params):
+        trace = self.__trace(context)
+        if trace is not None:
+            trace.dns = time.perf_counter() - trace._dns
+
+    async def __on_headers_sent(self, session, context, params):
+        trace = self.__trace(context)
+        if trace is not None:
+            trace._mark = time.perf_counter()
+
+    async def __on_request_end(self, session, context, params):
+        trace = self.__trace(context)
+        if trace is not None:
+            trace._headers = time.perf_counter()
+            trace.ttfb = trace._headers - trace._mark
+
+    def begin(self, route):
+        return Trace(route)
+
+    def body_read(self, trace):
+        now = time.perf_counter()
+        if trace._headers is not None:
+            trace.body = now - trace._headers
+        trace._mark = now
+
+    def end(self, trace):
+        now = time.perf_counter()
+        trace.parse = now - trace._mark
+        trace.total = now - trace.start
+
+        counts = self.__counts.setdefault(trace.route, {'count': 0, 'reused': 0, 'new': 0, 'errors': 0})
+        counts['count'] += 1
+        counts['reused' if trace.reused else 'new'] += 1
+
+        samples = self.__samples.get(trace.route)
+        if samples is None:
+            samples = self.__samples[trace.route] = {stage: collections.deque(maxlen=self.history)
+                                                     for stage in STAGES}
+        for stage in STAGES:
+            value = getattr(trace, stage)
+            if value is not None:
+                samples[stage].append(value)
+
+        if self.span_hook is not None:
+            try:
+                self.span_hook(f'noren {trace.route}', trace.start_ns, trace.start_ns + int(trace.total * 1e9),
+                               trace.attributes())
+            except Exception as e:
+                logger.exception(e)
+
+    def error(self, trace):
+        counts = self.__counts.setdefault(trace.route, {'count': 0, 'reused': 0, 'new': 0, 'errors': 0})
+        counts['errors'] += 1
+
+    def stats(self, route=None):
+        '''
+        counts and p50/p90/p99/mean per stage in seconds, for one route or all of them
+        '''
+        routes = [route] if route is not None else list(self.__counts)
+        stats = {}
+        for name in routes:
+            counts = self.__counts.get(name)
+            if counts is None:
+                continue
+            entry = dict(counts)
+            for stage, values in self.__samples.get(name, {}).items():
+                values = sorted(values)
+                count = len(values)
+                if not count:
+                    continue
+                entry[stage] = {'p50': values[int(0.5 * (count - 1))], 'p90': values[int(0.9 * (count - 1))],
+                                'p99': values[int(0.99 * (count - 1))], 'mean': sum(values) / count}
+            stats[name] = entry
+        return stats if route is None else stats.get(route)
+
+    def reset(self):
+        self.__samples.clear()
+        self.__counts.clear()
@@ -0,0 +1,210 @@
+import asyncio
+import bisect
+import itertools
+import logging
+
+from .callbacks import as_dispatcher
+
+logger = logging.getLogger(__name__)
+
+ABOVE = 'above'
+BELOW = 'below'
+
+
+class Trigger:
+    '''
+    one price alert or synthetic stop, fired once
+    '''
+    __slots__ = ('id', 'key', 'direction', 'price', 'callback', 'order', 'tag', 'fired', 'ltp', 'result')
+
+    def __init__(self, id, key, direction, price, callback, order, tag):
+        self.id = id
+        self.key = key
+        self.direction = direction
+        self.price = price
+        self.callback = callback
+        self.order = order
+        self.tag = tag
+        self.fired = False
+        # price of the tick that fired it and the place_order response
+        self.ltp = None
+        self.result = None
+
+    def __repr__(self):
+        return f'Trigger({self.id}, {self.key}, {self.direction} {self.price}, tag={self.tag})'
+
+
+class _Book:
+    __slots__ = ('above', 'below')
+
+    def __init__(self):
+        # both sorted so that the fired entries are the tail of the list:
+        # above holds (-price, id), below holds (price, id)
+        self.above = []
+        self.below = []
+
+
+class TriggerEngine:
+    '''
+    Price alerts and synthetic stop orders evaluated on every tick.
+
+    The triggers of an instrument are kept in two sorted lists, one per direction, so
+    that a tick finds the crossed thresholds with one bisect and removes them from the
+    end of the list: O(log n + fired) per tick whatever the number of triggers. An
+    'above' trigger fires on the first tick at or above its price and a 'below' trigger
+    on the first tick at or below it. A fired trigger calls its callback (sync or async)
+    with the trigger and the tick, and places its order, given as place_order keyword
+    arguments, e.g. a stop loss the exchange does not support for the product.
+    '''
+    def __init__(self, api=None, callback=None):
+        self.__api = api
+        # default callback of the triggers added without one
+        self.__callback = as_dispatcher(callback)
+        # 'EXCH|token' -> _Book
+        self.__books = {}
+        # id -> Trigger
+        self.__triggers = {}
+        self.__ids = itertools.count(1)
+        self.__tasks = set()
+        self.fired = 0
+
+    def __len__(self):
+        return len(self.__triggers)
+
+    def attach(self, api):
+        self.__api = api
+        api.add_feed_listener(self.on_tick)
+
+    def detach(self, api):
+        api.remove_feed_listener(self.on_tick)
+
+    def add(self, key, direction, price, callback=None, order=None, tag=None):
+        '''
+        adds a trigger on 'EXCH|token', direction 'above' or 'below'
+        '''
+        if direction not in (ABOVE, BELOW):
+            raise ValueError(f'unknown direction {direction}')
+        if order is not None and self.__api is None:
+            raise ValueError('orders need the engine to be attached to an api')
+
+        price = float(price)
+        trigger = Trigger(next(self.__ids), key, direction, price, as_dispatcher(callback), order, tag)
+        self.__triggers[trigger.id] = trigger
+
+        book = self.__books.get(key)
+        if book is None:
+            book = self.__books[key] = _Book()
+        if direction == ABOVE:
+            bisect.insort(book.above, (-price, trigger.id))
+        else:
+            bisect.insort(book.below, (price, trigger.id))
+        return trigger
+
+    def above(self, key, price, callback=None, order=None, tag=None):
+        return self.add(key, ABOVE, price, callback, order, tag)
+
+    def below(self, key, price, callback=None, order=None, tag=None):
+        return self.add(key, BELOW, price, callback, order, tag)
+
+    def remove(self, trigger):
+        '''
+        removes a trigger or a trigger id, returns False when it was already fired or removed
+        '''
+        trigger = self.__triggers.pop(getattr(trigger, 'id', trigger), None)
+        if trigger is None:
+            return False
+
+        book = self.__books[trigger.key]
+        if trigger.direction == ABOVE:
+            entries, entry = book.above, (-trigger.price, trigger.id)
+        else:
+            entries, entry = book.below, (trigger.price, trigger.id)
+        index = bisect.bisect_left(entries, entry)
+        if index < len(entries) and entries[index] == entry:
+            del entries[index]
+        if not book.above and not book.below:
+            del self.__books[trigger.key]
+        return True
+
+    def remove_key(self, key):
+        book = self.__books.pop(key, None)
+        if book is None:
+            return 0
+        for _, id in book.above + book.below:
+            self.__triggers.pop(id, None)
+        return len(book.above) + len(book.below)
+
+    def triggers(self, key=None):
+        if key is None:
+            return list(self.__triggers.values())
+        book = self.__books.get(key)
+        if book is None:
+            return []
+        return [self.__triggers[id] for _, id in book.above + book.below]
+
+    def on_tick(self, message):
+        price = message.get('lp')
+        if price is None:
+            return
+        book = self.__books.get(f"{message['e']}|{message['tk']}")
+        if book is None:
+            return
+        self.evaluate(book, float(price), message)
+
+    def evaluate(self, book, price, message):
+        fired = []
+        if book.above:
+            # -threshold >= -price
+            index = bisect.bisect_left(book.above, (-price, 0))
+            fired += book.above[index:]
+            del book.above[index:]
+        if book.below:
+            # threshold >= price
+            index = bisect.bisect_left(book.below, (price, 0))
+            fired += book.below[index:]
+            del book.below[index:]
+
+        if not fired:
+            return
+        if not book.above and not book.below:
+            self.__books.pop(f"{message['e']}|{message['tk']}", None)
+
+        for _, id in fired:
+            trigger = self.__triggers.pop(id)
+            trigger.fired = True
+            trigger.ltp = price
+            self.fired += 1
+            self.__fire(trigger, message)
+
+    def __fire(self, trigger, message):
+        callback = trigger.callback or self.__callback
+        if callback is not None:
+            self.__spawn(callback(trigger, message))
+        if trigger.order is not None:
+            self.__spawn(self.__place(trigger))
+
+    def __spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def __place(self, trigger):
+        try:
+            trigger.result = await self.__api.place_order(**trigger.order)
+        except Exception as e:
+            trigger.result = {'stat': 'Not_Ok', 'emsg': repr(e)}
+        if not isinstance(trigger.result, dict) or trigger.result.get('stat') != 'Ok':
+            logger.error(f'order of {trigger} failed: {trigger.result}')
+        else:
+            logger.info(f'{trigger} placed order {trigger.result.get("norenordno")}')
+
+    async def join(self):
+        '''
+        waits for the callbacks and orders of the fired triggers
+        '''
+        while self.__tasks:
+            await asyncio.gather(*list(self.__tasks), return_exceptions=True)
+
+    def stats(self):
+        return {'triggers': len(self.__triggers), 'instruments': len(self.__books), 'fired': self.fired,
+                'pending': len(self.__tasks)}
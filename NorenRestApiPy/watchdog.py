@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from .callbacks import as_dispatcher
+from .NorenApi import FeedType
+
+logger = logging.getLogger(__name__)
+
+# seconds without a tick after which an instrument is stale
+DEFAULT_THRESHOLDS = {'NSE': 10, 'BSE': 15, 'NFO': 15, 'BFO': 30, 'CDS': 30, 'MCX': 30}
+
+
+class FeedWatchdog:
+    '''
+    Detects the instruments of the websocket feed that stopped ticking.
+
+    A tick only stores its arrival time in the instrument entry, O(1). Deadlines are kept
+    in a heap with one entry per instrument and lazy deletion: when the earliest deadline
+    expires the entry is checked against the last tick, and pushed back with its actual
+    deadline when the instrument ticked in the meantime. Instruments without a tick for
+    the threshold of their exchange are reported once with a 'stale' event, then 'fresh'
+    on their next tick. action='refresh' fetches the quote of stale instruments with
+    get_quotes ('refreshed' event), action='resubscribe' unsubscribes and subscribes them
+    again. Instruments no longer subscribed on the api are unwatched when their deadline
+    expires, never reported nor subscribed again.
+    '''
+    def __init__(self, api, thresholds=None, default=10, action=None, callback=None, auto=True,
+                 metrics=None, clock=time.monotonic):
+        if action not in (None, 'refresh', 'resubscribe'):
+            raise ValueError(f'unknown action {action}')
+
+        self.__api = api
+        self.thresholds = dict(DEFAULT_THRESHOLDS if thresholds is None else thresholds)
+        self.default = default
+        self.action = action
+        # watch every instrument that ticks, not only the watched ones
+        self.auto = auto
+        self.clock = clock
+        self.__callback = as_dispatcher(callback)
+        # key -> [last tick, threshold, heap sequence or None when stale]
+        self.__entries = {}
+        # (deadline, sequence, key)
+        self.__heap = []
+        self.__sequence = itertools.count()
+        # key -> time it was found stale
+        self.__stale = {}
+        self.__wake = asyncio.Event()
+        self.__task = None
+        self.__actions = set()
+        self.events = 0
+
+        self.__stale_total = None
+        if metrics is not None:
+            self.__stale_total = metrics.counter('feed_stale_total', 'instruments found without ticks', ('exchange',))
+            metrics.gauge('feed_stale_instruments', 'instruments currently without ticks').set_function(
+                lambda: len(self.__stale))
+
+    def threshold(self, key):
+        return self.thresholds.get(key.split('|')[0], self.default)
+
+    async def start(self, keys=None):
+        '''
+        watches the given keys, or the subscriptions of the api, and starts the checks
+        '''
+        self.__api.add_feed_listener(self.on_tick)
+        self.watch(keys if keys is not None else list(self.__api.get_subscriptions()))
+        if self.__task is None:
+            self.__task = asyncio.create_task(self.__run())
+
+    async def stop(self):
+        self.__api.remove_feed_listener(self.on_tick)
+        if self.__task is not None:
+            self.__task.cancel()
+            self.__task = None
+        for task in list(self.__actions):
+            task.cancel()
+
+    def watch(self, keys, threshold=None):
+        '''
+        the deadline of new keys starts now, instruments that never tick are reported too
+        '''
+        now = self.clock()
+        for key in keys if type(keys) == list else [keys]:
+            entry = self.__entries.get(key)
+            if entry is None:
+                entry = self.__entries[key] = [now, None, None]
+            entry[1] = threshold if threshold is not None else self.threshold(key)
+            if entry[2] is None and key not in self.__stale:
+                self.__push(key, entry, entry[0] + entry[1])
+
+    def unwatch(self, keys):
+        for key in keys if type(keys) == list else [keys]:
+            # its heap entry is skipped when popped
+            self.__entries.pop(key, None)
+            self.__stale.pop(key, None)
+
+    def __push(self, key, entry, deadline):
+        entry[2] = sequence = next(self.__sequence)
+        wake = not self.__heap or deadline < self.__heap[0][0]
+        heapq.heappush(self.__heap, (deadline, sequence, key))
+        if wake:
+            self.__wake.set()
+
+    def on_tick(self, message):
+        key = f"{message['e']}|{message['tk']}"
+        entry = self.__entries.get(key)
+        if entry is None:
+            if not self.auto:
+                return
+            self.watch(key)
+            return
+
+        now = self.clock()
+        entry[0] = now
+        if entry[2] is None:
+            # first tick after being stale
+            since = self.__stale.pop(key, now)
+            self.__push(key, entry, now + entry[1])
+            self.__emit({'event': 'fresh', 'key': key, 'gap': now - since})
+
+    async def __run(self):
+        while True:
+            self.__wake.clear()
+            now = self.clock()
+            subscriptions = None
+            while self.__heap and self.__heap[0][0] <= now:
+                _, sequence, key = heapq.heappop(self.__heap)
+                entry = self.__entries.get(key)
+                if entry is None or entry[2] != sequence:
+                    continue
+
+                deadline = entry[0] + entry[1]
+                if deadline > now:
+                    heapq.heappush(self.__heap, (deadline, sequence, key))
+                    continue
+
+                # instruments unsubscribed elsewhere (an OptionChain recenter) are dropped, not reported
+                if subscriptions is None:
+                    subscriptions = self.__api.get_subscriptions()
+                if key not in subscriptions:
+                    self.unwatch(key)
+                    continue
+
+                entry[2] = None
+                self.__on_stale(key, now - entry[0])
+
+            timeout = self.__heap[0][0] - now if self.__heap else None
+            try:
+                await asyncio.wait_for(self.__wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def __on_stale(self, key, age):
+        self.__stale[key] = self.clock()
+        if self.__stale_total is not None:
+            self.__stale_total.labels(key.split('|')[0]).inc()
+        logger.warning(f'{key} without ticks for {age:.1f}s')
+        self.__emit({'event': 'stale', 'key': key, 'age': age})
+
+        if self.action is not None:
+            task = asyncio.ensure_future(self.__act(key))
+            self.__actions.add(task)
+            task.add_done_callback(self.__actions.discard)
+
+    async def __act(self, key):
+        exchange, token = key.split('|')
+        try:
+            if self.action == 'refresh':
+                ret = await self.__api.get_quotes(exchange, token)
+                if isinstance(ret, dict) and ret.get('stat') == 'Ok':
+                    self.__emit({'event': 'refreshed', 'key': key, 'quote': ret})
+                else:
+                    logger.error(f'get_quotes failed for {key}: {ret}')
+            else:
+                feed = self.__api.get_subscriptions().get(key)
+                if feed is None:
+                    # unsubscribed since it was found stale, subscribing it again would undo that
+                    self.unwatch(key)
+                    return
+                feed_type = FeedType.SNAPQUOTE if feed == 'd' else FeedType.TOUCHLINE
+                await self.__api.unsubscribe(key, feed_type)
+                await self.__api.subscribe(key, feed_type)
+        except Exception as e:
+            logger.error(f'{self.action} of {key} failed: {e!r}')
+
+    def __emit(self, event):
+        self.events += 1
+        if self.__callback is not None:
+            task = asyncio.ensure_future(self.__callback(event))
+            self.__actions.add(task)
+            task.add_done_callback(self.__actions.discard)
+
+    def stale(self):
+        '''
+        stale keys and the seconds since their last tick
+        '''
+        now = self.clock()
+        return {key: now - self.__entries[key][0] for key in self.__stale if key in self.__entries}
+
+    def age(self, key):
+        entry = self.__entries.get(key)
+        return self.clock() - entry[0] if entry is not None else None
+
+    def is_stale(self, key):
+        return key in self.__stale
+
+    def stats(self):
+        return {'watched': len(self.__entries), 'stale': len(self.__stale), 'heap': len(self.__heap),
+                'events': self.events}
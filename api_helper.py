@@ -1,8 +1,10 @@
 from NorenRestApiPy.NorenApi import  NorenApi
+from NorenRestApiPy.sync import make_sync
 from threading import Timer
 import pandas as pd
 import time
 import concurrent.futures
+import asyncio
 
 api = None
 class Order:
@@ -38,8 +40,8 @@ def get_time(time_string):
 
 
 class ShoonyaApiPy(NorenApi):
-    def __init__(self):
-        NorenApi.__init__(self, host='https://api.shoonya.com/NorenWClientTP/', websocket='wss://api.shoonya.com/NorenWSTP/')        
+    def __init__(self, **kwargs):
+        NorenApi.__init__(self, host='https://api.shoonya.com/NorenWClientTP/', websocket='wss://api.shoonya.com/NorenWSTP/', **kwargs)
         global api
         api = self
 
@@ -78,3 +80,15 @@ class ShoonyaApiPy(NorenApi):
              retention=order.retention,
              remarks=order.remarks,
          )
+
+
+class ShoonyaApiPySync(make_sync(ShoonyaApiPy, 'ShoonyaApiPySync')):
+    #blocking api for scripts, the async client runs on a background event loop
+    def placeOrder(self, order: Order):
+         return self.run(self.api.placeOrder(order))
+
+    def place_basket(self, orders):
+         async def place_all():
+              return await asyncio.gather(*[self.api.placeOrder(order) for order in orders], return_exceptions=True)
+
+         return self.run(place_all())
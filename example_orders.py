@@ -1,4 +1,4 @@
-from api_helper import ShoonyaApiPy, get_time
+from api_helper import ShoonyaApiPySync, get_time
 import datetime
 import logging
 import time
@@ -42,7 +42,7 @@ def open_callback():
 
 
 #start of our program
-api = ShoonyaApiPy()
+api = ShoonyaApiPySync()
 
 #use following if yaml isnt used
 #user    = <uid>
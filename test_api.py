@@ -1,11 +1,11 @@
-from api_helper import ShoonyaApiPy
+from api_helper import ShoonyaApiPySync
 import logging
  
 #enable dbug to see request and responses
 logging.basicConfig(level=logging.DEBUG)
 
 #start of our program
-api = ShoonyaApiPy()
+api = ShoonyaApiPySync()
 
 #credentials
 user    = <uid>
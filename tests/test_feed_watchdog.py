@@ -0,0 +1,42 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_helper import ShoonyaApiPy
+from NorenRestApiPy.watchdog import FeedWatchdog
+import asyncio
+import logging
+import yaml
+
+#supress debug messages for prod/tests
+logging.basicConfig(level=logging.INFO)
+
+
+def on_event(event):
+    print(event)
+
+
+async def main():
+    api = ShoonyaApiPy()
+
+    #credentials
+    with open('..\\cred.yml') as f:
+        cred = yaml.load(f, Loader=yaml.FullLoader)
+
+    ret = await api.login(userid = cred['user'], password = cred['pwd'], twoFA=cred['factor2'], vendor_code=cred['vc'], api_secret=cred['apikey'], imei=cred['imei'])
+
+    await api.start_websocket()
+    await asyncio.sleep(2)
+    #a liquid stock and an illiquid one
+    await api.subscribe(['NSE|22', 'NSE|11630', 'BSE|522032'])
+
+    #stale after 5s on NSE and 10s on BSE, the quote is fetched again when stale
+    watchdog = FeedWatchdog(api, thresholds={'NSE': 5, 'BSE': 10}, action='refresh', callback=on_event)
+    await watchdog.start()
+
+    for _ in range(12):
+        await asyncio.sleep(10)
+        print(watchdog.stats(), watchdog.stale())
+
+    await watchdog.stop()
+    await api.close()
+
+asyncio.run(main())
@@ -1,6 +1,6 @@
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from api_helper import ShoonyaApiPy
+from api_helper import ShoonyaApiPySync
 import logging
 
 #supress debug messages for prod/tests
@@ -9,7 +9,7 @@ logging.basicConfig(level=logging.DEBUG)
 
 
 #start of our program
-api = ShoonyaApiPy()
+api = ShoonyaApiPySync()
 
 #use following if yaml isnt used
 user    = <uid>
@@ -0,0 +1,42 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_helper import ShoonyaApiPy
+from NorenRestApiPy.historical import HistoricalData
+import asyncio
+import logging
+import yaml
+import datetime
+import timeit
+
+#supress debug messages for prod/tests
+logging.basicConfig(level=logging.INFO)
+
+
+async def main():
+    #start of our program
+    api = ShoonyaApiPy()
+
+    #yaml for parameters
+    with open('..\\cred.yml') as f:
+        cred = yaml.load(f, Loader=yaml.FullLoader)
+        print(cred)
+
+    ret = await api.login(userid = cred['user'], password = cred['pwd'], twoFA=cred['factor2'], vendor_code=cred['vc'], api_secret=cred['apikey'], imei=cred['imei'])
+
+    if ret != None:
+        history = HistoricalData(api, cache_dir='candles')
+
+        endtime   = datetime.datetime.today().replace(hour=0, minute=0, second=0, microsecond=0)
+        starttime = endtime - datetime.timedelta(days = 30)
+        tokens    = ['NSE|26000', 'NSE|26009', 'NSE|22', 'NSE|2885']
+
+        #first run fetches every token x day, second run is served from the cache
+        for run in range(2):
+            timer = timeit.default_timer()
+            ret = await history.download(tokens, starttime=starttime.timestamp(), endtime=endtime.timestamp(), interval=1)
+            print(f"run {run} took :", timeit.default_timer() - timer)
+
+            for key, columns in ret.items():
+                print(f"{key} {len(columns['time'])} candles")
+
+asyncio.run(main())
@@ -0,0 +1,40 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from NorenRestApiPy import greeks
+import numpy as np
+import timeit
+
+#benchmark the iv solver on a 500 option surface, no login required
+rng = np.random.default_rng(7)
+
+spot    = 18000.0
+strikes = np.tile(np.arange(15000, 21000, 60), 5)[:500]
+years   = np.repeat([2, 7, 30, 90, 180], 100)[:500] / 365
+is_call = rng.random(500) > 0.5
+vols    = 0.12 + 0.3 * rng.random(500)
+rate    = 0.07
+
+prices = greeks.option_price(spot, strikes, years, rate, vols, is_call)
+
+iv = greeks.implied_volatility(prices, spot, strikes, years, rate, is_call)
+solved = np.isfinite(iv)
+error = np.abs(iv[solved] - vols[solved]).max()
+print(f"solved {solved.sum()} of {len(iv)}, max error {error:.2e}")
+assert error < 1e-6, error
+
+#only the options whose time value (the OTM price) is below one tick are left unsolved
+otm = np.minimum(greeks.option_price(spot, strikes, years, rate, vols, True),
+                 greeks.option_price(spot, strikes, years, rate, vols, False))
+assert np.array_equal(solved, otm >= 0.05), np.flatnonzero(solved != (otm >= 0.05))
+
+count = 20
+print("cold start :", timeit.timeit(lambda: greeks.implied_volatility(prices, spot, strikes, years, rate, is_call), number=count) / count)
+
+#next tick, warm started from the previous iv
+moved = greeks.option_price(spot * 1.001, strikes, years, rate, vols, is_call)
+print("warm start :", timeit.timeit(lambda: greeks.implied_volatility(moved, spot * 1.001, strikes, years, rate, is_call, initial=iv), number=count) / count)
+
+#edge cases: below intrinsic, above the upper bound, expired, deep otm near expiry
+edges = greeks.implied_volatility([50, 20000, 10, 1e-17], spot, [17900, 17000, 18000, 16000], [0.1, 0.1, 0, 1 / 365], rate, [True, True, True, False])
+print(edges)
+assert np.isnan(edges).all()
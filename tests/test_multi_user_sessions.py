@@ -1,6 +1,6 @@
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from api_helper import ShoonyaApiPy
+from api_helper import ShoonyaApiPySync
 import time
 import yaml
 import logging
@@ -14,8 +14,8 @@ with open('cred1.yml') as f:
     print(creds_user2)
 
 #Create two instances to handle multiple accounts.
-user1 = ShoonyaApiPy()
-user2 = ShoonyaApiPy()
+user1 = ShoonyaApiPySync()
+user2 = ShoonyaApiPySync()
 
 #Login multiple accounts.
 ret = user1.login(userid = creds_user1['user'], password = creds_user1['pwd'], 
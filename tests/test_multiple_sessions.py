@@ -1,6 +1,6 @@
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from api_helper import ShoonyaApiPy
+from api_helper import ShoonyaApiPySync
 import logging
 import yaml
 
@@ -8,8 +8,8 @@ import yaml
 logging.basicConfig(level=logging.DEBUG)
 
 #start of our program
-api = ShoonyaApiPy()
-api2 = ShoonyaApiPy()
+api = ShoonyaApiPySync()
+api2 = ShoonyaApiPySync()
 
 #credentials
 with open('..\\cred.yml') as f:
@@ -0,0 +1,58 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_helper import ShoonyaApiPy
+from NorenRestApiPy import greeks
+import asyncio
+import logging
+import yaml
+import numpy as np
+import timeit
+
+logging.basicConfig(level=logging.INFO)
+
+#relative tolerance between GetOptionGreek and the local engine
+TOLERANCE = 0.01
+FIELDS = ['cal_price', 'put_price', 'cal_delta', 'put_delta', 'cal_gamma', 'put_gamma',
+          'cal_theta', 'put_theta', 'cal_rho', 'put_rho', 'cal_vego', 'put_vego']
+
+async def main():
+    api = ShoonyaApiPy()
+
+    with open('..\\cred.yml') as f:
+        cred = yaml.load(f, Loader=yaml.FullLoader)
+        print(cred)
+
+    ret = await api.login(userid = cred['user'], password = cred['pwd'], twoFA=cred['factor2'], vendor_code=cred['vc'], api_secret=cred['apikey'], imei=cred['imei'])
+    if ret == None:
+        return
+
+    expiry  = '24-NOV-2022'
+    spot    = 18000
+    strikes = np.arange(17000, 19050, 50)
+
+    #the whole chain in one call
+    local = greeks.option_greek(expiry, strikes, spot, InterestRate=7, Volatility=15)
+    count = 100
+    print("local chain :", timeit.timeit(lambda: greeks.option_greek(expiry, strikes, spot, 7, 15), number=count) / count)
+
+    worst = 0
+    for i, strike in enumerate(strikes[::10]):
+        remote = await api.option_greek(expiredate=expiry, StrikePrice=str(strike), SpotPrice=str(spot), InterestRate='7', Volatility='15', OptionType='CE')
+        print(remote)
+        for field in FIELDS:
+            if field not in remote:
+                continue
+            expected = float(remote[field])
+            actual = float(local[field][i * 10])
+            error = abs(actual - expected) / max(abs(expected), 1e-6)
+            worst = max(worst, error)
+            print(f"{strike} {field} remote {expected} local {actual:.6f} error {error:.4%}")
+
+    print(f"worst relative error {worst:.4%}", "OK" if worst <= TOLERANCE else "FAILED")
+
+    #put call parity of the local engine
+    years = greeks.time_to_expiry(expiry)
+    parity = local['cal_price'] - local['put_price'] - (spot - strikes * np.exp(-0.07 * years))
+    print("put call parity error :", np.abs(parity).max())
+
+asyncio.run(main())
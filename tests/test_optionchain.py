@@ -1,6 +1,6 @@
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from api_helper import ShoonyaApiPy
+from api_helper import ShoonyaApiPySync
 import logging
 import yaml
 import datetime
@@ -13,7 +13,7 @@ logging.basicConfig(level=logging.INFO)
 
 
 #start of our program
-api = ShoonyaApiPy()
+api = ShoonyaApiPySync()
 
 def getLastQuote(scrip):
     print(f"{scrip['exch']} {scrip['token']}")
@@ -0,0 +1,45 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_helper import ShoonyaApiPy
+from NorenRestApiPy.fanout import OrderFanOut, create_session
+import asyncio
+import logging
+import yaml
+
+#supress debug messages for prod/tests
+logging.basicConfig(level=logging.INFO)
+
+
+async def main():
+    #one connection pool for every account
+    session = create_session()
+
+    accounts = {}
+    for path in ('cred.yml', 'cred1.yml'):
+        with open(path) as f:
+            cred = yaml.load(f, Loader=yaml.FullLoader)
+
+        api = ShoonyaApiPy(session=session)
+        ret = await api.login(userid = cred['user'], password = cred['pwd'], twoFA=cred['factor2'], vendor_code=cred['vc'], api_secret=cred['apikey'], imei=cred['imei'])
+        print(cred['user'], ret['stat'])
+        accounts[cred['user']] = api
+
+    #the second account gets twice the quantity
+    fanout = OrderFanOut(accounts, allocation={list(accounts)[1]: 2}, rate=5)
+    await fanout.warm_up()
+
+    result = await fanout.place_order(buy_or_sell='B', product_type='C',
+                                      exchange='NSE', tradingsymbol='CANBK-EQ',
+                                      quantity=1, discloseqty=0, price_type='LMT', price=80.00, retention='DAY',
+                                      remarks='fanout_test')
+    for account, entry in result.accounts.items():
+        print(account, entry['quantity'], entry['norenordno'], f"{entry['latency'] * 1000:.1f}ms")
+    print(f'first ack {result.first * 1000:.1f}ms, spread {result.spread * 1000:.1f}ms')
+
+    print(await fanout.cancel_order(result))
+
+    for api in accounts.values():
+        await api.close()
+    await session.close()
+
+asyncio.run(main())
@@ -0,0 +1,45 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_helper import ShoonyaApiPy
+from NorenRestApiPy.latency import OrderLatencyTracker
+import asyncio
+import logging
+import yaml
+
+#supress debug messages for prod/tests
+logging.basicConfig(level=logging.INFO)
+
+
+async def main():
+    api = ShoonyaApiPy()
+
+    #credentials
+    with open('..\\cred.yml') as f:
+        cred = yaml.load(f, Loader=yaml.FullLoader)
+
+    ret = await api.login(userid = cred['user'], password = cred['pwd'], twoFA=cred['factor2'], vendor_code=cred['vc'], api_secret=cred['apikey'], imei=cred['imei'])
+
+    #the om updates are needed to time the first update and the fill
+    tracker = OrderLatencyTracker(slow=0.5)
+    tracker.attach(api)
+    await api.start_websocket()
+    await asyncio.sleep(2)
+
+    for _ in range(5):
+        ret = await api.place_order(buy_or_sell='B', product_type='C',
+                                    exchange='NSE', tradingsymbol='CANBK-EQ',
+                                    quantity=1, discloseqty=0, price_type='MKT', price=0,
+                                    retention='DAY', remarks='latency_test')
+        print(ret)
+
+    await asyncio.sleep(5)
+
+    for key, stages in tracker.stats().items():
+        print(key)
+        for stage, stats in stages.items():
+            print(f"  {stage:13}: p50 {stats['p50'] * 1e3:.1f}ms p99 {stats['p99'] * 1e3:.1f}ms max {stats['max'] * 1e3:.1f}ms")
+
+    for timeline in tracker.dump_slow():
+        print(timeline)
+
+asyncio.run(main())
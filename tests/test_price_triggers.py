@@ -0,0 +1,87 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from NorenRestApiPy.simulator import ExchangeSimulator
+from NorenRestApiPy.triggers import TriggerEngine
+import asyncio
+import logging
+import random
+import timeit
+
+#alerts and a synthetic stop loss against replayed candles, no broker login required
+logging.basicConfig(level=logging.INFO)
+
+def make_candles(count, price=1000.0, seed=3):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        close = price + rng.uniform(-2, 2)
+        high = max(price, close) + rng.uniform(0, 1)
+        low = min(price, close) - rng.uniform(0, 1)
+        rows.append({'ssboe': str(1700000100 + 60 * i), 'into': f'{price:.2f}', 'inth': f'{high:.2f}',
+                     'intl': f'{low:.2f}', 'intc': f'{close:.2f}', 'intv': '400'})
+        price = close
+    #latest candle first like TPSeries
+    return rows[::-1]
+
+def on_alert(trigger, message):
+    print('fired', trigger, 'at', trigger.ltp)
+
+async def main():
+    sim = ExchangeSimulator(seed=7)
+    candles = make_candles(375)
+    sim.load_tpseries('NSE', '22', candles, tradingsymbol='ACC-EQ')
+    await sim.start()
+
+    api = sim.client()
+    await api.login(userid='SIM', password='pwd', twoFA='0', vendor_code='vc', api_secret='secret', imei='imei')
+
+    async def open_callback():
+        await api.subscribe('NSE|22')
+
+    await api.start_websocket(socket_open_callback=open_callback)
+    await asyncio.sleep(0.5)
+
+    engine = TriggerEngine(callback=on_alert)
+    engine.attach(api)
+
+    #first 10 minutes, buy, then protect the position with a stop the engine places as a market order
+    start = 1700000100 + 600
+    await sim.run(until=start)
+    await api.place_order(buy_or_sell='B', product_type='I', exchange='NSE', tradingsymbol='ACC-EQ',
+                          quantity=10, discloseqty=0, price_type='MKT', price=0)
+    rest = [row for row in candles if int(row['ssboe']) >= start]
+    low = min(float(row['intl']) for row in rest)
+    high = max(float(row['inth']) for row in rest)
+    stop = engine.below('NSE|22', low + 1, order=dict(buy_or_sell='S', product_type='I', exchange='NSE',
+                                                       tradingsymbol='ACC-EQ', quantity=10, discloseqty=0,
+                                                       price_type='MKT', price=0), tag='sl')
+    alert = engine.above('NSE|22', high - 1)
+    never = engine.above('NSE|22', high + 100)
+    print(engine.stats())
+
+    await sim.run()
+    await engine.join()
+    print(engine.stats())
+    print(stop.fired, stop.ltp, stop.result)
+
+    assert stop.fired and stop.ltp <= low + 1 and stop.result['stat'] == 'Ok', stop.result
+    assert alert.fired and alert.ltp >= high - 1
+    assert not never.fired and engine.triggers('NSE|22') == [never]
+    positions = await api.get_positions()
+    print(positions)
+    assert positions[0]['netqty'] == '0', positions
+
+    engine.detach(api)
+    await api.close()
+    await sim.stop()
+
+    #tick cost with 10000 triggers on one instrument, none crossed
+    engine = TriggerEngine()
+    for i in range(5000):
+        engine.above('NSE|22', 2000 + i)
+        engine.below('NSE|22', 500 - i / 10)
+    tick = {'t': 'tf', 'e': 'NSE', 'tk': '22', 'lp': '1000.05'}
+    count = 100000
+    print("tick :", timeit.timeit(lambda: engine.on_tick(tick), number=count) / count)
+
+asyncio.run(main())
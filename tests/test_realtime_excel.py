@@ -1,6 +1,6 @@
 import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from api_helper import ShoonyaApiPy
+from api_helper import ShoonyaApiPySync
 import signal
 import datetime
 import logging
@@ -86,7 +86,7 @@ if __name__=="__main__":
     signal.signal(signal.SIGTERM , signal_handler) 
 
     #start of our program
-    api = ShoonyaApiPy()
+    api = ShoonyaApiPySync()
 
     #yaml for parameters
     with open('..\\cred.yml') as f:
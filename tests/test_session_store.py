@@ -0,0 +1,30 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_helper import ShoonyaApiPy
+from NorenRestApiPy.session import SessionStore
+import asyncio
+import logging
+import yaml
+import time
+
+#supress debug messages for prod/tests
+logging.basicConfig(level=logging.INFO)
+
+
+async def main():
+    #yaml for parameters
+    with open('..\\cred.yml') as f:
+        cred = yaml.load(f, Loader=yaml.FullLoader)
+
+    store = SessionStore('session.json')
+
+    #the first run logs in, the next runs of the day restore the saved token
+    start = time.perf_counter()
+    api = ShoonyaApiPy()
+    ret = await store.login(api, userid = cred['user'], password = cred['pwd'], twoFA=lambda: cred['factor2'], vendor_code=cred['vc'], api_secret=cred['apikey'], imei=cred['imei'])
+    print(ret)
+    print(f"startup took {time.perf_counter() - start:.3f}s")
+
+    print(await api.get_limits())
+
+asyncio.run(main())
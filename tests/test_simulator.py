@@ -0,0 +1,65 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from NorenRestApiPy.simulator import ExchangeSimulator
+import asyncio
+import logging
+import random
+import time
+
+#paper trading against replayed candles, no broker login required
+logging.basicConfig(level=logging.INFO)
+
+def make_candles(count, price=1000.0, seed=1):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        close = price + rng.uniform(-2, 2)
+        high = max(price, close) + rng.uniform(0, 1)
+        low = min(price, close) - rng.uniform(0, 1)
+        rows.append({'ssboe': str(1700000100 + 60 * i), 'into': f'{price:.2f}', 'inth': f'{high:.2f}',
+                     'intl': f'{low:.2f}', 'intc': f'{close:.2f}', 'intv': '400'})
+        price = close
+    #latest candle first like TPSeries
+    return rows[::-1]
+
+async def main():
+    sim = ExchangeSimulator(seed=7)
+    sim.load_tpseries('NSE', '22', make_candles(375), tradingsymbol='ACC-EQ')
+    await sim.start()
+
+    api = sim.client()
+    await api.login(userid='SIM', password='pwd', twoFA='0', vendor_code='vc', api_secret='secret', imei='imei')
+
+    async def open_callback():
+        await api.subscribe('NSE|22')
+
+    def order_update(message):
+        print(message['norenordno'], message['reporttype'], message['status'], message.get('flqty', ''), message.get('flprc', ''))
+
+    await api.start_websocket(order_update_callback=order_update, socket_open_callback=open_callback)
+    await asyncio.sleep(0.5)
+
+    #first 10 minutes, then trade
+    await sim.run(until=1700000100 + 600)
+    buy = await api.place_order(buy_or_sell='B', product_type='I', exchange='NSE', tradingsymbol='ACC-EQ',
+                                quantity=10, discloseqty=0, price_type='LMT', price=995.0)
+    print(buy)
+    print(await api.place_order(buy_or_sell='S', product_type='I', exchange='NSE', tradingsymbol='ACC-EQ',
+                                quantity=5, discloseqty=0, price_type='MKT', price=0))
+
+    #rest of the day as fast as possible
+    start = time.perf_counter()
+    count = await sim.run()
+    print(f"replayed {count} trades in {time.perf_counter() - start:.2f}s")
+
+    print(await api.get_positions())
+
+    #the resting limit order fills at its own price, not at the trades crossing it
+    fills = [trade for trade in await api.get_trade_book() if trade['norenordno'] == buy['norenordno']]
+    assert sum(int(trade['flqty']) for trade in fills) == 10, fills
+    assert all(float(trade['flprc']) == 995.0 for trade in fills), fills
+
+    await api.close()
+    await sim.stop()
+
+asyncio.run(main())
@@ -0,0 +1,33 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from NorenRestApiPy.symbols import SymbolMaster
+import asyncio
+import logging
+import timeit
+
+logging.basicConfig(level=logging.INFO)
+
+#downloads the masters once a day, no login required
+async def main():
+    master = SymbolMaster('masters')
+    await master.update()
+
+    print(master.token('NSE', 'INFY-EQ'))
+    print(master.get('NSE', master.token('NSE', 'INFY-EQ')))
+
+    for scrip in master.search('NSE', 'INFY'):
+        print(scrip)
+
+    expiry = master.expiries('NFO', 'NIFTY', instrument='OPTIDX')[0]
+    print(f"nearest expiry {expiry}")
+
+    for scrip in master.filter('NFO', symbol='NIFTY', expiry=expiry, optt='CE', min_strike=17000, max_strike=17500):
+        print(scrip['tsym'], scrip['token'], scrip['ls'])
+
+    #lookups and filters are answered from memory
+    count = 10000
+    print("token lookup  :", timeit.timeit(lambda: master.token('NSE', 'INFY-EQ'), number=count) / count)
+    print("prefix search :", timeit.timeit(lambda: master.search('NFO', 'NIFTY'), number=count) / count)
+    print("filter        :", timeit.timeit(lambda: master.filter_rows('NFO', symbol='NIFTY', expiry=expiry, optt='CE'), number=count) / count)
+
+asyncio.run(main())
@@ -0,0 +1,61 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api_helper import ShoonyaApiPy, ShoonyaApiPySync
+import asyncio
+import logging
+import time
+import yaml
+
+#supress debug messages for prod/tests
+logging.basicConfig(level=logging.INFO)
+
+COUNT = 200
+
+with open('..\\cred.yml') as f:
+    cred = yaml.load(f, Loader=yaml.FullLoader)
+
+async def noop():
+    pass
+
+#direct async calls
+async def main():
+    api = ShoonyaApiPy()
+    await api.login(userid = cred['user'], password = cred['pwd'], twoFA=cred['factor2'], vendor_code=cred['vc'], api_secret=cred['apikey'], imei=cred['imei'])
+
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        await noop()
+    print(f"async dispatch      : {(time.perf_counter() - start) / COUNT * 1e6:.1f}us")
+
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        await api.get_quotes(exchange='NSE', token='22')
+    print(f"async get_quotes    : {(time.perf_counter() - start) / COUNT * 1e3:.2f}ms")
+    await api.close()
+
+asyncio.run(main())
+
+#the same calls through the sync facade, the loop and the connections stay alive between calls
+with ShoonyaApiPySync() as api:
+    api.login(userid = cred['user'], password = cred['pwd'], twoFA=cred['factor2'], vendor_code=cred['vc'], api_secret=cred['apikey'], imei=cred['imei'])
+
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        api.run(noop())
+    print(f"sync dispatch       : {(time.perf_counter() - start) / COUNT * 1e6:.1f}us")
+
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        api.get_quotes(exchange='NSE', token='22')
+    print(f"sync get_quotes     : {(time.perf_counter() - start) / COUNT * 1e3:.2f}ms")
+
+    #asyncio.run per call rebuilds the loop and the connection pool every time
+    start = time.perf_counter()
+    for _ in range(10):
+        async def once():
+            fresh = ShoonyaApiPy()
+            fresh.set_session(cred['user'], cred['pwd'], api.susertoken)
+            await fresh.get_quotes(exchange='NSE', token='22')
+            await fresh.close()
+        asyncio.run(once())
+    print(f"asyncio.run per call: {(time.perf_counter() - start) / 10 * 1e3:.2f}ms")
@@ -0,0 +1,44 @@
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from NorenRestApiPy.frames import tpseries_arrays, tpseries_frame
+import random
+import time
+import timeit
+
+#benchmark the conversion of a 100k row TPSeries response, no login required
+ROWS = 100000
+
+def make_response(rows):
+    response = []
+    start = time.mktime(time.strptime('01-06-2022 09:15:00', '%d-%m-%Y %H:%M:%S'))
+    price = 1500.0
+    for index in range(rows):
+        price += random.uniform(-1, 1)
+        response.append({'stat': 'Ok', 'time': time.strftime('%d-%m-%Y %H:%M:%S', time.localtime(start + 60 * (rows - index))),
+                         'into': f'{price:.2f}', 'inth': f'{price + 1:.2f}', 'intl': f'{price - 1:.2f}', 'intc': f'{price:.2f}',
+                         'intvwap': f'{price:.2f}', 'intv': str(random.randint(1, 1000)), 'intoi': '0',
+                         'v': str(index * 10), 'oi': '0'})
+    return response
+
+def get_time(time_string):
+    data = time.strptime(time_string,'%d-%m-%Y %H:%M:%S')
+
+    return time.mktime(data)
+
+def row_by_row(response):
+    result = []
+    for row in response:
+        result.append((get_time(row['time']), float(row['into']), float(row['inth']), float(row['intl']),
+                       float(row['intc']), float(row['intv'])))
+    result.sort()
+    return result
+
+response = make_response(ROWS)
+
+print("row by row  :", min(timeit.repeat(lambda: row_by_row(response), number=1, repeat=3)))
+print("arrays      :", min(timeit.repeat(lambda: tpseries_arrays(response), number=1, repeat=3)))
+print("frame       :", min(timeit.repeat(lambda: tpseries_frame(response), number=1, repeat=3)))
+
+df = tpseries_frame(response)
+print(df.head())
+print(df.dtypes)